@@ -0,0 +1,187 @@
+"""
+Context compaction for the ReAct message history
+
+Every agent step re-sends the whole history, so the system prompt, the user
+table and every JSON tool result are paid for again on each step. The full
+history is kept for the trace; only the copy sent to the model is compacted:
+
+  1. system prompt, user message (question + table) and assistant turns are sent as is
+  2. tool results older than the last CONTEXT_KEEP_RECENT_STEPS steps are
+     replaced by compact summaries (ids, statuses, truncated reflections)
+  3. if the request is still above CONTEXT_TOKEN_BUDGET, recent tool results
+     are summarized too, then summaries are shrunk further and old assistant
+     text is truncated
+
+Tool messages are never dropped, so every tool_call keeps its answer.
+ContextCompactor.report() gives per-step token counts and the tokens saved per run.
+"""
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_COMPACTION_ENABLED = os.getenv("CONTEXT_COMPACTION_ENABLED", "1") != "0"
+# Prompt token budget per agent step
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "12000"))
+# Number of most recent steps whose tool results are always sent in full (unless over budget)
+CONTEXT_KEEP_RECENT_STEPS = int(os.getenv("CONTEXT_KEEP_RECENT_STEPS", "1"))
+
+# Keys that only guide the model on the step the result arrives
+_VERBOSE_KEYS = {"instruction", "message", "error_details", "skeleton_used", "question_searched", "true_answer"}
+
+# (text limit, list limit) of the two summary levels
+_SUMMARY_LEVELS = [(160, 5), (60, 2)]
+_ASSISTANT_TEXT_LIMIT = 200
+
+_encoder = None
+_encoder_loaded = False
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Token count with tiktoken; a byte-length estimate when the encoding is unavailable."""
+    global _encoder, _encoder_loaded
+    if not text:
+        return 0
+    if not _encoder_loaded:
+        try:
+            from utils.question_skeleton_extract import get_encoding
+            _encoder = get_encoding(model or os.getenv("LLM_MODEL", "gpt-3.5-turbo"))
+        except Exception as e:
+            logger.warning(f"tiktoken encoding unavailable, estimating token counts: {e}")
+            _encoder = None
+        _encoder_loaded = True
+    if _encoder is not None:
+        return len(_encoder.encode(text, disallowed_special=()))
+    return len(text.encode("utf-8")) // 4 + 1
+
+
+def _shrink(value: Any, text_limit: int, list_limit: int) -> Any:
+    if isinstance(value, dict):
+        return {
+            k: _shrink(v, text_limit, list_limit)
+            for k, v in value.items()
+            if k not in _VERBOSE_KEYS and v not in ("", None, [], {})
+        }
+    if isinstance(value, list):
+        shrunk = [_shrink(v, text_limit, list_limit) for v in value[:list_limit]]
+        if len(value) > list_limit:
+            shrunk.append(f"... {len(value) - list_limit} more")
+        return shrunk
+    if isinstance(value, str) and len(value) > text_limit:
+        return value[:text_limit] + "..."
+    return value
+
+
+def summarize_tool_content(content: str, level: int = 0) -> str:
+    """Compact JSON summary of a serialized tool result."""
+    text_limit, list_limit = _SUMMARY_LEVELS[min(level, len(_SUMMARY_LEVELS) - 1)]
+    try:
+        result = json.loads(content)
+    except (TypeError, ValueError):
+        return content[:text_limit] + ("..." if len(content) > text_limit else "")
+    summary = _shrink(result, text_limit, list_limit)
+    if isinstance(summary, dict):
+        summary["compacted"] = True
+    return json.dumps(summary, ensure_ascii=False, default=str)
+
+
+class ContextCompactor:
+    """Builds the compacted request messages of each step of one agent run."""
+
+    def __init__(self, budget: int = CONTEXT_TOKEN_BUDGET, keep_recent_steps: int = CONTEXT_KEEP_RECENT_STEPS,
+                 model: Optional[str] = None, enabled: bool = CONTEXT_COMPACTION_ENABLED):
+        self.budget = budget
+        self.keep_recent_steps = keep_recent_steps
+        self.model = model
+        self.enabled = enabled
+        self.steps: List[Dict[str, Any]] = []
+        self._token_cache: Dict[str, int] = {}
+        self._summary_cache: Dict[tuple, str] = {}
+
+    def _tokens(self, text: Optional[str]) -> int:
+        if not text:
+            return 0
+        if text not in self._token_cache:
+            self._token_cache[text] = count_tokens(text, self.model)
+        return self._token_cache[text]
+
+    def message_tokens(self, message: Dict[str, Any]) -> int:
+        # ~4 tokens of role/format overhead per message
+        tokens = 4 + self._tokens(message.get("content"))
+        for tc in message.get("tool_calls") or []:
+            tokens += self._tokens(tc["function"]["name"]) + self._tokens(tc["function"]["arguments"])
+        return tokens
+
+    def _summary(self, content: str, level: int) -> str:
+        key = (content, level)
+        if key not in self._summary_cache:
+            summary = summarize_tool_content(content, level)
+            # Small results (think acknowledgements) are not worth replacing
+            self._summary_cache[key] = summary if len(summary) < len(content) else content
+        return self._summary_cache[key]
+
+    def _total(self, messages: List[Dict[str, Any]]) -> int:
+        return sum(self.message_tokens(m) for m in messages)
+
+    def compact(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Return the messages to send for this step; `messages` is left untouched."""
+        original_tokens = self._total(messages)
+        if not self.enabled:
+            self.steps.append({"original_tokens": original_tokens, "sent_tokens": original_tokens, "compacted": 0})
+            return messages
+
+        step_starts = [i for i, m in enumerate(messages) if m["role"] == "assistant" and m.get("tool_calls")]
+        if self.keep_recent_steps <= 0:
+            recent_from = len(messages)
+        elif len(step_starts) >= self.keep_recent_steps:
+            recent_from = step_starts[-self.keep_recent_steps]
+        else:
+            recent_from = 0
+        tool_ids = [i for i, m in enumerate(messages) if m["role"] == "tool"]
+        old_tools = [i for i in tool_ids if i < recent_from]
+        recent_tools = [i for i in tool_ids if i >= recent_from]
+
+        compacted = [dict(m) for m in messages]
+        for i in old_tools:
+            compacted[i]["content"] = self._summary(messages[i]["content"], 0)
+
+        total = self._total(compacted)
+        if total > self.budget:
+            for i in recent_tools:
+                compacted[i]["content"] = self._summary(messages[i]["content"], 0)
+            total = self._total(compacted)
+        if total > self.budget:
+            for i in tool_ids:
+                compacted[i]["content"] = self._summary(messages[i]["content"], 1)
+            total = self._total(compacted)
+        if total > self.budget:
+            # Older assistant text (not the user message holding the table) goes last
+            for i in step_starts[:-1]:
+                content = compacted[i].get("content")
+                if content and len(content) > _ASSISTANT_TEXT_LIMIT:
+                    compacted[i]["content"] = content[:_ASSISTANT_TEXT_LIMIT] + "..."
+            total = self._total(compacted)
+
+        changed = sum(1 for a, b in zip(messages, compacted) if a.get("content") != b.get("content"))
+        self.steps.append({
+            "original_tokens": original_tokens,
+            "sent_tokens": total,
+            "compacted": changed,
+            "over_budget": total > self.budget,
+        })
+        if total > self.budget:
+            logger.warning(f"[Context] Step prompt of {total} tokens exceeds the budget of {self.budget}")
+        return compacted
+
+    def report(self) -> Dict[str, Any]:
+        original = sum(s["original_tokens"] for s in self.steps)
+        sent = sum(s["sent_tokens"] for s in self.steps)
+        return {
+            "budget": self.budget,
+            "steps": self.steps,
+            "original_tokens": original,
+            "sent_tokens": sent,
+            "tokens_saved": original - sent,
+        }
@@ -0,0 +1,238 @@
+"""
+Local intent classifier in front of RouterAgent's LLM call
+
+Most chat inputs are unambiguous: "画一个饼图" only needs the Visualization
+Agent, "平均分是多少？" only the Data Agent. IntentClassifier decides such
+inputs locally, in two tiers:
+
+  1. keyword / regex rules (Chinese and English) for single-intent inputs
+  2. optionally, a scikit-learn classifier trained on the router's own logged
+     LLM decisions (`python -m agent.intent_classifier` trains it); besides the
+     text it sees whether cached data and history were present, since the
+     LLM's labels depend on them ("画图" needs no new query only when data is
+     already available)
+
+A plan is returned only at confidence >= INTENT_MIN_CONFIDENCE. Everything
+else goes to the LLM: inputs with several intents or a negation, long inputs,
+and data questions that refer back to the conversation ("它", "that one") when
+there is history, since only the LLM can rewrite those into a self-contained
+core_question.
+"""
+import os
+import re
+import sys
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# 置信度不低于该值时直接采用本地路由结果，否则交给 LLM
+INTENT_MIN_CONFIDENCE = float(os.getenv("INTENT_MIN_CONFIDENCE", "0.85"))
+# 超过该长度的输入往往包含多步指令，直接交给 LLM
+INTENT_MAX_CHARS = int(os.getenv("INTENT_MAX_CHARS", "120"))
+# 由历史 LLM 路由决策训练的 scikit-learn 模型（joblib）；文件不存在时只使用规则
+INTENT_MODEL_PATH = os.getenv(
+    "INTENT_MODEL_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_model.joblib")
+)
+# 训练模型所需的最少样本数
+INTENT_MIN_TRAIN_SAMPLES = int(os.getenv("INTENT_MIN_TRAIN_SAMPLES", "50"))
+
+_VIZ = re.compile(
+    r"画|绘制|绘图|作图|图表|可视化|饼图|柱状图|柱形图|条形图|折线图|散点图|直方图|雷达图|热力图|面积图"
+    r"|\bchart|\bplot|\bgraph|visuali[sz]|\bpie\b|histogram|scatter|heatmap",
+    re.IGNORECASE,
+)
+_REPORT = re.compile(r"报告|文档|\breport|\bdocx?\b|\bword\b", re.IGNORECASE)
+_DATA = re.compile(
+    r"多少|几个|几位|几项|几人|哪|谁|什么|是否|平均|总和|总计|合计|求和|最大|最小|最高|最低|最多|最少"
+    r"|排名|排序|前\s*\d+|第\s*\d+|筛选|过滤|统计|计算|比较|相差|差值|占比|比例|百分比|数量"
+    r"|how\s+many|how\s+much|\bwhich\b|\bwhat\b|\bwho\b|\bwhen\b|\bwhere\b|average|\bmean\b|\bsum\b|\btotal"
+    r"|\bmax|\bmin\b|\bminimum|highest|lowest|\bmost\b|\bleast\b|\btop\s*\d+|\brank|\bsort|\bfilter|\bcount"
+    r"|compare|difference|percent|ratio",
+    re.IGNORECASE,
+)
+_NEGATION = re.compile(r"不要|不用|不需要|无需|别|\bdon'?t\b|\bdo\s+not\b|\bwithout\b|\bno\s+need\b", re.IGNORECASE)
+_BACK_REFERENCE = re.compile(
+    r"它|它们|这个|那个|这些|那些|上面|上述|刚才|之前|前面|继续|换成|改成"
+    r"|\bit\b|\bthat\b|\bthose\b|\bthese\b|\bthem\b|\bprevious|\babove\b|\bagain\b|\binstead\b|\bsame\b",
+    re.IGNORECASE,
+)
+
+_LABELS = ("needs_data_query", "needs_visualization", "needs_report")
+
+
+def _label(plan: Dict[str, Any]) -> str:
+    return ",".join("1" if plan.get(name) else "0" for name in _LABELS)
+
+
+def _plan(user_input: str, flags: Tuple[bool, bool, bool], source: str, confidence: float) -> Dict[str, Any]:
+    data, viz, report = flags
+    return {
+        "needs_data_query": data,
+        "needs_visualization": viz,
+        "needs_report": report,
+        "core_question": user_input,
+        "visualization_instruction": user_input if viz else "",
+        "router_source": source,
+        "router_confidence": round(confidence, 3),
+    }
+
+
+class IntentClassifier:
+    """Rules plus an optional learned model; returns a plan only when confident."""
+
+    def __init__(self, model_path: Optional[str] = INTENT_MODEL_PATH, min_confidence: float = INTENT_MIN_CONFIDENCE):
+        self.model_path = model_path
+        self.min_confidence = min_confidence
+        self._model = None
+        self._model_loaded = False
+        self._lock = threading.Lock()
+
+    def classify(self, user_input: str, has_cached_data: bool = False,
+                 history: Optional[List[Dict[str, Any]]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Decide the routing plan locally.
+
+        Args:
+            user_input: The raw user message.
+            has_cached_data: Whether an earlier result is available (same meaning as for the LLM router).
+            history: Conversation history; back-references in data questions need it resolved by the LLM.
+
+        Returns:
+            A plan in RouterAgent's format (plus router_source / router_confidence), or None
+            when the LLM should decide.
+        """
+        text = (user_input or "").strip()
+        if not text or len(text) > INTENT_MAX_CHARS or _NEGATION.search(text):
+            return None
+        refers_back = bool(history or has_cached_data) and _BACK_REFERENCE.search(text) is not None
+
+        decided = self._rules(text) or self._predict(text, has_cached_data, bool(history))
+        if decided is None:
+            return None
+        flags, source, confidence = decided
+        if confidence < self.min_confidence:
+            return None
+        if flags[0] and refers_back:
+            # "它的平均值是多少" needs the history folded into core_question
+            return None
+        return _plan(text, flags, source, confidence)
+
+    def _rules(self, text: str) -> Optional[Tuple[Tuple[bool, bool, bool], str, float]]:
+        viz = _VIZ.search(text) is not None
+        report = _REPORT.search(text) is not None
+        data = _DATA.search(text) is not None
+        if viz + report + data != 1:
+            # No cue, or several intents that the LLM should split into core_question / instructions
+            return None
+        if viz:
+            return (False, True, False), "rules", 0.95
+        if report:
+            return (False, False, True), "rules", 0.9
+        return (True, False, False), "rules", 0.9
+
+    # ── Learned tier ─────────────────────────────────────────────────────────
+    def _get_model(self):
+        with self._lock:
+            if not self._model_loaded:
+                self._model_loaded = True
+                if self.model_path and os.path.exists(self.model_path):
+                    try:
+                        import joblib
+                        self._model = joblib.load(self.model_path)
+                        logger.info(f"Intent model loaded from {self.model_path}")
+                    except Exception as e:
+                        logger.warning(f"Intent model could not be loaded, using rules only: {e}")
+            return self._model
+
+    def _predict(self, text: str, has_cached_data: bool,
+                 has_history: bool) -> Optional[Tuple[Tuple[bool, bool, bool], str, float]]:
+        model = self._get_model()
+        if model is None:
+            return None
+        try:
+            probabilities = model.predict_proba(_features([(text, has_cached_data, has_history)]))[0]
+        except Exception as e:
+            logger.warning(f"Intent model prediction failed: {e}")
+            return None
+        best = int(probabilities.argmax())
+        flags = tuple(flag == "1" for flag in str(model.classes_[best]).split(","))
+        return flags, "model", float(probabilities[best])
+
+    def set_model(self, model):
+        with self._lock:
+            self._model, self._model_loaded = model, True
+
+
+_FEATURE_COLUMNS = ["user_input", "has_cached_data", "has_history"]
+
+
+def _features(rows: List[Tuple[str, bool, bool]]):
+    import pandas as pd
+    return pd.DataFrame(
+        [(text, int(bool(cached)), int(bool(history))) for text, cached, history in rows], columns=_FEATURE_COLUMNS
+    )
+
+
+def train_intent_model(decisions: List[Dict[str, Any]]):
+    """
+    Fit a char n-gram TF-IDF + context flags logistic regression classifier on logged router decisions.
+
+    Args:
+        decisions: Records with "user_input", "has_cached_data", "has_history" and a "plan"
+            holding the three routing booleans.
+
+    Returns:
+        The fitted scikit-learn pipeline (predict_proba over "data,viz,report" label strings).
+
+    Raises:
+        ValueError: Fewer than INTENT_MIN_TRAIN_SAMPLES usable records, or a single label only.
+    """
+    from sklearn.compose import ColumnTransformer
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+
+    rows, labels = [], []
+    for record in decisions:
+        text, plan = (record.get("user_input") or "").strip(), record.get("plan") or {}
+        if text and all(isinstance(plan.get(name), bool) for name in _LABELS):
+            rows.append((text, record.get("has_cached_data", False), record.get("has_history", False)))
+            labels.append(_label(plan))
+    if len(rows) < INTENT_MIN_TRAIN_SAMPLES:
+        raise ValueError(f"Need at least {INTENT_MIN_TRAIN_SAMPLES} router decisions, got {len(rows)}")
+    if len(set(labels)) < 2:
+        raise ValueError("All logged router decisions have the same label")
+
+    model = make_pipeline(
+        ColumnTransformer([
+            ("text", TfidfVectorizer(analyzer="char_wb", ngram_range=(1, 3), sublinear_tf=True), "user_input"),
+            ("context", "passthrough", ["has_cached_data", "has_history"]),
+        ]),
+        LogisticRegression(max_iter=1000, class_weight="balanced"),
+    )
+    model.fit(_features(rows), labels)
+    return model
+
+
+intent_classifier = IntentClassifier()
+
+
+if __name__ == "__main__":
+    # Train from the RouterDecisions collection and save to INTENT_MODEL_PATH
+    import joblib
+    from db.db_manager import DatabaseManager
+
+    logging.basicConfig(level=logging.INFO)
+    records = DatabaseManager().get_router_decisions()
+    try:
+        fitted = train_intent_model(records)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    joblib.dump(fitted, INTENT_MODEL_PATH)
+    print(f"✅ Intent model trained on {len(records)} decisions, saved to {INTENT_MODEL_PATH}")
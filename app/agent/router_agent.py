@@ -1,17 +1,21 @@
 import os
 import json
+import asyncio
 import logging
 from typing import Dict, Any, Optional, List
-from openai import AsyncOpenAI
+from openai_api.openai_client import llm_gateway
+from agent.intent_classifier import intent_classifier
 from dotenv import load_dotenv
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENAI_API_BASE = os.getenv("OPENAI_API_BASE")
 # allow configuration of a smaller/faster model for routing (defaulting to the same main model if not set)
 ROUTER_LLM_MODEL = os.getenv("ROUTER_LLM_MODEL", os.getenv("LLM_MODEL", "deepseek-chat"))
+# 先用本地规则/模型判断意图，只有不确定时才调用 LLM
+ROUTER_LOCAL_CLASSIFIER = os.getenv("ROUTER_LOCAL_CLASSIFIER", "1") == "1"
+# 记录 LLM 路由决策，作为本地意图模型的训练数据（python -m agent.intent_classifier）
+ROUTER_LOG_DECISIONS = os.getenv("ROUTER_LOG_DECISIONS", "1") == "1"
 
 class RouterAgent:
     """
@@ -21,11 +25,8 @@ class RouterAgent:
     the Data Agent, Visualization Agent, or Report Agent.
     """
     def __init__(self):
-        self._client = AsyncOpenAI(
-            api_key=OPENAI_API_KEY,
-            base_url=OPENAI_API_BASE or None,
-        )
         self.model = ROUTER_LLM_MODEL
+        self.classifier = intent_classifier if ROUTER_LOCAL_CLASSIFIER else None
 
     async def analyze_intent(
         self, 
@@ -37,7 +38,17 @@ class RouterAgent:
         """
         Analyze user input to determine the execution plan.
         Supports multi-turn context via history.
+
+        Unambiguous inputs are decided by the local IntentClassifier without an LLM call;
+        the plan's "router_source" tells which path decided ("rules", "model" or "llm").
         """
+        if self.classifier is not None:
+            plan = self.classifier.classify(user_input, has_cached_data, history)
+            if plan is not None:
+                logger.info(f"RouterAgent decided locally ({plan['router_source']}, "
+                            f"confidence {plan['router_confidence']}): {user_input[:50]}")
+                return plan
+
         system_prompt = f"""You are the Router Agent for TableSage, an intelligent data analysis system.
 Your job is to analyze the user's input and determine which specialized backend agents need to be invoked.
 The available agents are:
@@ -70,7 +81,7 @@ Crucial Context:
         user_message = f"User Input: {user_input}"
 
         try:
-            response = await self._client.chat.completions.create(
+            response = await llm_gateway.achat_completion(
                 model=self.model,
                 messages=[
                     {"role": "system", "content": system_prompt},
@@ -88,7 +99,11 @@ Crucial Context:
             if result_str.endswith("```"):
                 result_str = result_str[:-3]
                 
-            return json.loads(result_str.strip())
+            plan = json.loads(result_str.strip())
+            if ROUTER_LOG_DECISIONS:
+                self._log_decision(user_input, plan, has_cached_data, bool(history))
+            plan["router_source"] = "llm"
+            return plan
         except Exception as e:
             logger.error(f"RouterAgent JSON parsing failed: {e}")
             # Fallback safe plan
@@ -99,3 +114,16 @@ Crucial Context:
                 "core_question": user_input, # Just pass the whole query to the agent
                 "visualization_instruction": ""
             }
+
+    def _log_decision(self, user_input: str, plan: Dict[str, Any], has_cached_data: bool, has_history: bool):
+        """Persist the LLM decision in the background; the response never waits on MongoDB."""
+        labels = {name: plan.get(name) for name in ("needs_data_query", "needs_visualization", "needs_report")}
+
+        def write():
+            try:
+                from db.db_manager import DatabaseManager
+                DatabaseManager().log_router_decision(user_input, labels, has_cached_data, has_history, self.model)
+            except Exception as e:
+                logger.warning(f"RouterAgent decision log failed: {e}")
+
+        asyncio.get_running_loop().run_in_executor(None, write)
@@ -11,36 +11,75 @@ Actual business flow:
                   → Success: flag=1 + rethink_summary saved
                   → All fail: flag=2 + error_summary saved
   3. generate_final_answer → answer user's actual question using gathered context
+     (AGENT_TOOL_PROTOCOL=structured: a single submit_answer call carries reasoning,
+      confidence and the answer, so no think / extra <Answer> turn is needed)
 
 The Agent's intelligence is in step 2: deciding:
   - How many similar questions to practice (confidence threshold)
   - Which strategy to try when wrong
   - Whether additional few-shot practice is worthwhile
 """
+import asyncio
+import functools
+import hashlib
 import json
 import logging
 import re
-from typing import Any, Dict, Generator, List, Optional
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Any, AsyncGenerator, Awaitable, Dict, Generator, List, NamedTuple, Optional
 
-from openai import OpenAI
+from openai import APITimeoutError
+from openai_api.openai_client import get_async_openai_client, llm_gateway
+from openai_api.model_router import model_router
 from dotenv import load_dotenv
 import os
 
 from utils.utils import TableUtils
+from utils.deadline import DeadlineExceeded, deadline_after, deadline_scope
+from utils.cancellation import CancelToken, RunCancelled, cancel_scope
 from core_progress.search_similar_question import find_topn_question
 from backend_api.config_api import config_params
 from db.db_manager import DatabaseManager
-from agent.tools import ALL_TOOLS, TOOL_EXECUTORS
+from agent.tools import ALL_TOOLS, STRUCTURED_TOOLS, TOOL_EXECUTORS, CONCURRENT_SAFE_TOOLS, MEMOIZED_TOOLS
+from agent.context_compaction import ContextCompactor, count_tokens
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_API_BASE = os.getenv("OPENAI_API_BASE")
-LLM_MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
 
 AVAILABLE_STRATEGIES = ["cot", "column_sorting", "schema_linking"]
 
+# 同一步内并发执行的工具调用数量上限
+AGENT_TOOL_WORKERS = int(os.getenv("AGENT_TOOL_WORKERS", "4"))
+# run_stream 使用流式补全并逐 token 推送 answer_chunk 事件（设为 0 则整步返回）
+AGENT_STREAM_COMPLETIONS = os.getenv("AGENT_STREAM_COMPLETIONS", "1") != "0"
+# 流式补全时请求末尾的 usage 块（stream_options.include_usage）；不支持该参数的兼容服务可设为 0，改用 tiktoken 估算
+AGENT_STREAM_USAGE = os.getenv("AGENT_STREAM_USAGE", "1") != "0"
+# 在构建首条消息的同时预先执行 search_knowledge，并作为已完成的工具调用注入（省去第一轮 LLM 决策）
+AGENT_PREFETCH_RETRIEVAL = os.getenv("AGENT_PREFETCH_RETRIEVAL", "1") != "0"
+# 快速路径：首次检索的近邻全部为 Mastered / Strategic Success 且相似度足够高时，跳过 ReAct 循环直接生成答案
+AGENT_FAST_PATH = os.getenv("AGENT_FAST_PATH", "1") != "0"
+AGENT_FAST_PATH_MIN_SIMILARITY = float(os.getenv("AGENT_FAST_PATH_MIN_SIMILARITY", "0.9"))
+AGENT_FAST_PATH_MIN_NEIGHBOURS = int(os.getenv("AGENT_FAST_PATH_MIN_NEIGHBOURS", "2"))
+_FAST_PATH_STATUSES = ("Mastered", "Strategic Success")
+# 工具协议：react = think → generate_final_answer → <Answer>；structured = 单次 submit_answer 同时给出推理、置信度与答案
+AGENT_TOOL_PROTOCOL = os.getenv("AGENT_TOOL_PROTOCOL", "react")
+# 单次 LLM 决策的超时（秒）
+AGENT_LLM_TIMEOUT = float(os.getenv("AGENT_LLM_TIMEOUT", "60"))
+# 单个请求的总时限（秒，0 表示不限）；LLM、工具与数据库查询都受其约束
+AGENT_DEADLINE_SECONDS = float(os.getenv("AGENT_DEADLINE_SECONDS", "120"))
+# 为强制作答预留的时间（秒）：剩余时间不足时停止推理循环，直接生成最终答案
+AGENT_DEADLINE_RESERVE_SECONDS = float(os.getenv("AGENT_DEADLINE_RESERVE_SECONDS", "15"))
+# A decision step needs at least this much time before step_deadline to be worth starting
+_MIN_STEP_SECONDS = 1.0
+# 工具调用与表格格式化等阻塞工作的专用线程池大小（进程内所有会话共享；LLM 决策在事件循环上异步等待，不占线程）
+AGENT_BLOCKING_WORKERS = int(os.getenv("AGENT_BLOCKING_WORKERS", "16"))
+_blocking_pool = ThreadPoolExecutor(max_workers=AGENT_BLOCKING_WORKERS, thread_name_prefix="agent-blocking")
+
 SYSTEM_PROMPT = """You are TableSage, a specialized agent for table Q&A.
 You are an autonomous problem solver. Your goal is to provide an accurate answer to the user's question based on the provided table.
 
@@ -61,6 +100,25 @@ You are an autonomous problem solver. Your goal is to provide an accurate answer
 DO NOT use conversational filler. Provide your reasoning ONLY when calling the `think` tool.
 """
 
+STRUCTURED_SYSTEM_PROMPT = """You are TableSage, a specialized agent for table Q&A.
+You are an autonomous problem solver. Your goal is to provide an accurate answer to the user's question based on the provided table.
+
+### YOUR TOOLBOX
+1. **search_knowledge**: Use this to find similar questions or logic patterns if the current question is complex.
+2. **practice_question**: Use this to attempt similar questions and build confidence. You can choose different reasoning strategies.
+3. **submit_answer**: Submit your reasoning, confidence and final answer in ONE call. This ends the task when accepted.
+
+### GUIDELINES
+- **Mandatory Pattern Verification**: You MUST call `search_knowledge` at the very beginning of your analysis for EVERY question, regardless of your initial confidence. This is to verify if any critical 'Lessons Learned' or 'Mastered' patterns exist in the knowledge base that could affect your logic.
+- **Valuable Lessons (Scan and Skip)**: When `search_knowledge` returns results, check their `history_status`. 
+    - If status is 'Mastered' or 'Lesson Learned', you **DO NOT** need to practice it. Use the `rethink_summary` immediately to boost your confidence and logic.
+    - Only use `practice_question` for 'New' questions or if you need to verify a specific strategy on a 'Lesson Learned' pattern.
+- **Reason, then Submit**: Put ALL calculations and logic in the `reasoning` field of `submit_answer`, together with your `confidence_score` and the `answer`. Cite the similar questions you relied on as `few_shot_ids` / `reflection_ids`. Answers with confidence below 0.8 are rejected with extra context to revise with.
+- **Format**: The `answer` must be wrapped in `<Answer>` tags (e.g., `<Answer>['value']</Answer>`).
+
+DO NOT use conversational filler. Provide your reasoning ONLY in the `submit_answer` tool.
+"""
+
 
 class TableSageAgent:
     """
@@ -72,15 +130,25 @@ class TableSageAgent:
         self,
         max_steps: int = 10,
         model: Optional[str] = None,
+        prefetch_retrieval: bool = AGENT_PREFETCH_RETRIEVAL,
+        fast_path: bool = AGENT_FAST_PATH,
+        tool_protocol: str = AGENT_TOOL_PROTOCOL,
+        deadline_seconds: Optional[float] = None,
     ):
         self.max_steps = max_steps
-        self.model = model or LLM_MODEL
-        self._client = OpenAI(
-            api_key=OPENAI_API_KEY,
-            base_url=OPENAI_API_BASE or None,
-        )
+        self.deadline_seconds = AGENT_DEADLINE_SECONDS if deadline_seconds is None else deadline_seconds
+        # An explicit model pins every call of the run; otherwise openai_api.model_router picks per route
+        self._model_override = model
+        self.model = model or model_router.route("agent").model
+        self.prefetch_retrieval = prefetch_retrieval
+        self.fast_path = fast_path
+        if tool_protocol not in ("react", "structured"):
+            logger.warning(f"[Agent] Unknown tool protocol '{tool_protocol}', falling back to 'react'")
+            tool_protocol = "react"
+        self.tool_protocol = tool_protocol
+        self.tools = STRUCTURED_TOOLS if tool_protocol == "structured" else ALL_TOOLS
 
-    # ── Public: synchronous ──────────────────────────────────────────────────
+    # ── Public: synchronous wrappers ─────────────────────────────────────────
     def run(
         self,
         question: str,
@@ -88,126 +156,234 @@ class TableSageAgent:
         is_training: bool = False,
         true_answer: Optional[str] = None,
         session_history: Optional[List[Dict[str, Any]]] = None,
-        reasoning_summary: Optional[str] = None
+        reasoning_summary: Optional[str] = None,
+        cancel_token: Optional[CancelToken] = None,
     ) -> Dict[str, Any]:
         """
         Run the full Agent pipeline and return a complete result dict.
+        Drives arun() on a private event loop, so it must not be called from a
+        running event loop (await arun() there instead).
+        Raises RunCancelled if `cancel_token` is cancelled before the run finishes.
         """
-        # Step 1: Initialize Messages (No RAG result needed anymore)
-        messages = self._build_initial_messages(
-            question, table, session_history, reasoning_summary
-        )
-        reasoning_trace: List[Dict[str, Any]] = []
-        tools_used: List[str] = []
-        final_answer_context: Dict[str, Any] = {}
-        last_confidence_score: Optional[float] = None
-        retrieved_ids: List[str] = [] # Track IDs seen in this session to avoid redundancy
-
-        for step in range(1, self.max_steps + 1):
-            logger.info(f"[Agent] Step {step}/{self.max_steps}")
-
-            response = self._client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                tools=ALL_TOOLS,
-                tool_choice="auto",
-                temperature=0.1,
-                timeout=60.0,
+        return _run_sync(self.arun(
+            question, table, is_training, true_answer, session_history, reasoning_summary, cancel_token,
+        ))
+
+    def run_stream(
+        self,
+        question: str,
+        table: Dict[str, Any],
+        is_training: bool = False,
+        true_answer: Optional[str] = None,
+        session_history: Optional[List[Dict[str, Any]]] = None,
+        reasoning_summary: Optional[str] = None,
+        cancel_token: Optional[CancelToken] = None,
+    ) -> Generator[Dict[str, Any], None, None]:
+        """Blocking iteration over arun_stream() (same events), for callers without an event loop."""
+        yield from _iterate_sync(self.arun_stream(
+            question, table, is_training, true_answer, session_history, reasoning_summary, cancel_token,
+        ))
+
+    # ── Public: async ────────────────────────────────────────────────────────
+    async def arun(
+        self,
+        question: str,
+        table: Dict[str, Any],
+        is_training: bool = False,
+        true_answer: Optional[str] = None,
+        session_history: Optional[List[Dict[str, Any]]] = None,
+        reasoning_summary: Optional[str] = None,
+        cancel_token: Optional[CancelToken] = None,
+        prefetch: Optional[tuple] = None,
+    ) -> Dict[str, Any]:
+        """
+        Run the full Agent pipeline on the current event loop and return the complete result dict.
+        Raises RunCancelled if `cancel_token` is cancelled before the run finishes.
+        `prefetch` is a search started earlier with start_retrieval().
+        """
+        async for event in self._run_loop(
+            question, table, is_training, true_answer, session_history, reasoning_summary, stream=False,
+            cancel_token=cancel_token, prefetch=prefetch,
+        ):
+            if event["step"] == "end":
+                return event["complete_result"]
+
+    async def arun_stream(
+        self,
+        question: str,
+        table: Dict[str, Any],
+        is_training: bool = False,
+        true_answer: Optional[str] = None,
+        session_history: Optional[List[Dict[str, Any]]] = None,
+        reasoning_summary: Optional[str] = None,
+        cancel_token: Optional[CancelToken] = None,
+        prefetch: Optional[tuple] = None,
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Stream Agent execution step-by-step.
+        Yields dicts with 'step' key: start → thinking → answer_chunk* → tool_call → tool_result → metrics → end/error
+        (answer_chunk carries model content deltas as they are generated, metrics the
+        token and latency accounting of each finished step)
+
+        LLM calls are awaited on the event loop; tools run on a bounded pool of their own.
+        Cancelling `cancel_token`, closing this generator or cancelling the task that
+        consumes it (e.g. when the SSE client disconnects) stops the run: between steps
+        and tools, and while a completion streams in. A cancelled token ends the stream
+        with a 'cancelled' event.
+
+        `prefetch` is a search started earlier with start_retrieval(); it replaces the
+        run's own first search when it was made for the same question and table.
+        """
+        yield {"step": "start", "message": "TableSage Agent 开始处理"}
+
+        try:
+            async for event in self._run_loop(
+                question, table, is_training, true_answer, session_history, reasoning_summary, stream=True,
+                cancel_token=cancel_token, prefetch=prefetch,
+            ):
+                yield event
+
+        except RunCancelled as e:
+            logger.info(f"[Agent] Run cancelled: {e}")
+            yield {"step": "cancelled", "message": f"Agent 已取消: {e}"}
+
+        except Exception as e:
+            import traceback
+            yield {"step": "error", "error": str(e), "error_details": traceback.format_exc()}
+
+    # ── Private: ReAct loop shared by all entry points ───────────────────────
+    async def _run_loop(
+        self,
+        question: str,
+        table: Dict[str, Any],
+        is_training: bool,
+        true_answer: Optional[str],
+        session_history: Optional[List[Dict[str, Any]]],
+        reasoning_summary: Optional[str],
+        stream: bool,
+        cancel_token: Optional[CancelToken] = None,
+        prefetch: Optional[tuple] = None,
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """Yield progress events, ending with the 'end' event that carries the complete result."""
+        # Steps and tools must finish before step_deadline; the reserve after it is kept for a forced answer
+        deadline = deadline_after(self.deadline_seconds)
+        step_deadline = deadline - AGENT_DEADLINE_RESERVE_SECONDS if deadline is not None else None
+
+        # The mandatory first search runs while the table prompt is being built
+        cancel_token = cancel_token or CancelToken()
+        if prefetch is not None and (prefetch[0]["user_question"] != question or prefetch[0]["user_table"] is not table):
+            # Started for another question (e.g. the router rewrote it); its result does not apply
+            logger.info("[Agent] Dropping a prefetched search made for a different question")
+            prefetch = None
+        if prefetch is None and self.prefetch_retrieval:
+            prefetch = self._start_prefetch(question, table, step_deadline, cancel_token)
+        try:
+            # Step 1: Initialize Messages (table formatting is CPU-bound, keep it off the event loop)
+            initial_messages = await asyncio.get_running_loop().run_in_executor(
+                _blocking_pool, functools.partial(
+                    self._build_initial_messages, question, table, session_history, reasoning_summary,
+                    prefetched=prefetch is not None,
+                ),
             )
+            state = AgentRunState(initial_messages, ContextCompactor(model=self.model))
+            state.deadline, state.step_deadline = deadline, step_deadline
+            state.cancel_token = cancel_token
+            messages = state.messages
+            reasoning_trace = state.reasoning_trace
 
-            msg = response.choices[0].message
-            finish_reason = response.choices[0].finish_reason
+            if prefetch is not None:
+                async for event in self._inject_prefetch(prefetch, state):
+                    yield event
 
-            logger.info(f"[Agent] Step {step} LLM content: {(msg.content or '')[:200]}")
-            logger.info(f"[Agent] Step {step} finish_reason={finish_reason}, tool_calls={len(msg.tool_calls or [])}")
+            for step in range(1, self.max_steps + 1):
+                cancel_token.raise_if_cancelled()
+                step_timeout = _time_left(state.step_deadline, AGENT_LLM_TIMEOUT)
+                if step_timeout < _MIN_STEP_SECONDS:
+                    async for event in self._force_final_answer(step, state, stream):
+                        yield event
+                    break
 
-            if finish_reason == "stop" or not msg.tool_calls:
-                final_text = msg.content or ""
-                reasoning_trace.append({
-                    "step": step, "type": "agent_done",
-                    "content": final_text,
-                })
-                break
+                neighbours = self._fast_path_neighbours(state) if self.fast_path else None
+                if neighbours:
+                    async for event in self._run_fast_path(step, neighbours, state, question, table, is_training, true_answer, stream):
+                        yield event
+                    break
 
-            # Append assistant message
-            messages.append({
-                "role": "assistant",
-                "content": msg.content,
-                "tool_calls": [
-                    {"id": tc.id, "type": "function",
-                     "function": {"name": tc.function.name, "arguments": tc.function.arguments}}
-                    for tc in msg.tool_calls
-                ],
-            })
-
-            for tc in msg.tool_calls:
-                tool_name = tc.function.name
+                logger.info(f"[Agent] Step {step}/{self.max_steps}")
+                yield {"step": "thinking", "message": f"Step {step}: Agent 正在决策..."}
+
+                metrics = {"step": step, "type": "metrics"}
                 try:
-                    args = json.loads(tc.function.arguments)
-                except json.JSONDecodeError:
-                    args = {}
+                    async for event in self._llm_step(
+                        state.compactor.compact(messages), step, metrics, stream and AGENT_STREAM_COMPLETIONS,
+                        deadline=state.step_deadline, cancel_token=cancel_token,
+                    ):
+                        if isinstance(event, _LLMReply):
+                            msg, finish_reason = event
+                        else:
+                            yield event
+                except (APITimeoutError, DeadlineExceeded) as e:
+                    if state.deadline is None:
+                        raise
+                    logger.warning(f"[Agent] Step {step} timed out within the request deadline: {e}")
+                    async for event in self._force_final_answer(step, state, stream):
+                        yield event
+                    break
 
-                logger.info(f"[Agent] Step {step} -> Tool: {tool_name}, args: {json.dumps(args, ensure_ascii=False, default=str)[:200]}")
+                logger.info(f"[Agent] Step {step} LLM content: {(msg.content or '')[:200]}")
+                logger.info(f"[Agent] Step {step} finish_reason={finish_reason}, tool_calls={len(msg.tool_calls or [])}")
 
-                # ReAct logic is now fully driven by the Agent's choices.
-                if tool_name == "generate_final_answer":
-                    # --- Confidence Guard ---
-                    # Check if 'think' was called and what the confidence was
-                    has_thought = any(t["type"] == "tool_call" and t["tool"] == "think" for t in reasoning_trace)
-                    low_confidence = last_confidence_score is not None and last_confidence_score < 0.8
-                    
-                    if not has_thought or low_confidence:
-                        tool_result = {
-                            "error": "Rethink required. You must call 'think' to assess your logic and ensure confidence >= 0.8 "
-                                     "before calling generate_final_answer. If your confidence is still low, perform a 'search_knowledge'."
-                        }
-                    else:
-                        args["user_question"] = question
-                        args["user_table"] = table
-                        args["is_training"] = is_training
-                        if is_training and true_answer:
-                            args["true_answer"] = true_answer
-                        tool_result = self._execute_tool(tool_name, args)
-                elif tool_name == "search_knowledge":
-                    # Auto-inject current question, table, and excluded IDs for fresh results
-                    args["user_question"] = question
-                    args["user_table"] = table
-                    args["exclude_ids"] = retrieved_ids
-                    tool_result = self._execute_tool(tool_name, args)
-                    
-                    # Track newly retrieved IDs
-                    if isinstance(tool_result, dict) and "results" in tool_result:
-                        for res in tool_result["results"]:
-                            if "table_id" in res:
-                                retrieved_ids.append(res["table_id"])
-                else:
-                    # Execute tool
-                    tool_result = self._execute_tool(tool_name, args)
-                tools_used.append(tool_name)
-
-                if tool_name == "generate_final_answer":
-                    final_answer_context = tool_result
-                elif tool_name == "think" and "confidence_score" in tool_result:
-                    last_confidence_score = tool_result["confidence_score"]
-
-                summary = _summarize(tool_result)
-                logger.info(f"[Agent] Step {step} <- Result: {summary}")
-                reasoning_trace.append({
-                    "step": step,
-                    "type": "tool_call",
-                    "tool": tool_name,
-                    "arguments": args,
-                    "result_summary": summary,
-                })
+                if finish_reason == "stop" or not msg.tool_calls:
+                    final_text = msg.content or ""
+                    reasoning_trace.append({
+                        "step": step, "type": "agent_done",
+                        "content": final_text,
+                    })
+                    yield self._finish_step_metrics(metrics, state)
+                    break
 
+                # Append assistant message
                 messages.append({
-                    "role": "tool",
-                    "tool_call_id": tc.id,
-                    "content": json.dumps(tool_result, ensure_ascii=False, default=str),
+                    "role": "assistant",
+                    "content": msg.content,
+                    "tool_calls": [
+                        {"id": tc.id, "type": "function",
+                         "function": {"name": tc.function.name, "arguments": tc.function.arguments}}
+                        for tc in msg.tool_calls
+                    ],
                 })
 
+                async for event in self._run_tool_calls(step, msg.tool_calls, state, question, table, is_training, true_answer, metrics):
+                    yield event
+                if state.submitted_answer is not None:
+                    # An accepted submit_answer already carries the final <Answer>; no further model turn
+                    reasoning_trace.append({
+                        "step": step, "type": "agent_done",
+                        "content": state.submitted_answer,
+                    })
+                    yield self._finish_step_metrics(metrics, state)
+                    break
+                yield self._finish_step_metrics(metrics, state)
+
+        except (GeneratorExit, asyncio.CancelledError):
+            # Closed by the consumer or its task cancelled (client gone): tools still
+            # running in the pool stop at their next check instead of running to completion
+            cancel_token.cancel("agent run abandoned")
+            raise
+
+        yield self._build_result(state, question, table, is_training, true_answer)
+
+    def _build_result(self, state: "AgentRunState", question: str, table: Dict[str, Any],
+                      is_training: bool, true_answer: Optional[str]) -> Dict[str, Any]:
+        """The 'end' event with the complete result of a finished run."""
+        reasoning_trace = state.reasoning_trace
+        context_report = state.compactor.report()
+        logger.info(f"[Agent] Context tokens sent: {context_report['sent_tokens']}, saved by compaction: {context_report['tokens_saved']}")
+        run_metrics = _metrics_totals(state.step_metrics)
+        logger.info(f"[Agent] Run metrics: {run_metrics}")
+
         # Determine final confidence: use actual LLM thought if available, else default
-        final_confidence = last_confidence_score if last_confidence_score is not None else 0.5
+        final_confidence = state.last_confidence_score if state.last_confidence_score is not None else 0.5
 
         # Extract <Answer> from LLM's final text (Route B: LLM generates answer itself)
         final_text = ""
@@ -226,207 +402,320 @@ class TableSageAgent:
         if is_training and true_answer is not None and extracted_answer:
             from utils.utils import TableUtils as _TU
             is_correct = _TU().is_answer_correct(final_text, true_answer)
+            # Accuracy is credited to the route/model of the completion that produced the answer
+            last_llm = next((m for m in reversed(state.step_metrics) if "route" in m), None)
+            if last_llm is not None:
+                model_router.record_outcome(last_llm["route"], is_correct, last_llm["model"])
 
-        return {
+        complete_result = {
             "answer": extracted_answer,
             "raw_answer": final_text,
-            "context_used": final_answer_context.get("context_used", "direct"),
+            "context_used": state.final_answer_context.get("context_used", "direct"),
             "confidence": final_confidence,
             "similar_questions": [], # Now dynamic
             "flow_path": "agent",
             "reasoning_trace": reasoning_trace,
-            "tools_used": tools_used,
+            "tools_used": state.tools_used,
             "total_steps": len([t for t in reasoning_trace if t["type"] == "tool_call"]),
+            "fast_path": any(t["type"] == "fast_path" for t in reasoning_trace),
+            "deadline_exceeded": any(t["type"] == "deadline" for t in reasoning_trace),
+            "context_report": context_report,
+            "metrics": run_metrics,
             "user_question": question,
             "user_table": table,
             "true_answer": true_answer,
             "is_correct": is_correct,
         }
+        return {
+            "step": "end",
+            "message": "Agent 答题流程完成",
+            "answer": complete_result["answer"],
+            "complete_result": complete_result,
+        }
 
-    # ── Public: streaming generator ──────────────────────────────────────────
-    def run_stream(
-        self,
-        question: str,
-        table: Dict[str, Any],
-        is_training: bool = False,
-        true_answer: Optional[str] = None,
-        session_history: Optional[List[Dict[str, Any]]] = None,
-        reasoning_summary: Optional[str] = None
-    ) -> Generator[Dict[str, Any], None, None]:
+    async def _llm_step(
+        self, messages: List[Dict], step_num: int, metrics: Dict[str, Any], stream: bool,
+        tool_choice: str = "auto", deadline: Optional[float] = None, cancel_token: Optional[CancelToken] = None,
+    ) -> AsyncGenerator[Any, None]:
         """
-        Stream Agent execution step-by-step.
-        Yields dicts with 'step' key: start → rag → thinking → tool_call → tool_result → end/error
+        One LLM decision step.
+
+        With stream=True, content deltas are yielded as answer_chunk events while
+        the completion streams in and tool-call deltas are assembled by index.
+        The last item yielded is an _LLMReply(message, finish_reason) shaped like a
+        non-streamed response. `metrics` is filled with the LLM latency and token
+        usage of the call. The request timeout is clamped to `deadline` (see
+        utils.deadline); a cancelled `cancel_token` aborts the call, closing a
+        stream that is being read.
         """
-        yield {"step": "start", "message": "TableSage Agent 开始处理"}
+        # tool_choice="none" is only used where the completion must be the final answer
+        route = model_router.route("final_answer" if tool_choice == "none" else "agent", self._model_override)
+        metrics["route"], metrics["model"] = route.name, route.model
+        request = dict(
+            model=route.model,
+            messages=messages,
+            tools=self.tools,
+            tool_choice=tool_choice,
+            temperature=0.1,
+            timeout=AGENT_LLM_TIMEOUT,
+        )
+        if route.max_tokens:
+            request["max_tokens"] = route.max_tokens
+        start = time.perf_counter()
+        if not stream:
+            with model_router.timed(route), deadline_scope(deadline), cancel_scope(cancel_token):
+                response = await llm_gateway.achat_completion(self._async_client(), **request)
+            message, finish_reason = response.choices[0].message, response.choices[0].finish_reason
+            _record_llm_metrics(metrics, start, getattr(response, "usage", None), messages, message)
+            yield _LLMReply(message, finish_reason)
+            return
 
+        if AGENT_STREAM_USAGE:
+            request["stream_options"] = {"include_usage": True}
+        content_parts: List[str] = []
+        tool_calls: Dict[int, Dict[str, str]] = {}
+        finish_reason = None
+        usage = None
+        # The gateway applies the deadline when the call is made, not while the stream is read
+        with deadline_scope(deadline), cancel_scope(cancel_token):
+            chunks = llm_gateway.astream_completion(self._async_client(), **request)
+        stream_ok = False
         try:
-            # Step 1: Initialize Messages
-            messages = self._build_initial_messages(
-                question, table, session_history, reasoning_summary
-            )
-            reasoning_trace: List[Dict[str, Any]] = []
-            tools_used: List[str] = []
-            final_answer_context: Dict[str, Any] = {}
-            last_confidence_score: Optional[float] = None
-            retrieved_ids: List[str] = [] # Track IDs seen in this session
-
-            for step_num in range(1, self.max_steps + 1):
-                yield {"step": "thinking", "message": f"Step {step_num}: Agent 正在决策..."}
-
-                response = self._client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    tools=ALL_TOOLS,
-                    tool_choice="auto",
-                    temperature=0.1,
-                    timeout=60.0,
+            async for chunk in chunks:
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+                # The usage chunk comes last, with no choices
+                usage = getattr(chunk, "usage", None) or usage
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                delta = choice.delta
+                if delta.content:
+                    if not content_parts:
+                        metrics["first_token_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                    content_parts.append(delta.content)
+                    yield {"step": "answer_chunk", "agent_step": step_num, "content": delta.content}
+                for tc_delta in delta.tool_calls or []:
+                    entry = tool_calls.setdefault(tc_delta.index, {"id": "", "name": "", "arguments": ""})
+                    if tc_delta.id:
+                        entry["id"] = tc_delta.id
+                    if tc_delta.function is not None:
+                        entry["name"] += tc_delta.function.name or ""
+                        entry["arguments"] += tc_delta.function.arguments or ""
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
+            stream_ok = True
+        finally:
+            # Drops the HTTP response when the step stops early
+            await chunks.aclose()
+            model_router.record(route, time.perf_counter() - start, stream_ok)
+
+        message = SimpleNamespace(
+            content="".join(content_parts) or None,
+            tool_calls=[
+                SimpleNamespace(
+                    id=entry["id"], type="function",
+                    function=SimpleNamespace(name=entry["name"], arguments=entry["arguments"]),
                 )
+                for _, entry in sorted(tool_calls.items())
+            ],
+        )
+        _record_llm_metrics(metrics, start, usage, messages, message)
+        yield _LLMReply(message, finish_reason)
 
-                msg = response.choices[0].message
-                finish_reason = response.choices[0].finish_reason
+    def _async_client(self):
+        # AsyncOpenAI clients are pooled per event loop, so look it up on the loop running the step
+        return get_async_openai_client(OPENAI_API_KEY, OPENAI_API_BASE)
 
-                logger.info(f"[Agent-Stream] Step {step_num} LLM content: {(msg.content or '')[:200]}")
-                logger.info(f"[Agent-Stream] Step {step_num} finish_reason={finish_reason}, tool_calls={len(msg.tool_calls or [])}")
+    def _fast_path_neighbours(self, state: "AgentRunState") -> Optional[List[Dict[str, Any]]]:
+        """
+        Neighbours of the first search when they qualify for the fast path, else None.
 
-                if finish_reason == "stop" or not msg.tool_calls:
-                    final_text = msg.content or ""
-                    reasoning_trace.append({
-                        "step": step_num, "type": "agent_done",
-                        "content": final_text,
-                    })
-                    break
+        Only the first search of a run is considered: every result must be
+        Mastered or Strategic Success with similarity >= AGENT_FAST_PATH_MIN_SIMILARITY.
+        """
+        if state.fast_path_checked or state.first_search_results is None:
+            return None
+        state.fast_path_checked = True
+        results = state.first_search_results
+        if len(results) < AGENT_FAST_PATH_MIN_NEIGHBOURS:
+            return None
+        for res in results:
+            if not str(res.get("history_status", "")).startswith(_FAST_PATH_STATUSES):
+                return None
+            if (res.get("similarity") or 0.0) < AGENT_FAST_PATH_MIN_SIMILARITY:
+                return None
+        return results
 
-                messages.append({
-                    "role": "assistant",
-                    "content": msg.content,
-                    "tool_calls": [
-                        {"id": tc.id, "type": "function",
-                         "function": {"name": tc.function.name, "arguments": tc.function.arguments}}
-                        for tc in msg.tool_calls
-                    ],
-                })
+    async def _run_fast_path(
+        self,
+        step: int,
+        neighbours: List[Dict[str, Any]],
+        state: "AgentRunState",
+        question: str,
+        table: Dict[str, Any],
+        is_training: bool,
+        true_answer: Optional[str],
+        stream: bool,
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Answer directly from a fully mastered neighbourhood.
 
-                for tc in msg.tool_calls:
-                    tool_name = tc.function.name
-                    try:
-                        args = json.loads(tc.function.arguments)
-                    except json.JSONDecodeError:
-                        args = {}
-
-                    logger.info(f"[Agent-Stream] Step {step_num} -> Tool: {tool_name}, args: {json.dumps(args, ensure_ascii=False, default=str)[:200]}")
-
-                    yield {"step": "tool_call", "tool": tool_name,
-                           "message": f"调用工具: {tool_name}"}
-
-                    # ReAct logic is now fully driven by the Agent's choices.
-                    if tool_name == "generate_final_answer":
-                        # --- Confidence Guard ---
-                        has_thought = any(t["type"] == "tool_call" and t["tool"] == "think" for t in reasoning_trace)
-                        low_conf = last_confidence_score is not None and last_confidence_score < 0.8
-                        
-                        if not has_thought or low_conf:
-                            tool_result = {
-                                "error": "Rethink required. You must call 'think' to assess your logic and ensure confidence >= 0.8 "
-                                         "before calling generate_final_answer. If your confidence is still low, perform a 'search_knowledge'."
-                            }
-                        else:
-                            args["user_question"] = question
-                            args["user_table"] = table
-                            args["is_training"] = is_training
-                            if is_training and true_answer:
-                                args["true_answer"] = true_answer
-                            tool_result = self._execute_tool(tool_name, args)
-                    elif tool_name == "search_knowledge":
-                        # Auto-inject current question, table, and excluded IDs
-                        args["user_question"] = question
-                        args["user_table"] = table
-                        args["exclude_ids"] = retrieved_ids
-                        tool_result = self._execute_tool(tool_name, args)
-
-                        # Track newly retrieved IDs
-                        if isinstance(tool_result, dict) and "results" in tool_result:
-                            for res in tool_result["results"]:
-                                if "table_id" in res:
-                                    retrieved_ids.append(res["table_id"])
-                    else:
-                        # Robust argument check
-                        if not isinstance(args, dict):
-                            tool_result = {"error": f"Tool arguments must be an object, but got {type(args).__name__}"}
-                        else:
-                            tool_result = self._execute_tool(tool_name, args)
-                        
-                    tools_used.append(tool_name)
-
-                    if tool_name == "generate_final_answer":
-                        final_answer_context = tool_result
-                    elif tool_name == "think" and "confidence_score" in tool_result:
-                        last_confidence_score = tool_result["confidence_score"]
-
-                    summary = _summarize(tool_result)
-                    logger.info(f"[Agent-Stream] Step {step_num} <- Result (Summary): {summary}")
-                    # 使用 INFO 级别让用户能看到传回模型的具体内容
-                    logger.info(f"[Agent-Stream] Step {step_num} <- Result (Full): {json.dumps(tool_result, ensure_ascii=False, default=str)[:1000]}")
-                    
-                    reasoning_trace.append({
-                        "step": step_num, "type": "tool_call",
-                        "tool": tool_name, "arguments": args,
-                        "result_summary": summary,
-                    })
+        The final-answer context (few-shot reflections of the Strategic Success
+        neighbours) is built server-side and followed by a single completion with
+        tool_choice="none"; think and the confidence guard are skipped.
+        """
+        min_similarity = min(res.get("similarity") or 0.0 for res in neighbours)
+        logger.info(f"[Agent] Fast path: {len(neighbours)} mastered neighbours, min similarity {min_similarity}")
+        yield {"step": "fast_path", "message": "相似问题均已掌握，跳过推理循环直接作答"}
+        state.reasoning_trace.append({
+            "step": step,
+            "type": "fast_path",
+            "neighbour_ids": [res.get("table_id") for res in neighbours],
+            "min_similarity": min_similarity,
+        })
 
-                    yield {"step": "tool_result", "tool": tool_name,
-                           "result_summary": summary, "message": f"{tool_name} 执行完成"}
+        metrics = {"step": step, "type": "metrics"}
+        args = {"few_shot_ids": [
+            res["table_id"] for res in neighbours
+            if str(res.get("history_status", "")).startswith("Strategic Success")
+        ]}
+        _inject_final_answer_args(args, question, table, is_training, true_answer)
+        yield {"step": "tool_call", "tool": "generate_final_answer", "message": "调用工具: generate_final_answer (快速路径)"}
+        tool_result, latency_ms = await self._execute_in_pool("generate_final_answer", args, state.step_deadline, state.cancel_token)
+        yield _tool_result_event("generate_final_answer", tool_result)
 
-                    messages.append({
-                        "role": "tool",
-                        "tool_call_id": tc.id,
-                        "content": json.dumps(tool_result, ensure_ascii=False, default=str),
-                    })
+        call_id = "fast_path_final_answer"
+        state.messages.append({
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{"id": call_id, "type": "function",
+                            "function": {"name": "generate_final_answer",
+                                         "arguments": json.dumps({"few_shot_ids": args["few_shot_ids"]})}}],
+        })
+        metrics["tool_calls"] = 1
+        metrics["tool_latency_ms"] = latency_ms
+        metrics["tool_result_chars"] = self._record_tool_result(
+            step, call_id, "generate_final_answer", args, tool_result, state, latency_ms
+        )
 
-            # Determine final confidence
-            final_confidence = last_confidence_score if last_confidence_score is not None else 0.5
+        async for event in self._llm_step(
+            state.compactor.compact(state.messages), step, metrics, stream and AGENT_STREAM_COMPLETIONS,
+            tool_choice="none", deadline=state.deadline, cancel_token=state.cancel_token,
+        ):
+            if isinstance(event, _LLMReply):
+                msg = event.message
+            else:
+                yield event
+        state.reasoning_trace.append({"step": step, "type": "agent_done", "content": msg.content or ""})
+        # No think call on this path: the neighbourhood similarity stands in for the confidence
+        state.last_confidence_score = min_similarity
+        yield self._finish_step_metrics(metrics, state)
 
-            # Extract <Answer> from LLM's final text (Route B)
-            final_text = ""
-            for t in reversed(reasoning_trace):
-                if t.get("type") == "agent_done":
-                    final_text = t.get("content", "")
-                    break
-            
-            extracted_answer = ""
-            if final_text:
-                match = re.search(r"<Answer>([\s\S]*?)</Answer>", final_text)
-                extracted_answer = match.group(1).strip() if match else ""
-
-            # Training mode: validate answer at agent level
-            is_correct_val = None
-            if is_training and true_answer is not None and extracted_answer:
-                from utils.utils import TableUtils as _TU
-                is_correct_val = _TU().is_answer_correct(final_text, true_answer)
-
-            complete_result = {
-                "answer": extracted_answer,
-                "raw_answer": final_text,
-                "context_used": final_answer_context.get("context_used", "direct"),
-                "confidence": final_confidence,
-                "similar_questions": [], # Now dynamic
-                "flow_path": "agent",
-                "reasoning_trace": reasoning_trace,
-                "tools_used": tools_used,
-                "user_question": question,
-                "user_table": table,
-                "true_answer": true_answer,
-                "is_correct": is_correct_val,
-            }
-            yield {
-                "step": "end",
-                "message": "Agent 答题流程完成",
-                "answer": complete_result["answer"],
-                "complete_result": complete_result,
-            }
+    async def _force_final_answer(self, step: int, state: "AgentRunState", stream: bool) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Best-effort answer when the request deadline is nearly spent.
+
+        One completion with tool_choice="none" over the history gathered so far,
+        limited to the time left before the hard deadline. If it fails the run
+        ends with an empty answer instead of an error.
+        """
+        left = _time_left(state.deadline, AGENT_LLM_TIMEOUT)
+        logger.warning(f"[Agent] Deadline nearly reached ({left:.1f}s left), forcing the final answer at step {step}")
+        yield {"step": "deadline", "message": "时间预算即将用尽，直接生成最终答案"}
+        state.reasoning_trace.append({"step": step, "type": "deadline", "remaining_s": round(left, 1)})
+        state.messages.append({
+            "role": "user",
+            "content": (
+                "TIME LIMIT REACHED. Do not call any more tools. Using the table and everything gathered so far, "
+                "output your best final answer now in <Answer></Answer> tags."
+            ),
+        })
 
+        metrics = {"step": step, "type": "metrics"}
+        try:
+            content = ""
+            async for event in self._llm_step(
+                state.compactor.compact(state.messages), step, metrics, stream and AGENT_STREAM_COMPLETIONS,
+                tool_choice="none", deadline=state.deadline, cancel_token=state.cancel_token,
+            ):
+                if isinstance(event, _LLMReply):
+                    content = event.message.content or ""
+                else:
+                    yield event
+        except RunCancelled:
+            raise
         except Exception as e:
-            import traceback
-            yield {"step": "error", "error": str(e), "error_details": traceback.format_exc()}
+            logger.error(f"[Agent] Forced final answer failed: {e}")
+            content = ""
+        state.reasoning_trace.append({"step": step, "type": "agent_done", "content": content})
+        yield self._finish_step_metrics(metrics, state)
+
+    def start_retrieval(self, question: str, table: Dict[str, Any],
+                        cancel_token: Optional[CancelToken] = None) -> tuple:
+        """
+        Start the run's mandatory search_knowledge call ahead of arun() / arun_stream().
+
+        Lets a caller overlap retrieval (embedding and structure service calls) with
+        its own work, such as intent routing. Pass the handle to the run as `prefetch`
+        together with the same question, table and cancel token; cancel the token to
+        abandon it. Must be called from a running event loop.
+
+        Returns:
+            Opaque prefetch handle.
+        """
+        deadline = deadline_after(self.deadline_seconds)
+        step_deadline = deadline - AGENT_DEADLINE_RESERVE_SECONDS if deadline is not None else None
+        return self._start_prefetch(question, table, step_deadline, cancel_token)
+
+    def _start_prefetch(self, question: str, table: Dict[str, Any], deadline: Optional[float] = None,
+                        cancel_token: Optional[CancelToken] = None) -> tuple:
+        """Start the mandatory search_knowledge call in the background; returns (arguments, future)."""
+        args = {"user_question": question, "user_table": table, "exclude_ids": []}
+        future = asyncio.get_running_loop().run_in_executor(
+            _blocking_pool, self._timed_execute, "search_knowledge", args, deadline, cancel_token
+        )
+        # A search that is never awaited (dropped, or the run ended first) must not log "exception never retrieved"
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        return args, future
+
+    async def _inject_prefetch(self, prefetch: tuple, state: "AgentRunState") -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Append the prefetched search as a completed tool exchange (step 0).
+
+        The model sees the same assistant tool_call / tool message pair it would
+        have produced itself, so the mandatory search is already satisfied and
+        step 1 goes straight to reading the results.
+        """
+        yield {"step": "tool_call", "tool": "search_knowledge", "message": "调用工具: search_knowledge (预取)"}
+        args, future = prefetch
+        tool_result, latency_ms = await future
+        yield _tool_result_event("search_knowledge", tool_result)
+
+        call_id = "prefetch_search_knowledge"
+        state.messages.append({
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{"id": call_id, "type": "function",
+                            "function": {"name": "search_knowledge", "arguments": "{}"}}],
+        })
+        result_chars = self._record_tool_result(0, call_id, "search_knowledge", args, tool_result, state, latency_ms)
+        state.reasoning_trace[-1]["prefetched"] = True
+        yield self._finish_step_metrics({
+            "step": 0, "type": "metrics", "tool_calls": 1, "tool_latency_ms": latency_ms,
+            "tool_result_chars": result_chars,
+        }, state)
+
+    def _finish_step_metrics(self, metrics: Dict[str, Any], state: "AgentRunState") -> Dict[str, Any]:
+        """Attach a finished step's metrics to the trace and build its SSE event."""
+        metrics.setdefault("tool_calls", 0)
+        metrics.setdefault("tool_latency_ms", 0.0)
+        metrics.setdefault("tool_result_chars", 0)
+        state.step_metrics.append(metrics)
+        state.reasoning_trace.append(metrics)
+        logger.info(f"[Agent] Step {metrics['step']} metrics: {metrics}")
+        event = {k: v for k, v in metrics.items() if k not in ("step", "type")}
+        return {"step": "metrics", "agent_step": metrics["step"], **event}
 
     # (Internal methods _rag_retrieval and _estimate_final_confidence removed in favor of Agentic ReAct)
 
@@ -436,9 +725,10 @@ class TableSageAgent:
         question: str,
         table: Dict[str, Any],
         session_history: Optional[List[Dict[str, Any]]] = None,
-        reasoning_summary: Optional[str] = None
+        reasoning_summary: Optional[str] = None,
+        prefetched: bool = False
     ) -> List[Dict]:
-        formatted_table = TableUtils.table2format(table)
+        formatted_table = TableUtils.table2format(table, question=question)
 
         # Build Session Context if available
         session_info = ""
@@ -452,8 +742,23 @@ class TableSageAgent:
                     session_info += f"Q: {turn.get('question')}\nA: {turn.get('answer')}\n"
                 session_info += "\n"
 
+        if prefetched:
+            search_hint = ("1. `search_knowledge` has already been run for this question (see its result below). "
+                           "Only search again if you need more candidates.\n")
+        else:
+            search_hint = "1. If unsure, use `search_knowledge` to find similar patterns.\n"
+
+        if self.tool_protocol == "structured":
+            system_prompt = STRUCTURED_SYSTEM_PROMPT
+            confidence_hint = "Use them to INCREASE your confidence without wasting turns on practice.\n"
+            answer_hint = "4. Call `submit_answer` with your reasoning, confidence and answer once confidence is >= 0.8."
+        else:
+            system_prompt = SYSTEM_PROMPT
+            confidence_hint = "Use them to INCREASE your confidence via 'think' without wasting turns on practice.\n"
+            answer_hint = "4. Call `generate_final_answer` once confidence is >= 0.8."
+
         return [
-            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "system", "content": system_prompt},
             {
                 "role": "user",
                 "content": (
@@ -461,16 +766,238 @@ class TableSageAgent:
                     f"## User's Question:\n{question}\n\n"
                     f"## User's Table:\n{formatted_table}\n\n"
                     "**INSTRUCTIONS**: Analyze the question and table.\n"
-                    "1. If unsure, use `search_knowledge` to find similar patterns.\n"
+                    f"{search_hint}"
                     "2. **Scan Results**: If you see 'Mastered' or 'Lesson Learned' questions, read their `rethink_summary`. "
-                    "These are your cheat sheets. Use them to INCREASE your confidence via 'think' without wasting turns on practice.\n"
+                    f"These are your cheat sheets. {confidence_hint}"
                     "3. **Targeted Practice**: Only use `practice_question` on 'New' questions or to verify a strategy for complex patterns.\n"
-                    "4. Call `generate_final_answer` once confidence is >= 0.8."
+                    f"{answer_hint}"
                 ),
             },
         ]
 
     # ── Private: tool dispatch ────────────────────────────────────────────────
+    async def _run_tool_calls(
+        self,
+        step: int,
+        tool_calls: List[Any],
+        state: "AgentRunState",
+        question: str,
+        table: Dict[str, Any],
+        is_training: bool,
+        true_answer: Optional[str],
+        metrics: Dict[str, Any],
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Execute the tool calls of one step, yielding tool_call / tool_result events.
+
+        Consecutive calls to CONCURRENT_SAFE_TOOLS run together (at most
+        AGENT_TOOL_WORKERS at a time) and report their results as they finish.
+        Any other call runs alone and in order, so it sees the state left by the
+        calls before it (confidence guard, excluded search ids). Tool messages are
+        appended in tool_call order. Per-call latency and result size are added to
+        the trace and to `metrics`.
+
+        A call to one of MEMOIZED_TOOLS with the same (injected) arguments as an
+        earlier successful call of this run reuses that result instead of running
+        again; such calls are marked cached in the trace. A practice call that saves
+        a learning record drops every memo entry of its table_id, since the record
+        changes the prompt of later attempts (guided / error-reflection).
+        """
+        start = time.perf_counter()
+        calls = []
+        for tc in tool_calls:
+            try:
+                args = json.loads(tc.function.arguments)
+            except json.JSONDecodeError:
+                args = {}
+            calls.append((tc, tc.function.name, args))
+
+        for group in _group_tool_calls(calls):
+            pending = []
+            results: Dict[str, Dict[str, Any]] = {}
+            latencies: Dict[str, float] = {}
+            memo_keys: Dict[str, str] = {}  # memo key -> id of the call in this group that computes it
+            cached: Dict[str, str] = {}  # call id -> memo key its result is taken from
+            for tc, tool_name, args in group:
+                logger.info(f"[Agent] Step {step} -> Tool: {tool_name}, args: {json.dumps(args, ensure_ascii=False, default=str)[:200]}")
+                yield {"step": "tool_call", "tool": tool_name,
+                       "message": f"调用工具: {tool_name}"}
+
+                rejected = self._check_tool_call(tool_name, args, state, question, table, is_training, true_answer)
+                if rejected is not None:
+                    results[tc.id] = rejected
+                    continue
+                memo_key = _memo_key(tool_name, args) if tool_name in MEMOIZED_TOOLS else None
+                if memo_key is None:
+                    pending.append((tc, tool_name, args))
+                elif memo_key in state.tool_memo:
+                    logger.info(f"[Agent] Step {step} -> {tool_name} answered from the run's tool memo")
+                    cached[tc.id] = memo_key
+                    results[tc.id] = state.tool_memo[memo_key]
+                    yield _tool_result_event(tool_name, results[tc.id])
+                elif memo_key in memo_keys:
+                    # Same call twice in one group: run it once and share the result
+                    cached[tc.id] = memo_key
+                else:
+                    memo_keys[memo_key] = tc.id
+                    pending.append((tc, tool_name, args))
+
+            if len(pending) > 1:
+                limit = asyncio.Semaphore(AGENT_TOOL_WORKERS)
+
+                async def execute(tc, tool_name, args):
+                    async with limit:
+                        return tc, tool_name, await self._execute_in_pool(
+                            tool_name, args, state.step_deadline, state.cancel_token
+                        )
+
+                tasks = [asyncio.ensure_future(execute(*call)) for call in pending]
+                try:
+                    for next_done in asyncio.as_completed(tasks):
+                        tc, tool_name, (result, latency_ms) = await next_done
+                        results[tc.id], latencies[tc.id] = result, latency_ms
+                        state.cancel_token.raise_if_cancelled()
+                        yield _tool_result_event(tool_name, results[tc.id])
+                finally:
+                    # Drops calls still waiting for a slot; running ones stop at their next LLM call
+                    for task in tasks:
+                        task.cancel()
+            else:
+                for tc, tool_name, args in pending:
+                    state.cancel_token.raise_if_cancelled()
+                    results[tc.id], latencies[tc.id] = await self._execute_in_pool(
+                        tool_name, args, state.step_deadline, state.cancel_token
+                    )
+                    yield _tool_result_event(tool_name, results[tc.id])
+
+            for memo_key, tc_id in memo_keys.items():
+                # Errors (timeouts, bad arguments) are not reused: a repeat may succeed
+                if "error" not in results[tc_id]:
+                    state.tool_memo[memo_key] = results[tc_id]
+            for tc, tool_name, args in group:
+                result = results.get(tc.id) or {}
+                if tool_name == "practice_question" and result.get("record_saved", "none") != "none":
+                    _forget_table(state.tool_memo, result.get("table_id"))
+            for tc, tool_name, args in group:
+                if tc.id in cached and tc.id not in results:
+                    results[tc.id] = results[memo_keys[cached[tc.id]]]
+                    yield _tool_result_event(tool_name, results[tc.id])
+
+            for tc, tool_name, args in group:
+                latency_ms = latencies.get(tc.id, 0.0)
+                result_chars = self._record_tool_result(
+                    step, tc.id, tool_name, args, results[tc.id], state, latency_ms, cached=tc.id in cached
+                )
+                if tc.id in cached:
+                    metrics["tool_cache_hits"] = metrics.get("tool_cache_hits", 0) + 1
+                metrics["tool_calls"] = metrics.get("tool_calls", 0) + 1
+                metrics["tool_latency_ms"] = round(metrics.get("tool_latency_ms", 0.0) + latency_ms, 1)
+                metrics["tool_result_chars"] = metrics.get("tool_result_chars", 0) + result_chars
+
+        # Wall-clock time of the tools, shorter than tool_latency_ms when calls overlap
+        metrics["tool_wall_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    async def _execute_in_pool(self, tool_name: str, arguments: Dict[str, Any], deadline: Optional[float] = None,
+                               cancel_token: Optional[CancelToken] = None) -> tuple:
+        """Await _timed_execute on the agent's blocking pool (tools use the sync DB and LLM clients)."""
+        return await asyncio.get_running_loop().run_in_executor(
+            _blocking_pool, self._timed_execute, tool_name, arguments, deadline, cancel_token
+        )
+
+    def _timed_execute(self, tool_name: str, arguments: Dict[str, Any], deadline: Optional[float] = None,
+                       cancel_token: Optional[CancelToken] = None) -> tuple:
+        """Run one tool under the request deadline and cancel token; returns (result, latency_ms)."""
+        start = time.perf_counter()
+        try:
+            # LLM calls and DB queries made by the tool inherit the deadline and the cancel token
+            with deadline_scope(deadline), cancel_scope(cancel_token):
+                result = self._execute_tool(tool_name, arguments)
+        except DeadlineExceeded as e:
+            result = {"error": f"Tool '{tool_name}' skipped: {e}"}
+        return result, round((time.perf_counter() - start) * 1000, 1)
+
+    def _check_tool_call(self, tool_name, args, state, question, table, is_training, true_answer) -> Optional[Dict[str, Any]]:
+        """
+        Inject run context into the arguments of a tool call.
+        Returns an error result instead when the call must not be executed.
+        """
+        # ReAct logic is now fully driven by the Agent's choices.
+        if tool_name == "generate_final_answer":
+            # --- Confidence Guard ---
+            # Check if 'think' was called and what the confidence was
+            has_thought = any(t["type"] == "tool_call" and t["tool"] == "think" for t in state.reasoning_trace)
+            low_confidence = state.last_confidence_score is not None and state.last_confidence_score < 0.8
+
+            if not has_thought or low_confidence:
+                return {
+                    "error": "Rethink required. You must call 'think' to assess your logic and ensure confidence >= 0.8 "
+                             "before calling generate_final_answer. If your confidence is still low, perform a 'search_knowledge'."
+                }
+            _inject_final_answer_args(args, question, table, is_training, true_answer)
+        elif tool_name == "submit_answer":
+            if not isinstance(args, dict):
+                return {"error": f"Tool arguments must be an object, but got {type(args).__name__}"}
+            # The confidence check happens inside the tool; a rejection carries the context to revise with
+            _inject_final_answer_args(args, question, table, is_training, true_answer)
+        elif tool_name == "search_knowledge":
+            # Auto-inject current question, table, and excluded IDs for fresh results
+            args["user_question"] = question
+            args["user_table"] = table
+            args["exclude_ids"] = list(state.retrieved_ids)
+        elif not isinstance(args, dict):
+            # Robust argument check
+            return {"error": f"Tool arguments must be an object, but got {type(args).__name__}"}
+        return None
+
+    def _record_tool_result(self, step, tool_call_id, tool_name, args, tool_result, state, latency_ms=0.0,
+                            cached=False) -> int:
+        """Update run state, trace and message history with one tool result; returns its serialized size."""
+        state.tools_used.append(tool_name)
+
+        if tool_name == "generate_final_answer":
+            state.final_answer_context = tool_result
+        elif tool_name == "think" and "confidence_score" in tool_result:
+            state.last_confidence_score = tool_result["confidence_score"]
+        elif tool_name == "submit_answer" and isinstance(tool_result, dict):
+            if "confidence_score" in tool_result:
+                state.last_confidence_score = tool_result["confidence_score"]
+            if tool_result.get("accepted"):
+                state.final_answer_context = tool_result
+                state.submitted_answer = tool_result["answer"]
+        elif tool_name == "search_knowledge":
+            # Track newly retrieved IDs
+            if isinstance(tool_result, dict) and "results" in tool_result:
+                if state.first_search_results is None:
+                    state.first_search_results = tool_result["results"]
+                for res in tool_result["results"]:
+                    if "table_id" in res:
+                        state.retrieved_ids.append(res["table_id"])
+
+        summary = _summarize(tool_result)
+        logger.info(f"[Agent] Step {step} <- Result (Summary): {summary}")
+        # 使用 INFO 级别让用户能看到传回模型的具体内容
+        content = json.dumps(tool_result, ensure_ascii=False, default=str)
+        logger.info(f"[Agent] Step {step} <- Result (Full): {content[:1000]}")
+        trace_entry = {
+            "step": step,
+            "type": "tool_call",
+            "tool": tool_name,
+            "arguments": args,
+            "result_summary": summary,
+            "latency_ms": latency_ms,
+            "result_chars": len(content),
+        }
+        if cached:
+            trace_entry["cached"] = True
+        state.reasoning_trace.append(trace_entry)
+
+        state.messages.append({
+            "role": "tool",
+            "tool_call_id": tool_call_id,
+            "content": content,
+        })
+        return len(content)
+
     def _execute_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
         executor = TOOL_EXECUTORS.get(tool_name)
         if executor is None:
@@ -486,7 +1013,189 @@ class TableSageAgent:
     # (Static method _estimate_final_confidence removed)
 
 
+class AgentRunState:
+    """Mutable state of one agent run (message history, trace and bookkeeping)."""
+
+    def __init__(self, messages: List[Dict[str, Any]], compactor: Optional[ContextCompactor] = None):
+        self.messages = messages
+        self.compactor = compactor or ContextCompactor()
+        self.reasoning_trace: List[Dict[str, Any]] = []
+        self.tools_used: List[str] = []
+        self.final_answer_context: Dict[str, Any] = {}
+        self.last_confidence_score: Optional[float] = None
+        self.retrieved_ids: List[str] = []  # Track IDs seen in this session to avoid redundancy
+        self.step_metrics: List[Dict[str, Any]] = []
+        self.first_search_results: Optional[List[Dict[str, Any]]] = None
+        self.fast_path_checked = False
+        self.submitted_answer: Optional[str] = None  # accepted submit_answer (structured protocol)
+        self.tool_memo: Dict[str, Dict[str, Any]] = {}  # memo key -> result of a MEMOIZED_TOOLS call
+        # Absolute time.monotonic() deadlines; None when the run is not time-limited
+        self.deadline: Optional[float] = None
+        self.step_deadline: Optional[float] = None
+        self.cancel_token = CancelToken()
+
+
 # ── Helper ────────────────────────────────────────────────────────────────────
+class _LLMReply(NamedTuple):
+    """Final item of TableSageAgent._llm_step: the assembled message and its finish_reason."""
+    message: Any
+    finish_reason: Optional[str]
+
+
+def _run_sync(coro: Awaitable[Any]) -> Any:
+    """Run a coroutine to completion on a private event loop."""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        try:
+            loop.run_until_complete(llm_gateway.aclose_loop_clients())
+        finally:
+            loop.close()
+
+
+def _iterate_sync(agen: AsyncGenerator[Any, None]) -> Generator[Any, None, None]:
+    """Iterate an async generator from blocking code on a private event loop."""
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(agen.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        try:
+            # Closing early (consumer stopped iterating) cancels the run like a client disconnect
+            loop.run_until_complete(agen.aclose())
+            loop.run_until_complete(llm_gateway.aclose_loop_clients())
+        finally:
+            loop.close()
+
+
+def _group_tool_calls(calls: List[tuple]) -> List[List[tuple]]:
+    """
+    Split (tool_call, name, args) triples into runs of concurrency-safe calls and single calls.
+
+    practice_question writes the learning and teaching records of its table_id, so two
+    practice calls on the same table_id never share a group and run in call order.
+    """
+    groups: List[List[tuple]] = []
+    for call in calls:
+        table_id = _practice_table_id(call)
+        if (call[1] in CONCURRENT_SAFE_TOOLS and groups and groups[-1][-1][1] in CONCURRENT_SAFE_TOOLS
+                and (table_id is None or table_id not in {_practice_table_id(c) for c in groups[-1]})):
+            groups[-1].append(call)
+        else:
+            groups.append([call])
+    return groups
+
+
+def _practice_table_id(call: tuple) -> Optional[str]:
+    tool_name, args = call[1], call[2]
+    if tool_name != "practice_question" or not isinstance(args, dict):
+        return None
+    return args.get("table_id")
+
+
+# Schema defaults per tool, so that an omitted argument and its explicit default share a memo key
+_TOOL_DEFAULTS = {
+    schema["function"]["name"]: {
+        name: spec["default"]
+        for name, spec in schema["function"]["parameters"].get("properties", {}).items() if "default" in spec
+    }
+    for schema in ALL_TOOLS + STRUCTURED_TOOLS
+}
+
+
+def _memo_key(tool_name: str, arguments: Dict[str, Any]) -> str:
+    """Key of a tool call for the run's memo: tool name plus canonical (key-sorted) JSON arguments."""
+    arguments = {**_TOOL_DEFAULTS.get(tool_name, {}), **arguments}
+    canonical = json.dumps(arguments, sort_keys=True, ensure_ascii=False, default=str)
+    return f"{tool_name}:{hashlib.sha1(canonical.encode('utf-8')).hexdigest()}"
+
+
+def _forget_table(memo: Dict[str, Dict[str, Any]], table_id: Optional[str]) -> None:
+    """Drop the memoized practice results of `table_id` after its learning record changed."""
+    for key in [key for key, result in memo.items() if result.get("table_id") == table_id]:
+        del memo[key]
+
+
+def _time_left(deadline: Optional[float], default: float) -> float:
+    """Seconds until `deadline`, capped at `default` (which is also used without a deadline)."""
+    if deadline is None:
+        return default
+    return min(default, deadline - time.monotonic())
+
+
+def _inject_final_answer_args(args: Dict[str, Any], question: str, table: Dict[str, Any],
+                              is_training: bool, true_answer: Optional[str]) -> None:
+    args["user_question"] = question
+    args["user_table"] = table
+    args["is_training"] = is_training
+    if is_training and true_answer:
+        args["true_answer"] = true_answer
+
+
+def _usage_value(usage: Any, name: str) -> Optional[int]:
+    value = getattr(usage, name, None) if usage is not None else None
+    return value if isinstance(value, int) else None
+
+
+def _record_llm_metrics(metrics: Dict[str, Any], start: float, usage: Any,
+                        messages: List[Dict[str, Any]], message: Any) -> None:
+    """LLM latency and token counts of one step; tiktoken estimates when the API reports no usage."""
+    metrics["llm_latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    prompt_tokens = _usage_value(usage, "prompt_tokens")
+    completion_tokens = _usage_value(usage, "completion_tokens")
+    if prompt_tokens is not None and completion_tokens is not None:
+        metrics["token_source"] = "usage"
+    else:
+        metrics["token_source"] = "estimate"
+        prompt_tokens = sum(
+            4 + count_tokens(m.get("content") or "")
+            + sum(count_tokens(tc["function"]["arguments"]) for tc in m.get("tool_calls") or [])
+            for m in messages
+        )
+        content = message.content if isinstance(message.content, str) else ""
+        completion_tokens = count_tokens(content) + sum(
+            count_tokens(tc.function.arguments) for tc in message.tool_calls or []
+            if isinstance(tc.function.arguments, str)
+        )
+    metrics["prompt_tokens"] = prompt_tokens
+    metrics["completion_tokens"] = completion_tokens
+
+
+def _metrics_totals(step_metrics: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Aggregate per-step metrics for the final result."""
+    totals = {
+        "llm_calls": sum(1 for m in step_metrics if "llm_latency_ms" in m),
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "llm_latency_ms": 0.0,
+        "tool_calls": 0,
+        "tool_latency_ms": 0.0,
+        "tool_result_chars": 0,
+        "tool_cache_hits": 0,
+    }
+    for m in step_metrics:
+        for key in ("prompt_tokens", "completion_tokens", "llm_latency_ms", "tool_calls",
+                    "tool_latency_ms", "tool_result_chars", "tool_cache_hits"):
+            totals[key] += m.get(key) or 0
+    totals["llm_latency_ms"] = round(totals["llm_latency_ms"], 1)
+    totals["tool_latency_ms"] = round(totals["tool_latency_ms"], 1)
+    totals["total_tokens"] = totals["prompt_tokens"] + totals["completion_tokens"]
+    totals["estimated_steps"] = sum(1 for m in step_metrics if m.get("token_source") == "estimate")
+    if step_metrics:
+        costliest = max(step_metrics, key=lambda m: m.get("prompt_tokens") or 0)
+        totals["costliest_step"] = costliest["step"]
+    return totals
+
+
+def _tool_result_event(tool_name: str, tool_result: Dict[str, Any]) -> Dict[str, Any]:
+    return {"step": "tool_result", "tool": tool_name,
+            "result_summary": _summarize(tool_result), "message": f"{tool_name} 执行完成"}
+
+
 def _summarize(result: Dict[str, Any]) -> str:
     """Create a brief summary of a tool result for the trace."""
     if "error" in result and not result.get("mastered_ids") and not result.get("attempt_ids"):
@@ -9,6 +9,8 @@ Aligned with actual business flow:
      - apply_strategy_by_id: retry wrong answers with CoT/column_sorting/schema_linking
      - think: explicit ReAct Thought step – record reasoning about context sufficiency
      - generate_final_answer: produce final answer for the user's actual question
+     - submit_answer: reasoning + confidence + answer in one call (structured protocol,
+       replaces think / generate_final_answer, see STRUCTURED_TOOLS)
 """
 from agent.tools.answer_by_id_tool import answer_by_id_tool, ANSWER_BY_ID_SCHEMA
 from agent.tools.strategy_by_id_tool import apply_strategy_by_id_tool, STRATEGY_BY_ID_SCHEMA
@@ -17,6 +19,7 @@ from agent.tools.final_answer_tool import generate_final_answer_tool, FINAL_ANSW
 from agent.tools.think_tool import think_tool, THINK_TOOL_SCHEMA
 from agent.tools.search_knowledge_tool import search_knowledge_tool, SEARCH_KNOWLEDGE_SCHEMA
 from agent.tools.practice_question_tool import practice_question_tool, PRACTICE_QUESTION_SCHEMA
+from agent.tools.submit_answer_tool import submit_answer_tool, SUBMIT_ANSWER_SCHEMA
 
 ALL_TOOLS = [
     THINK_TOOL_SCHEMA,
@@ -25,19 +28,45 @@ ALL_TOOLS = [
     PRACTICE_QUESTION_SCHEMA,
 ]
 
+# Structured protocol: one submit_answer call replaces think + generate_final_answer
+STRUCTURED_TOOLS = [
+    SUBMIT_ANSWER_SCHEMA,
+    SEARCH_KNOWLEDGE_SCHEMA,
+    PRACTICE_QUESTION_SCHEMA,
+]
+
 TOOL_EXECUTORS = {
     "think": think_tool,
     "generate_final_answer": generate_final_answer_tool,
     "search_knowledge": search_knowledge_tool,
     "practice_question": practice_question_tool,
+    "submit_answer": submit_answer_tool,
 }
 
+# Tools without side effects on the agent loop's state; consecutive calls to
+# them within one step may run concurrently. Other tools run alone, in order.
+# practice_question writes the records of its table_id, so calls on the same
+# table_id are still run in order (see _group_tool_calls).
+CONCURRENT_SAFE_TOOLS = {"think", "practice_question"}
+
+# Tools whose result is reused when the same call (same arguments after the loop
+# injects the run context) is repeated within one run. generate_final_answer and
+# submit_answer are left out: they can write error records and end the run, so
+# every call must really happen. think is too cheap to be worth it.
+# search_knowledge is left out too: the loop injects the ids retrieved so far as
+# exclude_ids, so a repeated search is meant to return new neighbours.
+MEMOIZED_TOOLS = {"practice_question"}
+
 __all__ = [
     "ALL_TOOLS",
+    "STRUCTURED_TOOLS",
     "TOOL_EXECUTORS",
+    "CONCURRENT_SAFE_TOOLS",
+    "MEMOIZED_TOOLS",
     "ANSWER_BY_ID_SCHEMA",
     "STRATEGY_BY_ID_SCHEMA",
     "LEARNING_RECORD_SCHEMA",
     "THINK_TOOL_SCHEMA",
     "FINAL_ANSWER_SCHEMA",
+    "SUBMIT_ANSWER_SCHEMA",
 ]
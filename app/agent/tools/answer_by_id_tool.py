@@ -13,6 +13,7 @@ import re
 from typing import Any, Dict, Optional
 
 from openai_api.openai_client import OpenAIClient
+from openai_api.model_router import model_router
 from db.db_manager import DatabaseManager
 from utils.utils import TableUtils
 
@@ -103,9 +104,10 @@ def answer_by_id_tool(table_id: str, use_existing_learning: bool = True) -> Dict
             prompt = _build_direct_prompt(question, formatted_table)
 
         messages = [{"role": "user", "content": prompt}]
-        model_answer = openai_client.get_llm_response(messages)
+        model_answer = openai_client.get_practice_response(messages)
 
         is_correct = table_utils.is_answer_correct(model_answer, true_answer)
+        model_router.record_outcome("practice", is_correct)
 
         # Extract clean answer from tags
         match = re.search(r"<Answer>([\s\S]*?)</Answer>", model_answer)
@@ -91,7 +91,7 @@ def generate_final_answer_tool(
     try:
         db = DatabaseManager()
         table_utils = TableUtils()
-        formatted_table = table_utils.table2format(user_table)
+        formatted_table = table_utils.table2format(user_table, question=user_question)
 
         # Ensure lists
         if isinstance(few_shot_ids, str):
@@ -272,7 +272,7 @@ Provide:
 ## Section 3: Learning Points
 """
     messages = [{"role": "user", "content": prompt}]
-    reflection = openai_client.get_llm_response(messages, model="gpt-4o")
+    reflection = openai_client.get_llm_response(messages, model="gpt-4o", route="error_summary")
     db.error_records.insert_one({
         "question": question,
         "table": table,
@@ -10,6 +10,7 @@ import datetime
 from typing import Any, Dict, Optional
 
 from openai_api.openai_client import OpenAIClient
+from openai_api.model_router import model_router
 from db.db_manager import DatabaseManager
 from utils.utils import TableUtils
 
@@ -111,8 +112,9 @@ def practice_question_tool(
 
         # ── Step 2: Get LLM Response ──────────────────────────────────────────
         messages = [{"role": "user", "content": prompt}]
-        model_answer = openai_client.get_llm_response(messages)
+        model_answer = openai_client.get_practice_response(messages)
         is_correct = table_utils.is_answer_correct(model_answer, true_answer)
+        model_router.record_outcome("practice", is_correct)
         
         match = re.search(r"<Answer>([\s\S]*?)</Answer>", model_answer)
         extracted = match.group(1).strip() if match else ""
@@ -14,6 +14,7 @@ import re
 from typing import Any, Dict, List, Optional
 
 from openai_api.openai_client import OpenAIClient
+from openai_api.model_router import model_router
 from db.db_manager import DatabaseManager
 from utils.utils import TableUtils
 
@@ -106,9 +107,10 @@ def apply_strategy_by_id_tool(
 
         prompt = _build_strategy_prompt(question, formatted_table, strategy, strategy_content)
         messages = [{"role": "user", "content": prompt}]
-        model_answer = openai_client.get_llm_response(messages)
+        model_answer = openai_client.get_practice_response(messages)
 
         is_correct = table_utils.is_answer_correct(model_answer, true_answer)
+        model_router.record_outcome("practice", is_correct)
         match = re.search(r"<Answer>([\s\S]*?)</Answer>", model_answer)
         extracted = match.group(1).strip() if match else ""
 
@@ -262,7 +264,7 @@ Include THREE sections:
 ## Section 3: Key Learning Points – What to apply to similar questions.
 """
     messages = [{"role": "user", "content": prompt}]
-    return client.get_llm_response(messages)
+    return client.get_practice_response(messages, route="reflection")
 
 
 def _generate_error_summary(
@@ -293,4 +295,4 @@ Include THREE sections:
 ## Section 3: Improvement Plan – How to approach similar questions differently.
 """
     messages = [{"role": "user", "content": prompt}]
-    return client.get_llm_response(messages)
+    return client.get_practice_response(messages, route="error_summary")
@@ -0,0 +1,142 @@
+"""
+Submit Answer Tool – Structured Think + Final Answer
+
+Used by the agent's "structured" tool protocol in place of the think →
+generate_final_answer → <Answer> sequence. A single call carries the
+reasoning, the self-assessed confidence and the drafted answer:
+
+  - confidence >= SUBMIT_CONFIDENCE_THRESHOLD and a well-formed <Answer>:
+    the answer is accepted and the agent loop ends without another model turn
+  - otherwise the submission is rejected, and the few-shot / reflection
+    context for the cited ids is assembled server-side and returned with the
+    rejection, so the model can revise in one turn
+"""
+import re
+from typing import Any, Dict, List, Optional
+
+from agent.tools.final_answer_tool import generate_final_answer_tool
+
+# Same threshold as the think/generate_final_answer confidence guard
+SUBMIT_CONFIDENCE_THRESHOLD = 0.8
+
+# ── OpenAI function-calling schema ────────────────────────────────────────────
+SUBMIT_ANSWER_SCHEMA = {
+    "type": "function",
+    "function": {
+        "name": "submit_answer",
+        "description": (
+            "Submit your FINAL answer for the user's ORIGINAL question together with your reasoning "
+            "and confidence, in ONE call. Do all calculations in `reasoning` first. "
+            "If confidence_score >= 0.8 the answer is accepted and the task ends. "
+            "Otherwise it is rejected and you receive the context of the cited similar questions to revise with."
+        ),
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "reasoning": {
+                    "type": "string",
+                    "description": (
+                        "Step-by-step reasoning and calculations that lead to the answer, including "
+                        "which similar questions / rethink_summaries you relied on."
+                    ),
+                },
+                "confidence_score": {
+                    "type": "number",
+                    "description": (
+                        "Self-assessed confidence that the answer is correct. Range: 0.0 to 1.0. "
+                        "MUST NOT exceed 0.7 if search_knowledge has not been called for this question."
+                    ),
+                },
+                "answer": {
+                    "type": "string",
+                    "description": "The final answer wrapped in Answer tags, e.g. <Answer>['value']</Answer>.",
+                },
+                "few_shot_ids": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Table IDs of Strategic Success questions (flag=1) your reasoning relied on.",
+                },
+                "reflection_ids": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Table IDs of Lesson Learned questions (flag=2) whose mistakes you avoided. At most 2.",
+                },
+            },
+            "required": ["reasoning", "confidence_score", "answer"],
+        },
+    },
+}
+
+
+def submit_answer_tool(
+    reasoning: str,
+    confidence_score: float,
+    answer: str,
+    user_question: str,
+    user_table: Dict[str, Any],
+    few_shot_ids: Optional[List[str]] = None,
+    reflection_ids: Optional[List[str]] = None,
+    is_training: bool = False,
+    true_answer: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Accept or reject a structured final answer.
+
+    Args:
+        reasoning: The LLM's reasoning and calculations behind the answer.
+        confidence_score: Self-assessed confidence [0.0, 1.0].
+        answer: Drafted answer, expected as <Answer>...</Answer>.
+        user_question / user_table: Auto-injected by the agent loop.
+        few_shot_ids / reflection_ids: Similar questions the answer relied on.
+
+    Returns:
+        dict with accepted=True and the answer, or accepted=False with the
+        reason and the assembled context to revise with.
+    """
+    confidence_score = round(max(0.0, min(1.0, float(confidence_score))), 3)
+    few_shot_ids = [few_shot_ids] if isinstance(few_shot_ids, str) else list(few_shot_ids or [])
+    reflection_ids = [reflection_ids] if isinstance(reflection_ids, str) else list(reflection_ids or [])
+    answer = answer or ""
+    has_answer_tags = re.search(r"<Answer>[\s\S]*?</Answer>", answer) is not None
+
+    if has_answer_tags and confidence_score >= SUBMIT_CONFIDENCE_THRESHOLD:
+        if few_shot_ids and reflection_ids:
+            context_used = "strategy_and_reflection"
+        elif few_shot_ids:
+            context_used = "strategy_only"
+        elif reflection_ids:
+            context_used = "reflection_only"
+        else:
+            context_used = "direct"
+        result = {
+            "accepted": True,
+            "answer": answer,
+            "confidence_score": confidence_score,
+            "context_used": context_used,
+            "few_shot_count": len(few_shot_ids),
+            "reflection_count": len(reflection_ids),
+        }
+        if is_training:
+            result["is_training"] = True
+            result["true_answer"] = str(true_answer) if true_answer else ""
+        return result
+
+    if not has_answer_tags:
+        reason = "The answer must be wrapped in <Answer></Answer> tags."
+    else:
+        reason = f"Confidence {confidence_score} is below {SUBMIT_CONFIDENCE_THRESHOLD}."
+
+    # Assemble the cited context now instead of in a separate generate_final_answer turn
+    context = generate_final_answer_tool(
+        user_question, user_table, few_shot_ids=few_shot_ids, reflection_ids=reflection_ids
+    )
+    return {
+        "accepted": False,
+        "confidence_score": confidence_score,
+        "error": f"Answer not accepted. {reason}",
+        "enriched_context": context.get("enriched_context", ""),
+        "instruction": (
+            "Review the context above (or search_knowledge / practice_question for more), "
+            "then call submit_answer again with a revised answer and confidence."
+        ),
+    }
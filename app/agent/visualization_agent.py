@@ -2,15 +2,13 @@ import os
 import json
 import logging
 from typing import Dict, Any, List
-from openai import AsyncOpenAI
+from openai_api.openai_client import llm_gateway
 from utils.utils import TableUtils
 from dotenv import load_dotenv
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENAI_API_BASE = os.getenv("OPENAI_API_BASE")
 # You can define a specific model for visualization, defaulting to standard LLM
 VISUALIZATION_LLM_MODEL = os.getenv("VISUALIZATION_LLM_MODEL", os.getenv("LLM_MODEL", "gpt-4o"))
 
@@ -20,10 +18,6 @@ class VisualizationAgent:
     自主调用后端的 MCP 工具进行图表生成。
     """
     def __init__(self, mcp_tools: List[Any], tool_caller: Any):
-        self._client = AsyncOpenAI(
-            api_key=OPENAI_API_KEY,
-            base_url=OPENAI_API_BASE or None,
-        )
         self.model = VISUALIZATION_LLM_MODEL
         self.mcp_tools = mcp_tools
         self.tool_caller = tool_caller # the call_tool function from client.py
@@ -52,7 +46,7 @@ class VisualizationAgent:
         ]
         
         # Format the full table for context visibility
-        formatted_table = TableUtils.table2format(user_table)
+        formatted_table = TableUtils.table2format(user_table, question=instruction)
         context_prompt = f"### Table Content:\n{formatted_table}\n\n### Answer Data Context: {cached_data.get('answer', '')}\n### Instruction: {instruction}"
         messages.append({"role": "user", "content": context_prompt})
 
@@ -77,7 +71,7 @@ class VisualizationAgent:
             kwargs["tool_choice"] = "auto"
             
         try:
-            response = await self._client.chat.completions.create(**kwargs)
+            response = await llm_gateway.achat_completion(**kwargs)
             message = response.choices[0].message
             
             toolCalls = []
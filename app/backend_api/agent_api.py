@@ -17,6 +17,7 @@ from pydantic import BaseModel, Field
 
 from agent.tablesage_agent import TableSageAgent
 from agent.router_agent import RouterAgent
+from utils.cancellation import CancelToken
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/agent", tags=["Agent 智能问答"])
@@ -36,6 +37,9 @@ class AgentAnswerRequest(BaseModel):
     max_steps: int = Field(10, ge=1, le=20, description="Agent 最大推理步数（默认10）")
     is_training: bool = Field(False, description="是否为训练模式")
     true_answer: Optional[str] = Field(None, description="训练模式下的标准答案")
+    deadline_seconds: Optional[float] = Field(
+        None, gt=0, le=600, description="本次请求的总时限（秒），到时强制给出最终答案；默认取 AGENT_DEADLINE_SECONDS"
+    )
 
 
 @router.post(
@@ -48,7 +52,7 @@ class AgentAnswerRequest(BaseModel):
     ),
 )
 async def agent_answer(request: AgentAnswerRequest):
-    agent = TableSageAgent(max_steps=request.max_steps)
+    agent = TableSageAgent(max_steps=request.max_steps, deadline_seconds=request.deadline_seconds)
     table_dict = {"header": request.table.header, "rows": request.table.rows}
     
     # 1. 通过 Router Agent 抽取意图和纯净的核心问题
@@ -56,7 +60,7 @@ async def agent_answer(request: AgentAnswerRequest):
     plan = await router_agent.analyze_intent(request.question, False, table_schema_str)
     core_question = plan.get("core_question", request.question)
     
-    result = agent.run(
+    result = await agent.arun(
         question=core_question,
         table=table_dict,
         is_training=request.is_training,
@@ -79,11 +83,15 @@ async def agent_answer(request: AgentAnswerRequest):
         "每行返回一个 JSON 对象，`step` 字段说明当前阶段:\n"
         "- `rag_done`: RAG结果（含相似度分数）\n"
         "- `tool_call` / `tool_result`: 工具调用\n"
+        "- `fast_path`: 相似问题均已掌握，跳过推理循环直接作答\n"
+        "- `deadline`: 时间预算即将用尽，停止推理并强制生成最终答案\n"
+        "- `answer_chunk`: 模型输出的增量文本（逐 token 推送）\n"
+        "- `metrics`: 每步的 token 用量与 LLM / 工具耗时\n"
         "- `end`: 最终答案"
     ),
 )
 async def agent_answer_stream(request: AgentAnswerRequest):
-    agent = TableSageAgent(max_steps=request.max_steps)
+    agent = TableSageAgent(max_steps=request.max_steps, deadline_seconds=request.deadline_seconds)
     table_dict = {"header": request.table.header, "rows": request.table.rows}
 
     # 1. 通过 Router Agent 抽取意图和纯净的核心问题
@@ -93,38 +101,26 @@ async def agent_answer_stream(request: AgentAnswerRequest):
 
     async def event_stream():
         # 首先输出 router 推断结果
-        yield f"data: {json.dumps({'step': 'router', 'plan': plan}, ensure_ascii=False, default=str)}\\n\\n"
-        
-        import asyncio
-        loop = asyncio.get_event_loop()
+        yield f"data: {json.dumps({'step': 'router', 'plan': plan}, ensure_ascii=False, default=str)}\n\n"
         
-        gen = agent.run_stream(
+        # 客户端断开时 StreamingResponse 取消本任务：进行中的 LLM 请求随之取消，token 让线程池中的工具停止后续调用
+        cancel_token = CancelToken()
+        gen = agent.arun_stream(
             question=core_question,
             table=table_dict,
             is_training=request.is_training,
             true_answer=request.true_answer,
+            cancel_token=cancel_token,
         )
-        
-        # Helper to get next chunk safely within a thread
-        def get_next_chunk():
-            try:
-                return next(gen)
-            except StopIteration:
-                return None
-            except Exception as e:
-                return {"step": "error", "error": str(e)}
-
-        while True:
-            # Poll the generator in a thread
-            chunk = await loop.run_in_executor(None, get_next_chunk)
-            
-            if chunk is None:
-                break
-                
-            yield f"data: {json.dumps(chunk, ensure_ascii=False, default=str)}\n\n"
-            
-            if chunk.get("step") == "error":
-                break
+
+        try:
+            async for chunk in gen:
+                yield f"data: {json.dumps(chunk, ensure_ascii=False, default=str)}\n\n"
+
+                if chunk.get("step") == "error":
+                    break
+        except Exception as e:
+            yield f"data: {json.dumps({'step': 'error', 'error': str(e)}, ensure_ascii=False)}\n\n"
 
     return StreamingResponse(event_stream(), media_type="text/event-stream")
 
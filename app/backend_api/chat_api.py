@@ -7,7 +7,8 @@ from typing import List, Dict, Any, Optional
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from openai import AsyncOpenAI
+from openai_api.openai_client import llm_gateway
+from openai_api.model_router import model_router
 
 from agent.tablesage_agent import TableSageAgent
 from agent.router_agent import RouterAgent
@@ -15,15 +16,14 @@ from agent.visualization_agent import VisualizationAgent
 from mcp_client.connection import all_tools, call_tool, extract_text_content
 from document_general.document_genral import generate_tablesage_report
 from db.db_manager import DatabaseManager
+from utils.cancellation import CancelToken
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/api/chat", tags=["mcp聊天主体"])
+# 在 Router 分析意图的同时预先启动 Data Agent 的首次检索；路由结果不需要查询时取消
+CHAT_SPECULATIVE_RETRIEVAL = os.getenv("CHAT_SPECULATIVE_RETRIEVAL", "1") != "0"
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENAI_API_BASE = os.getenv("OPENAI_API_BASE")
-LLM_MODEL = os.getenv("LLM_MODEL", "deepseek-chat")
-openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_API_BASE)
+router = APIRouter(prefix="/api/chat", tags=["mcp聊天主体"])
 
 # Initialization handled per request for TableSageAgent
 # 初始化Router Agent
@@ -155,6 +155,16 @@ async def api_chat(request: QuestionRequest):
             yield f"data: {json.dumps({'step': 'task_done', 'report_available': True, 'generate_report_url': f'/api/chat/generate-report/{semantic_key}'}, ensure_ascii=False)}\n\n"
         return StreamingResponse(fast_stream(), media_type="text/event-stream")
 
+    # 检索只依赖问题与表格，不依赖路由结果：与 Router 并行启动，使路由耗时与检索重叠
+    agent = TableSageAgent(max_steps=10)
+    # 客户端断开时 StreamingResponse 会取消 event_stream，Agent 的异步循环随之停止并取消 token，线程池中的工具在下一个检查点停止
+    cancel_token = CancelToken()
+    table_is_empty = not user_table.get("header") and not user_table.get("rows")
+    speculative_question = request.question.strip()
+    speculative_retrieval = None
+    if CHAT_SPECULATIVE_RETRIEVAL and agent.prefetch_retrieval and not table_is_empty:
+        speculative_retrieval = agent.start_retrieval(speculative_question, user_table, cancel_token)
+
     # 1. Router Agent 进行意图分析 (带入历史记录)
     plan = await router_agent.analyze_intent(
         request.question, 
@@ -169,13 +179,18 @@ async def api_chat(request: QuestionRequest):
     needs_report = plan.get("needs_report", False)
     core_question = plan.get("core_question", request.question)
     visualization_instruction = plan.get("visualization_instruction", "生成图表")
+
+    if speculative_retrieval is not None and (not needs_data_query or core_question != speculative_question):
+        # 不运行 Data Agent，或 Router 改写了问题：预先检索的结果用不上
+        cancel_token.cancel("speculative retrieval not used")
+        cancel_token = CancelToken()
+        speculative_retrieval = None
     
     # 构建流式响应生成器
     async def event_stream():
         nonlocal cached_data, has_cached_data
         
         # 0. 基础输入校验
-        table_is_empty = not user_table.get("header") and not user_table.get("rows")
         if table_is_empty and not has_cached_data:
             yield json.dumps({
                 "step": "error", 
@@ -202,31 +217,17 @@ async def api_chat(request: QuestionRequest):
             logger.info(f"Using direct table context for {session_id} to skip Data Agent.")
 
         if should_run_data_agent:
-            import asyncio
-            loop = asyncio.get_event_loop()
-            agent = TableSageAgent(max_steps=10)
-            
-            gen = agent.run_stream(
+            gen = agent.arun_stream(
                 question=core_question,
                 table=user_table,
                 session_history=session_context["history"],
-                reasoning_summary=session_context["reasoning_summary"]
+                reasoning_summary=session_context["reasoning_summary"],
+                cancel_token=cancel_token,
+                prefetch=speculative_retrieval,
             )
-            
-            def get_next_chunk():
-                try:
-                    return next(gen)
-                except StopIteration:
-                    return None
-                except Exception as e:
-                    return {"step": "error", "error": str(e)}
 
             try:
-                while True:
-                    chunk = await loop.run_in_executor(None, get_next_chunk)
-                    if chunk is None:
-                        break
-                        
+                async for chunk in gen:
                     chunk["conversation_id"] = conversation_id
                     chunk["session_id"] = session_id
                     
@@ -241,13 +242,17 @@ async def api_chat(request: QuestionRequest):
                     
                     yield f"data: {json.dumps(chunk, ensure_ascii=False, default=str)}\n\n"
                     
-                    if chunk.get("step") == "error":
+                    if chunk.get("step") in ("error", "cancelled"):
                         break
             except Exception as e:
                 error_item = {"step": "error", "error": f"Data Agent 错误: {str(e)}", "session_id": session_id}
                 yield f"data: {json.dumps(error_item, ensure_ascii=False)}\n\n"
                 return
 
+            if cancel_token.cancelled:
+                # 请求已被放弃：不再写入会话历史，也不再生成图表/报告
+                return
+
         # 任何情况下都尝试保存对话历史 (保持 Router 上下文)
         # 如果 Data Agent 没跑，我们也需要记录这一轮
         final_answer = ""
@@ -294,19 +299,22 @@ async def api_chat(request: QuestionRequest):
                     
                     summary_prompt = f"请根据以下数据分析结果写一份简短的管理层执行摘要（100字左右）：\n问题：{cached_data.get('user_question')}\n回答：{cached_data.get('answer')}"
                     
-                    response = await openai_client.chat.completions.create(
-                        model=LLM_MODEL,
-                        messages=[{"role": "user", "content": summary_prompt}],
-                        stream=True,
-                        temperature=0.3
-                    )
+                    summary_route = model_router.route("report_summary")
+                    summary_request = {
+                        "model": summary_route.model,
+                        "messages": [{"role": "user", "content": summary_prompt}],
+                        "temperature": 0.3,
+                    }
+                    if summary_route.max_tokens:
+                        summary_request["max_tokens"] = summary_route.max_tokens
                     
                     full_summary = ""
-                    async for chunk in response:
-                        content = chunk.choices[0].delta.content
-                        if content:
-                            full_summary += content
-                            yield f"data: {json.dumps({'step': 'report_chunk', 'content': content}, ensure_ascii=False)}\n\n"
+                    with model_router.timed(summary_route):
+                        async for chunk in llm_gateway.astream_completion(**summary_request):
+                            content = chunk.choices[0].delta.content
+                            if content:
+                                full_summary += content
+                                yield f"data: {json.dumps({'step': 'report_chunk', 'content': content}, ensure_ascii=False)}\n\n"
 
                     # 3. 状态流：打包排版文档
                     yield f"data: {json.dumps({'step': 'report_status', 'message': '正在排版并生成 Word 文档...'}, ensure_ascii=False)}\n\n"
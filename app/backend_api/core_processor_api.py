@@ -7,6 +7,7 @@ from fastapi.responses import StreamingResponse
 import json
 from backend_api.chat_api import generate_session_id, result_cache
 from agent.router_agent import RouterAgent
+from utils.cancellation import CancelToken, iterate_in_thread
 
 # 设置日志
 logging.basicConfig(level=logging.INFO)
@@ -125,12 +126,15 @@ async def process_question_stream(request: QuestionRequest):
     plan = await router_agent.analyze_intent(request.question, False, table_schema_str)
     core_question = plan.get("core_question", request.question)
     
-    def event_stream():
+    # 客户端断开时 StreamingResponse 会取消 event_stream，token 随之取消，处理流程中后续的 LLM 调用不再发起
+    cancel_token = CancelToken()
+
+    async def event_stream():
         try:
             # 也可以在这里返回 router 的推断结果，让前端知道在画图
             yield json.dumps({"step": "router", "plan": plan}, ensure_ascii=False) + "\\n"
             
-            for item in table_sage_processor.process_stream(core_question, user_table):
+            async for item in iterate_in_thread(table_sage_processor.process_stream(core_question, user_table), cancel_token):
                 # 添加session_id到每个响应
                 item["session_id"] = session_id
                 
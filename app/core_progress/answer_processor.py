@@ -1,24 +1,36 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
 from db.db_manager import DatabaseManager
 from utils.utils import TableUtils
 from openai_api.openai_client import OpenAIClient
+from utils.deadline import submit_with_context
+
+# 首轮练习并发调用 LLM 的线程数上限（总量仍受 LLM 网关的全局并发限制）
+ANSWERING_MAX_WORKERS = int(os.getenv("ANSWERING_MAX_WORKERS", "8"))
 
 class AnsweringProcessor:
-    def __init__(self, confidence_threshold=0.8):
+    def __init__(self, confidence_threshold=0.8, max_workers=ANSWERING_MAX_WORKERS):
         """
         Initialize the answering processor
         
         Args:
             confidence_threshold (float): Confidence threshold, below which strategic answering is required
+            max_workers (int): Maximum number of practice prompts answered concurrently
         """
         self.db_manager = DatabaseManager()
         self.openai_client = OpenAIClient()
         self.table_utils = TableUtils()
         self.confidence_threshold = confidence_threshold
+        self.max_workers = max_workers
     
     def process_answering(self, top_results):
         """
         Process the answering workflow
         
+        Learning records and knowledge entries are fetched in one batch each,
+        the practice prompts are answered concurrently on a bounded worker pool,
+        and new learning records are written with a single bulk insert.
+        
         Args:
             top_results (list): Top N similar question records matched, containing table_id
             
@@ -32,8 +44,10 @@ class AnsweringProcessor:
         other_flag_records = []
         not_found_ids = []
 
+        learning_records = self.db_manager.batch_get_learning_records(list(top_results))
+
         for table_id in top_results:
-            record = self.db_manager.get_learning_record(table_id)
+            record = learning_records.get(table_id)
             
             if record:
                 if record.get("flag") == 0:
@@ -44,17 +58,16 @@ class AnsweringProcessor:
             else:
                 not_found_ids.append(table_id)
 
-        processed_results = []
-        
+        knowledge_by_id = self.db_manager.batch_get_knowledge_by_ids(other_flag_records + not_found_ids)
+
+        # 先构造全部练习任务，保持原有的结果顺序（已有记录在前，新题在后）
+        tasks = []
         for table_id in other_flag_records:
-            learning_record = self.db_manager.get_learning_record(table_id)
-            if not learning_record:
-                continue
-                
+            learning_record = learning_records[table_id]
             flag_value = learning_record.get("flag")
             rethink_summary = learning_record.get("rethink_summary", "")
             
-            knowledge = self.db_manager.get_knowledge_by_id(table_id)
+            knowledge = knowledge_by_id.get(table_id)
             if not knowledge:
                 continue
                 
@@ -67,57 +80,51 @@ class AnsweringProcessor:
             elif flag_value == 2:
                 prompt = self._build_error_reflection_prompt(question, formatted_table, rethink_summary)
             
-            messages = [{"role": "user", "content": prompt}]
-            model_answer = self.openai_client.get_llm_response(messages)
-            
-            true_answer = knowledge.get("answer")
-            is_correct = self.table_utils.is_answer_correct(model_answer, true_answer)
-            
-            if is_correct:
-                flag_0_count += 1
-            
-            result_item = {
-                "table_id": table_id,
-                "is_correct": is_correct,
-                "flag_unchanged": True,
-                "model_answer": model_answer,
-                "strategy_used": f"flag_{flag_value}"
-            }
-            processed_results.append(result_item)
+            tasks.append((table_id, knowledge, prompt, flag_value, False))
         
         for table_id in not_found_ids:
-            knowledge = self.db_manager.get_knowledge_by_id(table_id)
-            
+            knowledge = knowledge_by_id.get(table_id)
             if not knowledge:
                 continue
                 
             formatted_table = self.table_utils.table2format(knowledge["table"])
-
             question = knowledge.get("question", "")
             
             prompt = self._build_prompt(question, formatted_table)
-            
-            messages = [{"role": "user", "content": prompt}]
-            model_answer = self.openai_client.get_llm_response(messages)
-            
+            tasks.append((table_id, knowledge, prompt, None, True))
+
+        model_answers = self._answer_concurrently([prompt for _, _, prompt, _, _ in tasks])
+
+        processed_results = []
+        new_records = []
+        for (table_id, knowledge, _, flag_value, is_new), model_answer in zip(tasks, model_answers):
             true_answer = knowledge.get("answer")
             is_correct = self.table_utils.is_answer_correct(model_answer, true_answer)
             
-            flag_value = 0 if is_correct else 3
-            
-            result_item = {
-                "table_id": table_id,
-                "is_correct": is_correct,
-                "new_record": True,
-                "flag": flag_value,
-                "model_answer": model_answer
-            }
-            processed_results.append(result_item)
-            
-            self.db_manager.add_learning_record(table_id, flag_value)
-            
             if is_correct:
                 flag_0_count += 1
+            
+            if is_new:
+                flag_value = 0 if is_correct else 3
+                result_item = {
+                    "table_id": table_id,
+                    "is_correct": is_correct,
+                    "new_record": True,
+                    "flag": flag_value,
+                    "model_answer": model_answer
+                }
+                new_records.append((table_id, flag_value))
+            else:
+                result_item = {
+                    "table_id": table_id,
+                    "is_correct": is_correct,
+                    "flag_unchanged": True,
+                    "model_answer": model_answer,
+                    "strategy_used": f"flag_{flag_value}"
+                }
+            processed_results.append(result_item)
+
+        self.db_manager.bulk_add_learning_records(new_records)
                 
         confidence = flag_0_count / total_count if total_count > 0 else 0
         
@@ -142,6 +149,31 @@ class AnsweringProcessor:
         }
         
         return result
+
+    def _answer_concurrently(self, prompts):
+        """
+        Answer practice prompts on a bounded thread pool
+        
+        Args:
+            prompts (list): Prompt strings
+            
+        Returns:
+            list: Model answers in the same order as prompts
+        """
+        if not prompts:
+            return []
+        
+        def answer(prompt):
+            messages = [{"role": "user", "content": prompt}]
+            return self.openai_client.get_practice_response(messages)
+        
+        if len(prompts) == 1 or self.max_workers <= 1:
+            return [answer(prompt) for prompt in prompts]
+        
+        # Workers inherit the request's deadline and cancel token
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(prompts))) as executor:
+            futures = [submit_with_context(executor, answer, prompt) for prompt in prompts]
+            return [future.result() for future in futures]
     
     def _build_guided_learning_prompt(self, question, formatted_table, rethink_summary):
         """
@@ -1,15 +1,22 @@
 import logging
-import jieba
-from rank_bm25 import BM25Okapi
 from typing import List, Dict, Any, Optional
 from db.db_manager import DatabaseManager
 
 # Set jieba logger to WARNING to suppress initialization messages
 logging.getLogger("jieba").setLevel(logging.WARNING)
-jieba.setLogLevel(logging.WARNING)
 
 logger = logging.getLogger(__name__)
 
+
+def get_jieba():
+    """
+    Import jieba on first use. The dictionary itself is loaded by
+    jieba.initialize(), which the startup warm-up calls ahead of requests.
+    """
+    import jieba
+    jieba.setLogLevel(logging.WARNING)
+    return jieba
+
 class BM25Searcher:
     """
     BM25 Searcher for keyword-based coarse filtering of questions.
@@ -40,12 +47,14 @@ class BM25Searcher:
         """Tokenize text using jieba."""
         if not text:
             return []
-        return list(jieba.cut(text))
+        return list(get_jieba().cut(text))
 
     def initialize_index(self):
         """Fetch all questions from DB and build the BM25 index."""
         logger.info("Initializing BM25 index...")
         try:
+            from rank_bm25 import BM25Okapi
+
             # Fetch all questions and their table_ids
             # We only need 'table_id' and 'question'
             cursor = self.db_manager.knowledge_db.find(
@@ -28,7 +28,7 @@ class FinalAnswerProcessor:
         Returns:
             dict: Dictionary containing final answer and related information
         """
-        formatted_user_table = self.table_utils.table2format(user_table)
+        formatted_user_table = self.table_utils.table2format(user_table, question=user_question)
         
         learning_record_info = self._find_learning_record(similar_questions)
         
@@ -215,7 +215,7 @@ class FinalAnswerProcessor:
         is_correct = self.table_utils.is_answer_correct(model_answer, true_answer)
         
         if not is_correct:
-            formatted_table = self.table_utils.table2format(user_table)
+            formatted_table = self.table_utils.table2format(user_table, question=user_question)
             error_reflection = self._generate_error_reflection(
                 user_question,
                 formatted_table,
@@ -284,7 +284,7 @@ class FinalAnswerProcessor:
         """
         
         messages = [{"role": "user", "content": prompt}]
-        error_reflection = self.openai_client.get_llm_response(messages,model="gpt-4o")
+        error_reflection = self.openai_client.get_llm_response(messages, model="gpt-4o", route="error_summary")
         
         return error_reflection
     
@@ -327,7 +327,7 @@ class FinalAnswerProcessor:
         """
         
         messages = [{"role": "user", "content": prompt}]
-        answer = self.openai_client.get_llm_response(messages)
+        answer = self.openai_client.get_llm_response(messages, route="final_answer")
         
         return {
             "answer": answer,
@@ -374,7 +374,7 @@ class FinalAnswerProcessor:
         """
         
         messages = [{"role": "user", "content": prompt}]
-        answer = self.openai_client.get_llm_response(messages)
+        answer = self.openai_client.get_llm_response(messages, route="final_answer")
         
         return {
             "answer": answer,
@@ -417,7 +417,7 @@ class FinalAnswerProcessor:
         """
         
         messages = [{"role": "user", "content": prompt}]
-        answer = self.openai_client.get_llm_response(messages)
+        answer = self.openai_client.get_llm_response(messages, route="final_answer")
         
         return {
             "answer": answer,
@@ -460,7 +460,7 @@ class FinalAnswerProcessor:
         """
         
         messages = [{"role": "user", "content": prompt}]
-        answer = self.openai_client.get_llm_response(messages)
+        answer = self.openai_client.get_llm_response(messages, route="final_answer")
         
         return {
             "answer": answer,
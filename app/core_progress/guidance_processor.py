@@ -1,23 +1,101 @@
+import os
 import datetime
 import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from db.db_manager import DatabaseManager
 from utils.utils import TableUtils
 from openai_api.openai_client import OpenAIClient
+from openai_api.model_router import model_router
 from core_progress.search_similar_question import string_similarity
+from utils.deadline import submit_with_context
+from utils.cancellation import CancelToken, cancel_scope, current_token
+
+# 推测执行：同时发起所有策略的作答，按优先顺序取第一个正确结果（默认关闭，逐个尝试）
+# 开启后延迟更低，但胜出策略之后已在进行中的调用仍会完成并计费
+GUIDANCE_SPECULATIVE = os.getenv("GUIDANCE_SPECULATIVE", "0") == "1"
+# 同时进行指导的错题数量上限
+GUIDANCE_MAX_WORKERS = int(os.getenv("GUIDANCE_MAX_WORKERS", "4"))
+
+
+class GuidanceBatch:
+    """
+    Reads and writes of one process_guidance call
+
+    Knowledge, learning and teaching records of every question are fetched up
+    front with one query each. Record changes are buffered under the same
+    method names as DatabaseManager and committed with bulk_write at the end.
+    """
+    def __init__(self, db_manager, table_ids, session_id=None):
+        self.db_manager = db_manager
+        self.session_id = session_id
+        self.knowledge = db_manager.batch_get_knowledge_by_ids(table_ids)
+        self.learning_records = db_manager.batch_get_learning_records(table_ids)
+        self.teaching_records = db_manager.batch_get_teaching_records(table_ids)
+        try:
+            self.guidance_records = db_manager.get_guidance_knowledge_with_lookup()
+        except Exception as e:
+            print(f"获取教学记录时出错: {str(e)}")
+            self.guidance_records = []
+
+        self._lock = threading.Lock()
+        self._learning_updates = []
+        self._teaching_operations = []
+
+    def add_or_update_learning_record(self, table_id, flag, **kwargs):
+        update_data = {"flag": flag}
+        update_data.update(kwargs)
+        with self._lock:
+            self._learning_updates.append((table_id, update_data))
+
+    def update_learning_record_with_rethink(self, table_id, flag, rethink_summary):
+        with self._lock:
+            self._learning_updates.append((table_id, {"flag": flag, "rethink_summary": rethink_summary}))
+
+    def update_learning_record_guidance_error_count(self, table_id, guidance_error_count):
+        with self._lock:
+            self._learning_updates.append((table_id, {"guidance_error_count": guidance_error_count}))
+
+    def add_teaching_record(self, record):
+        with self._lock:
+            self._teaching_operations.append(("insert", record.get("table_id"), record))
+
+    def update_teaching_record(self, table_id, teaching_record):
+        with self._lock:
+            self._teaching_operations.append(("update", table_id, teaching_record))
+
+    def delete_teaching_record(self, table_id):
+        with self._lock:
+            self._teaching_operations.append(("delete", table_id, None))
+
+    def commit(self):
+        """Write all buffered changes (one bulk_write per collection)"""
+        with self._lock:
+            learning_updates, self._learning_updates = self._learning_updates, []
+            teaching_operations, self._teaching_operations = self._teaching_operations, []
+        self.db_manager.bulk_update_learning_records(learning_updates)
+        self.db_manager.bulk_write_teaching_records(teaching_operations)
+
 
 class GuidancingProcessor:
     """
     Guidance answering processor, responsible for executing strategic answering process 
     when regular answering confidence is insufficient
     """
-    def __init__(self):
+    def __init__(self, speculative=GUIDANCE_SPECULATIVE, max_workers=GUIDANCE_MAX_WORKERS):
         """
         Initialize the guidance answering processor
+        
+        Args:
+            speculative (bool): Whether to try all strategies concurrently
+            max_workers (int): Maximum number of questions guided concurrently
         """
         self.db_manager = DatabaseManager()
         self.openai_client = OpenAIClient()
         self.table_utils = TableUtils()
         self.available_strategies = ["cot", "coloumn_sorting", "schema_linking"]
+        self.speculative = speculative
+        self.max_workers = max_workers
 
         self.current_session_id = None
         self.current_session_time = None
@@ -37,38 +115,47 @@ class GuidancingProcessor:
         self.current_session_id = str(uuid.uuid4())
         self.current_session_time = datetime.datetime.now()
 
-        guided_results = []
-        updated_records = []
-        
-        for table_id in need_guidance_list:
-            knowledge = self.db_manager.get_knowledge_by_id(table_id)
+        # The processor is shared by concurrent requests: reads and writes of this call stay in its own batch
+        batch = GuidanceBatch(self.db_manager, list(need_guidance_list), session_id=self.current_session_id)
+
+        def guide(table_id):
+            knowledge = batch.knowledge.get(table_id)
             
             if not knowledge:
-                guided_results.append({
+                return ({
                     "table_id": table_id,
                     "error": "Knowledge not found",
                     "is_correct": False
-                })
-                continue
-            
-            existing_learning_record = self.db_manager.get_learning_record(table_id)
+                }, None)
             
-            result, record_update = self._reteach_problem(
+            return self._reteach_problem(
                 table_id,
                 knowledge,
-                existing_learning_record
+                batch.learning_records.get(table_id),
+                batch=batch
             )
-            
-            guided_results.append(result)
-            
-            if record_update:
-                updated_records.append(record_update)
+
+        try:
+            if len(need_guidance_list) > 1 and self.max_workers > 1:
+                # Workers inherit the request's deadline and cancel token
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(need_guidance_list))) as executor:
+                    futures = [submit_with_context(executor, guide, table_id) for table_id in need_guidance_list]
+                    outcomes = [future.result() for future in futures]
+            else:
+                outcomes = [guide(table_id) for table_id in need_guidance_list]
+        finally:
+            # Questions finished before an error keep their record changes
+            batch.commit()
+
+        guided_results = [result for result, _ in outcomes]
+        updated_records = [record_update for _, record_update in outcomes if record_update]
         
         recalculated_confidence = self._recalculate_confidence(
             need_guidance_list, 
             updated_records, 
             initial_confidence, 
-            total_questions
+            total_questions,
+            batch.learning_records
         )
         
         return {
@@ -78,7 +165,7 @@ class GuidancingProcessor:
             "recalculated_confidence": recalculated_confidence,
         }
       
-    def _reteach_problem(self, table_id, knowledge, existing_learning_record):
+    def _reteach_problem(self, table_id, knowledge, existing_learning_record, batch=None):
         """
         Re-teach a specific problem
         
@@ -86,6 +173,7 @@ class GuidancingProcessor:
             table_id (str): Table ID
             knowledge (dict): Problem record from knowledge base
             existing_learning_record (dict): Existing learning record (may be None)
+            batch (GuidanceBatch): Reads and writes of the calling process_guidance (None: database directly)
             
         Returns:
             tuple: (result dictionary, record update information)
@@ -96,33 +184,79 @@ class GuidancingProcessor:
         existing_rethink_summary = existing_learning_record.get("rethink_summary", "") if existing_learning_record else ""
         guidance_error_count = existing_learning_record.get("guidance_error_count", 0) if existing_learning_record else 0
         
-        optimal_strategy = self.find_optimal_strategy(table_id)
-        result = self._try_single_strategy(table_id, knowledge, optimal_strategy)
+        optimal_strategy = self.find_optimal_strategy(table_id, batch=batch)
+        strategies = [optimal_strategy] + [s for s in self.available_strategies if s != optimal_strategy]
         
-        if result["is_correct"]:
+        if self.speculative:
+            strategy, result = self._try_strategies_speculatively(table_id, knowledge, strategies)
+        else:
+            strategy, result = None, None
+            for candidate in strategies:
+                result = self._try_single_strategy(table_id, knowledge, candidate)
+                if result["is_correct"]:
+                    strategy = candidate
+                    break
+        
+        if strategy is not None:
             return self._handle_success_case(
-                table_id, knowledge, optimal_strategy, result, 
-                existing_flag, existing_rethink_summary
+                table_id, knowledge, strategy, result,
+                existing_flag, existing_rethink_summary, batch=batch
             )
         
-        for strategy in self.available_strategies:
-            if strategy == optimal_strategy:
-                continue
-                
-            result = self._try_single_strategy(table_id, knowledge, strategy)
-            
-            if result["is_correct"]:
-                return self._handle_success_case(
-                    table_id, knowledge, strategy, result,
-                    existing_flag, existing_rethink_summary
-                )
-        
         return self._handle_failure_case(
             table_id, knowledge, true_answer, result["model_answer"],
-            existing_flag, existing_rethink_summary, guidance_error_count
+            existing_flag, existing_rethink_summary, guidance_error_count, batch=batch
         )
     
-    def _handle_success_case(self, table_id, knowledge, strategy, result, existing_flag, existing_rethink_summary):
+    def _try_strategies_speculatively(self, table_id, knowledge, strategies):
+        """
+        Try all strategies concurrently and keep the first correct one in preference order
+        
+        A later strategy only wins once every strategy before it has answered
+        incorrectly, so the outcome matches trying them one after another.
+        Once the winner is known the remaining strategies are cancelled through
+        their own CancelToken: calls not yet sent to the model are skipped, a call
+        already in flight finishes and is discarded.
+        
+        Args:
+            table_id (str): Table ID
+            knowledge (dict): Knowledge entry
+            strategies (list): Strategies in preference order
+            
+        Returns:
+            tuple: (winning strategy or None, its result or the last strategy's result)
+        """
+        def attempt(strategy, token):
+            with cancel_scope(token):
+                return self._try_single_strategy(table_id, knowledge, strategy)
+
+        # One child token per strategy: losers stop without cancelling the request
+        tokens = [CancelToken(parent=current_token()) for _ in strategies]
+        executor = ThreadPoolExecutor(max_workers=len(strategies))
+        futures = []
+        try:
+            futures = [
+                submit_with_context(executor, attempt, strategy, token)
+                for strategy, token in zip(strategies, tokens)
+            ]
+            result = None
+            for strategy, future in zip(strategies, futures):
+                result = future.result()
+                if result["is_correct"]:
+                    return strategy, result
+            return None, result
+        finally:
+            for token, future in zip(tokens, futures):
+                if not future.done():
+                    token.cancel("guidance strategy no longer needed")
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _writer(self, batch):
+        """Buffered writes of a process_guidance call, direct database writes otherwise"""
+        return batch if batch is not None else self.db_manager
+    
+    def _handle_success_case(self, table_id, knowledge, strategy, result, existing_flag, existing_rethink_summary,
+                             batch=None):
         """
         Handle successful guidance cases
         
@@ -133,11 +267,15 @@ class GuidancingProcessor:
             result (dict): Answer result
             existing_flag (int): Existing flag value
             existing_rethink_summary (str): Existing reflection summary
+            batch (GuidanceBatch): Reads and writes of the calling process_guidance (None: database directly)
                 
         Returns:
             tuple: (result dictionary, record update information)
         """
-        existing_teaching_record = self.db_manager.get_teaching_record(table_id)
+        if batch is not None:
+            existing_teaching_record = batch.teaching_records.get(table_id)
+        else:
+            existing_teaching_record = self.db_manager.get_teaching_record(table_id)
         existing_strategy = existing_teaching_record.get("strategy_type", "") if existing_teaching_record else ""
         
         need_update = True
@@ -178,19 +316,19 @@ class GuidancingProcessor:
             if existing_flag == 2 or existing_flag == 3 or existing_flag is None:
                 update_data["first_answer_time"] = datetime.datetime.now()
            
-            self.db_manager.add_or_update_learning_record(table_id, 1, **update_data)
+            self._writer(batch).add_or_update_learning_record(table_id, 1, **update_data)
             
             teaching_record = {
                 "table_id": table_id,
                 "strategy_type": strategy,
-                "session_id": self.current_session_id,
+                "session_id": batch.session_id if batch is not None else self.current_session_id,
                 "created_at": datetime.datetime.now(),
             }
             
             if existing_teaching_record:
-                self.db_manager.update_teaching_record(table_id, teaching_record)
+                self._writer(batch).update_teaching_record(table_id, teaching_record)
             else:
-                self.db_manager.add_teaching_record(teaching_record)
+                self._writer(batch).add_teaching_record(teaching_record)
             
             result["rethink_summary"] = rethink_summary
             result["strategy_type"] = strategy
@@ -200,7 +338,8 @@ class GuidancingProcessor:
         
         return (result, None)
     
-    def _handle_failure_case(self, table_id, knowledge, true_answer, model_answer, existing_flag, existing_rethink_summary, guidance_error_count):
+    def _handle_failure_case(self, table_id, knowledge, true_answer, model_answer, existing_flag, existing_rethink_summary, guidance_error_count,
+                             batch=None):
         """
         Handle guidance failure cases
         
@@ -212,6 +351,7 @@ class GuidancingProcessor:
             existing_flag (int): Existing flag value
             existing_rethink_summary (str): Existing reflection summary
             guidance_error_count (int): Number of guidance errors
+            batch (GuidanceBatch): Reads and writes of the calling process_guidance (None: database directly)
             
         Returns:
             tuple: (result dictionary, record update information)
@@ -239,9 +379,9 @@ class GuidancingProcessor:
                     model_answer
                 )
                 
-                self.db_manager.update_learning_record_with_rethink(table_id, 2, error_summary)
+                self._writer(batch).update_learning_record_with_rethink(table_id, 2, error_summary)
                 
-                self.db_manager.delete_teaching_record(table_id)
+                self._writer(batch).delete_teaching_record(table_id)
                 
                 return ({
                     "table_id": table_id,
@@ -254,7 +394,7 @@ class GuidancingProcessor:
                     "guidance_error_count": new_guidance_error_count
                 }, {"table_id": table_id, "flag": 2})
             else:
-                self.db_manager.update_learning_record_guidance_error_count(table_id, new_guidance_error_count)
+                self._writer(batch).update_learning_record_guidance_error_count(table_id, new_guidance_error_count)
                 
                 return ({
                     "table_id": table_id,
@@ -275,7 +415,7 @@ class GuidancingProcessor:
                 model_answer
             )
             
-            self.db_manager.update_learning_record_with_rethink(table_id, 2, error_summary)
+            self._writer(batch).update_learning_record_with_rethink(table_id, 2, error_summary)
             
             return ({
                 "table_id": table_id,
@@ -309,9 +449,10 @@ class GuidancingProcessor:
         )
         
         messages = [{"role": "user", "content": prompt}]
-        model_answer = self.openai_client.get_llm_response(messages)
+        model_answer = self.openai_client.get_practice_response(messages)
         
         is_correct = self.table_utils.is_answer_correct(model_answer, true_answer)
+        model_router.record_outcome("practice", is_correct)
         
         return {
             "table_id": table_id,
@@ -321,7 +462,7 @@ class GuidancingProcessor:
             "true_answer": true_answer
         }
     
-    def find_optimal_strategy(self, table_id):
+    def find_optimal_strategy(self, table_id, batch=None):
         """
         Find optimal strategy for current problem
         
@@ -333,19 +474,26 @@ class GuidancingProcessor:
         
         Args:
             table_id (str): Table ID
+            batch (GuidanceBatch): Prefetched reads of the calling process_guidance (None: database directly)
                 
         Returns:
             str: Optimal strategy type
         """
         try:
-            current_knowledge = self.db_manager.get_knowledge_by_id(table_id)
+            if batch is not None and table_id in batch.knowledge:
+                current_knowledge = batch.knowledge[table_id]
+            else:
+                current_knowledge = self.db_manager.get_knowledge_by_id(table_id)
             if not current_knowledge or "question" not in current_knowledge:
                 print(f"未找到表格 {table_id} 的问题内容")
                 return "cot"
             
             current_question = current_knowledge["question"]
             
-            guidance_records = self.db_manager.get_guidance_knowledge_with_lookup()
+            if batch is not None:
+                guidance_records = batch.guidance_records
+            else:
+                guidance_records = self.db_manager.get_guidance_knowledge_with_lookup()
             if not guidance_records:
                 print("未找到教学记录")
                 return "cot"
@@ -540,7 +688,7 @@ class GuidancingProcessor:
         Format your response as a structured self-reflection with the three sections clearly separated and labeled.
         """
         messages = [{"role": "user", "content": prompt}]
-        student_reflection = self.openai_client.get_llm_response(messages)
+        student_reflection = self.openai_client.get_llm_response(messages, route="reflection")
         
         return student_reflection
     
@@ -598,11 +746,12 @@ class GuidancingProcessor:
         """
         
         messages = [{"role": "user", "content": prompt}]
-        error_summary = self.openai_client.get_llm_response(messages)
+        error_summary = self.openai_client.get_llm_response(messages, route="error_summary")
         
         return error_summary  
     
-    def _recalculate_confidence(self, need_guidance_list, updated_records, initial_confidence=0.0, total_questions=0):
+    def _recalculate_confidence(self, need_guidance_list, updated_records, initial_confidence=0.0, total_questions=0,
+                                learning_records=None):
         """
         Recalculate confidence (based on two rounds of Q&A results)
         
@@ -611,6 +760,8 @@ class GuidancingProcessor:
             updated_records (list): Records updated after guidance answering
             initial_confidence (float): Confidence from the first round of Q&A
             total_questions (int): Total number of questions from the first round of Q&A
+            learning_records (dict): Prefetched learning records by table_id; flags of
+                records not in updated_records are not changed by guidance
             
         Returns:
             float: Recalculated confidence
@@ -630,7 +781,10 @@ class GuidancingProcessor:
                 elif updated_map[table_id] == 1:
                     new_flag_0_count += 1
             else:
-                record = self.db_manager.get_learning_record(table_id)
+                if learning_records is not None:
+                    record = learning_records.get(table_id)
+                else:
+                    record = self.db_manager.get_learning_record(table_id)
                 if record and record.get("flag") == 0:
                     new_flag_0_count += 1
         
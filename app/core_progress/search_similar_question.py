@@ -4,6 +4,11 @@ import numpy as np
 from db.db_manager import DatabaseManager
 from core_progress.bm25_searcher import BM25Searcher
 
+# Without a skeleton embedding the lexical rank stands in for the semantic score. It is
+# scaled into [0, 0.5] so the total stays well below the embedding-scale thresholds that
+# trust a neighbour (e.g. the agent fast path at 0.9): the order is kept, not the confidence.
+RANK_SCORE_SCALE = 0.5
+
 def string_similarity(a: str, b: str) -> float:
 
     return SequenceMatcher(None, a, b).ratio()
@@ -165,6 +170,10 @@ def match_byTableStructure(string_results, table_structure, top_n):
         df["similarity_byTableStructure"] = df["table_structure"].apply(
             lambda x: string_similarity(str(x), str(table_structure)) if x else 0
         )
+        if "similarity_bySkeleton" not in df.columns:
+            # No skeleton embedding (embedding service down): score by the incoming lexical rank instead
+            df["similarity_bySkeleton"] = RANK_SCORE_SCALE * (1 - np.arange(len(df)) / len(df))
+        df["similarity_bySkeleton"] = df["similarity_bySkeleton"].fillna(0)
         
         # Weights: 0.9 for Semantic Embedding, 0.1 for Table Structure
         w_skeleton = 0.9
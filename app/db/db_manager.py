@@ -1,4 +1,4 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne, InsertOne, DeleteOne
 from dotenv import load_dotenv
 from datetime import datetime
 import os
@@ -41,7 +41,15 @@ class DatabaseManager:
         self.result_cache_col = self.db["ResultCache"]
         self.multi_turn_sessions = self.db["MultiTurnSessions"]
         
+        # Header -> column type prediction cache
+        self.column_type_cache = self.db["ColumnTypeCache"]
+        # Content-addressed LLM completion cache
+        self.llm_response_cache = self.db["LLMResponseCache"]
+        # RouterAgent LLM decisions, training data for the local intent classifier
+        self.router_decisions = self.db["RouterDecisions"]
+        
         self._ensure_text_index()
+        self._ensure_cache_indexes()
         
         self._initialized = True
     
@@ -59,6 +67,23 @@ class DatabaseManager:
         except Exception as e:
             print(f"⚠️ Index check failed: {str(e)}")
     
+    def _ensure_cache_indexes(self):
+        try:
+            self.column_type_cache.create_index(
+                [("key", 1), ("model_version", 1)], name="key_model_version", unique=True
+            )
+            # Rows of model versions no worker uses any more age out instead of being purged,
+            # so workers on different weights (rolling deploy, fp32 / int8) keep each other's rows
+            column_type_ttl = int(os.environ.get("COLUMN_TYPE_CACHE_TTL", str(30 * 24 * 3600)))
+            self.column_type_cache.create_index(
+                [("updated_at", 1)], name="updated_at_ttl", expireAfterSeconds=column_type_ttl
+            )
+            self.llm_response_cache.create_index([("key", 1)], name="key", unique=True)
+            self.llm_response_cache.create_index([("expires_at", 1)], name="expires_at_ttl", expireAfterSeconds=0)
+            self.router_decisions.create_index([("created_at", -1)], name="created_at")
+        except Exception as e:
+            print(f"⚠️ Cache index check failed: {str(e)}")
+    
     def get_knowledge_by_id(self, table_id):
         """
         Get knowledge entry by specified ID
@@ -101,6 +126,25 @@ class DatabaseManager:
         }
         return self.learning_records.insert_one(record)
     
+    def bulk_add_learning_records(self, flags_by_id):
+        """
+        Add several learning records in one round trip
+        
+        Args:
+            flags_by_id: List of (table_id, flag) pairs
+            
+        Returns:
+            pymongo.results.InsertManyResult: Insert result (None if nothing to insert)
+        """
+        if not flags_by_id:
+            return None
+        now = datetime.now()
+        records = [
+            {"table_id": table_id, "flag": flag, "first_answer_time": now}
+            for table_id, flag in flags_by_id
+        ]
+        return self.learning_records.insert_many(records, ordered=False)
+    
     def update_learning_record_flag(self, table_id, flag):
         """
         Update learning record flag
@@ -323,6 +367,79 @@ class DatabaseManager:
         
         return {record["table_id"]: record for record in records}
     
+    def batch_get_knowledge_by_ids(self, table_ids):
+        """
+        Batch get knowledge entries
+        
+        Args:
+            table_ids: List of table IDs
+            
+        Returns:
+            dict: Dictionary of knowledge entries with table_id as key
+        """
+        if not table_ids:
+            return {}
+        
+        cursor = self.knowledge_db.find({"table_id": {"$in": list(table_ids)}})
+        return {record["table_id"]: record for record in cursor}
+    
+    def batch_get_teaching_records(self, table_ids):
+        """
+        Batch get teaching records
+        
+        Args:
+            table_ids: List of table IDs
+            
+        Returns:
+            dict: Dictionary of teaching records with table_id as key
+        """
+        if not table_ids:
+            return {}
+        
+        cursor = self.teaching_records.find({"table_id": {"$in": list(table_ids)}})
+        return {record["table_id"]: record for record in cursor}
+    
+    def bulk_update_learning_records(self, updates):
+        """
+        Upsert fields of several learning records in one round trip
+        
+        Args:
+            updates: List of (table_id, fields) pairs, applied with $set
+            
+        Returns:
+            pymongo.results.BulkWriteResult: Write result (None if nothing to write)
+        """
+        if not updates:
+            return None
+        operations = [
+            UpdateOne({"table_id": table_id}, {"$set": fields}, upsert=True)
+            for table_id, fields in updates
+        ]
+        return self.learning_records.bulk_write(operations)
+    
+    def bulk_write_teaching_records(self, operations):
+        """
+        Apply several teaching record changes in one round trip
+        
+        Args:
+            operations: List of (action, table_id, record) tuples where action is
+                "insert", "update" (upsert with $set) or "delete"
+            
+        Returns:
+            pymongo.results.BulkWriteResult: Write result (None if nothing to write)
+        """
+        requests = []
+        for action, table_id, record in operations:
+            if action == "insert":
+                requests.append(InsertOne(record))
+            elif action == "update":
+                requests.append(UpdateOne({"table_id": table_id}, {"$set": record}, upsert=True))
+            elif action == "delete":
+                requests.append(DeleteOne({"table_id": table_id}))
+        if not requests:
+            return None
+        return self.teaching_records.bulk_write(requests)
+    
     def get_teaching_records_with_strategy(self, strategy_type=None):
         """
         Get teaching records (can be filtered by strategy type)
@@ -517,6 +634,85 @@ class DatabaseManager:
         record = self.result_cache_col.find_one({"session_id": session_id})
         return record["data"] if record else None
 
+    # --- Column Type Cache ---
+    def batch_get_column_types(self, keys, model_version):
+        """
+        Batch get cached column types for formatted headers
+        
+        Args:
+            keys: List of formatted header strings, e.g. 'Year("2001")'
+            model_version: Version of the column type model
+            
+        Returns:
+            dict: Dictionary of column types with header key as key
+        """
+        if not keys:
+            return {}
+        cursor = self.column_type_cache.find(
+            {"key": {"$in": keys}, "model_version": model_version},
+            {"key": 1, "column_type": 1, "_id": 0}
+        )
+        return {record["key"]: record["column_type"] for record in cursor}
+
+    def save_column_types(self, column_types, model_version):
+        """
+        Upsert predicted column types in one bulk write
+        
+        Args:
+            column_types: Dictionary of column types with header key as key
+            model_version: Version of the column type model
+        """
+        if not column_types:
+            return None
+        # Naive UTC, as the TTL index on updated_at expects
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {"key": key, "model_version": model_version},
+                {"$set": {"column_type": column_type, "updated_at": now}},
+                upsert=True
+            )
+            for key, column_type in column_types.items()
+        ]
+        return self.column_type_cache.bulk_write(operations, ordered=False)
+
+    # --- LLM Response Cache ---
+    def get_llm_cache_entry(self, key):
+        """Get a cached LLM completion by its content hash."""
+        return self.llm_response_cache.find_one({"key": key}, {"_id": 0, "response": 1, "expires_at": 1})
+
+    def save_llm_cache_entry(self, key, model, response, expires_at):
+        """
+        Upsert a cached LLM completion
+        
+        Args:
+            key: sha256 of model, canonical messages and temperature
+            model: Model name
+            response: Completion text
+            expires_at: Naive UTC datetime; MongoDB's TTL monitor removes the entry after it
+        """
+        return self.llm_response_cache.update_one(
+            {"key": key},
+            {"$set": {"model": model, "response": response, "expires_at": expires_at}},
+            upsert=True
+        )
+
+    # --- Router Decisions ---
+    def log_router_decision(self, user_input, plan, has_cached_data, has_history, model):
+        """Store one LLM routing decision (user input -> plan) for training the intent classifier."""
+        return self.router_decisions.insert_one({
+            "user_input": user_input,
+            "plan": plan,
+            "has_cached_data": has_cached_data,
+            "has_history": has_history,
+            "model": model,
+            "created_at": datetime.now()
+        })
+
+    def get_router_decisions(self, limit=20000):
+        """Most recent logged routing decisions, newest first."""
+        return list(self.router_decisions.find({}, {"_id": 0}).sort("created_at", -1).limit(limit))
+
     # --- Multi-turn Session Context ---
     def get_session_context(self, conversation_id: str) -> Dict[str, Any]:
         """Retrieve multi-turn context (table_hash, history, etc.)."""
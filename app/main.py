@@ -11,6 +11,12 @@ from backend_api.chat_history_api import router as chat_history_router
 from backend_api.chat_api import router as chat_router
 from contextlib import asynccontextmanager
 from mcp_client.connection import load_mcp_config, load_all_tools
+from utils.table_structure_extract import get_column_type_cache_stats
+from utils.resilient_client import get_dependency_stats
+from openai_api.openai_client import get_llm_stats
+from openai_api.llm_cache import get_llm_cache_stats
+from openai_api.model_router import get_route_stats
+from utils.warmup import start_warmup, warmup_state
 
 import uvicorn
 import logging
@@ -25,9 +31,12 @@ async def lifespan(app: FastAPI):
     # 启动时执行
     load_mcp_config()
     await load_all_tools()
+    # 后台预热重量级资源，完成前 /ready 返回 503
+    warmup_task = start_warmup()
     yield
     # 关闭时执行
-    pass
+    if warmup_task and not warmup_task.done():
+        warmup_task.cancel()
 
 # 创建FastAPI应用实例
 app = FastAPI(
@@ -75,12 +84,24 @@ async def health_check():
         # 这里可以添加数据库连接检查等
         return {
             "status": "healthy",
-            "message": "服务运行正常"
+            "message": "服务运行正常",
+            "column_type_cache": get_column_type_cache_stats(),
+            "dependencies": get_dependency_stats(),
+            "llm": get_llm_stats(),
+            "llm_routes": get_route_stats(),
+            "llm_cache": get_llm_cache_stats()
         }
     except Exception as e:
         logger.error(f"健康检查失败: {str(e)}")
         raise HTTPException(status_code=500, detail="服务异常")
 
+@app.get("/ready")
+async def readiness_check():
+    """就绪检查接口：预热完成前返回 503"""
+    if not warmup_state.ready:
+        raise HTTPException(status_code=503, detail=warmup_state.to_dict())
+    return warmup_state.to_dict()
+
 if __name__ == "__main__":
     # 启动服务器
     uvicorn.run(
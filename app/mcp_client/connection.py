@@ -11,6 +11,8 @@ from mcp.client.session import ClientSession
 from mcp.types import Tool, TextContent
 from fastapi import HTTPException
 
+from utils.resilient_client import CircuitOpenError, get_dependency
+
 # 加载环境变量
 load_dotenv()
 
@@ -18,6 +20,23 @@ logger = logging.getLogger(__name__)
 
 # MCP 配置
 MCP_CONFIG_PATH = os.getenv("MCP_CONFIG_PATH", "./mcp_client/mcp.json")
+# 按工具的调用超时（秒），例如 "generate_chart=120,create_document=600"；未列出的工具使用 MCP_TIMEOUT（默认 300）
+MCP_TOOL_TIMEOUTS = os.getenv("MCP_TOOL_TIMEOUTS", "")
+
+
+def _parse_tool_timeouts(spec: str) -> Dict[str, float]:
+    timeouts = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, seconds = item.rsplit("=", 1)
+            try:
+                timeouts[name.strip()] = float(seconds)
+            except ValueError:
+                logger.warning(f"忽略无效的 MCP_TOOL_TIMEOUTS 配置项: {item}")
+    return timeouts
+
+
+tool_timeouts: Dict[str, float] = _parse_tool_timeouts(MCP_TOOL_TIMEOUTS)
 
 class MCPServerConfig(BaseModel):
     name: str
@@ -99,36 +118,62 @@ def toggle_tool(tool_name: str, enable: bool) -> bool:
 def get_enabled_tools() -> List[MCPToolInfo]:
     return [t for t in all_tools if t.enabled]
 
+def _server_dependency(server_name: str):
+    # 每个 MCP 服务器独立熔断，超时与重试策略共用 MCP_* 环境变量
+    return get_dependency(f"mcp:{server_name}")
+
+def _open_session(config: MCPServerConfig):
+    # 连接与 SSE 读超时保持 mcp 库默认值，整体调用时长由 dependency.acall 控制
+    return sse_client(config.url)
+
 async def get_tools_from_server(name: str, config: MCPServerConfig) -> List[MCPToolInfo]:
     """
     从 MCP 服务器获取工具
     """
-    async with sse_client(config.url) as (read, write):
-        async with ClientSession(read, write) as session:
-            await session.initialize()
-            tools_result = await session.list_tools()
-            return [tool_to_info(name, t) for t in tools_result.tools]
+    dependency = _server_dependency(name)
+
+    async def list_tools():
+        async with _open_session(config) as (read, write):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                return await session.list_tools()
+
+    tools_result = await dependency.acall(list_tools)
+    return [tool_to_info(name, t) for t in tools_result.tools]
 
 async def load_all_tools():
     """
-    加载所有工具
+    加载所有工具，单个服务器不可用时跳过，不影响其他服务器
     """
     global all_tools
     all_tools.clear()
-    tasks = [get_tools_from_server(name, config) for name, config in mcp_servers.items()]
-    results = await asyncio.gather(*tasks)
-    for tool_list in results:
+    names = list(mcp_servers.keys())
+    tasks = [get_tools_from_server(name, mcp_servers[name]) for name in names]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    for name, tool_list in zip(names, results):
+        if isinstance(tool_list, BaseException):
+            logger.warning(f"加载 MCP 服务器 {name} 的工具失败: {tool_list}")
+            continue
         all_tools.extend(tool_list)
 
 async def call_tool(server_name: str, tool_name: str, arguments: Dict[str, Any]) -> Any:
     config = mcp_servers.get(server_name)
     if not config:
         raise HTTPException(status_code=404, detail=f"服务器 {server_name} 不存在")
-    async with sse_client(config.url) as (read, write):
-        async with ClientSession(read, write) as session:
-            await session.initialize()
-            result = await session.call_tool(tool_name, arguments)
-            return result
+    dependency = _server_dependency(server_name)
+
+    async def invoke():
+        async with _open_session(config) as (read, write):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                return await session.call_tool(tool_name, arguments)
+
+    try:
+        return await dependency.acall(invoke, timeout=tool_timeouts.get(tool_name))
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=f"服务器 {server_name} 暂不可用: {e}")
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"服务器 {server_name} 调用超时")
 
 def extract_text_content(content_list: List[Any]) -> str:
     text_parts: List[str] = []
@@ -0,0 +1,280 @@
+"""
+Content-addressed cache of LLM completions
+
+Practice prompts for the same knowledge entry and strategy are identical
+across users, so low-temperature completions for them can be reused. Keys are
+sha256(model, canonicalized messages, temperature). Lookups go through:
+  1. an in-process LRU with TTL
+  2. a MongoDB collection with a TTL index (shared by all workers)
+  3. single-flight: concurrent identical calls wait for the one in flight
+
+A waiting call still honours its own request deadline and cancel token. When
+the call in flight is abandoned by its own request (cancelled, past its
+deadline), a waiting call takes over instead of inheriting that failure.
+
+Caching is opt-in per call site (OpenAIClient.get_practice_response) and is
+skipped for temperatures above LLM_CACHE_MAX_TEMPERATURE. Practice calls keep
+their 0.5 default, so the cache only takes effect once LLM_PRACTICE_TEMPERATURE
+is lowered.
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+import datetime
+from collections import OrderedDict
+from concurrent.futures import Future, wait
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from utils.cancellation import RunCancelled, check_cancelled
+from utils.deadline import DeadlineExceeded, remaining
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") != "0"
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "2048"))
+# Seconds an entry stays valid (both tiers)
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+# Set to "0" to keep the cache in memory only
+LLM_CACHE_PERSIST = os.getenv("LLM_CACHE_PERSIST", "1") != "0"
+LLM_CACHE_MAX_TEMPERATURE = float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0.2"))
+# How often a call waiting on an identical one re-checks its own deadline and cancel token
+_FOLLOWER_POLL_SECONDS = 0.5
+# Result handed to waiting calls when the leader gave up for reasons of its own request
+_RETRY = object()
+
+
+def _request_scoped(error: BaseException) -> bool:
+    """Whether the leader failed because of its own request (cancelled, deadline) rather than the completion."""
+    if not isinstance(error, Exception) or isinstance(error, (RunCancelled, TimeoutError)):
+        return True
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def _wait_budget() -> float:
+    """Seconds a follower may wait before re-checking; raises once its own request is over."""
+    check_cancelled()
+    left = remaining()
+    if left is None:
+        return _FOLLOWER_POLL_SECONDS
+    if left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded while waiting for an identical LLM call")
+    return min(_FOLLOWER_POLL_SECONDS, left)
+
+
+def _canonical_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    canonical = {}
+    for key, value in message.items():
+        if value is None:
+            continue
+        if isinstance(value, str):
+            value = value.replace("\r\n", "\n").strip()
+        canonical[key] = value
+    return canonical
+
+
+def cache_key(model: str, messages: List[Dict[str, Any]], temperature: float) -> str:
+    payload = json.dumps(
+        {
+            "model": model,
+            "messages": [_canonical_message(m) for m in messages],
+            "temperature": round(float(temperature), 4),
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    def __init__(self, max_size=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL, persistent=LLM_CACHE_PERSIST,
+                 max_temperature=LLM_CACHE_MAX_TEMPERATURE, enabled=LLM_CACHE_ENABLED):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.persistent = persistent
+        self.max_temperature = max_temperature
+        self.enabled = enabled
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "persistent_hits": 0, "shared_inflight": 0, "misses": 0, "bypassed": 0}
+
+    def _db(self):
+        from db.db_manager import DatabaseManager
+        return DatabaseManager()
+
+    def cacheable(self, temperature: float) -> bool:
+        return self.enabled and temperature <= self.max_temperature
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    # ── Tiers ────────────────────────────────────────────────────────────────
+    def _memory_get(self, key: str) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _remember(self, key: str, value: str, expires_at: float):
+        with self._lock:
+            self._memory[key] = (expires_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_size:
+                self._memory.popitem(last=False)
+
+    def _persistent_get(self, key: str) -> Optional[str]:
+        if not self.persistent:
+            return None
+        try:
+            entry = self._db().get_llm_cache_entry(key)
+        except Exception as e:
+            logger.warning(f"LLM cache lookup failed: {e}")
+            return None
+        if not entry:
+            return None
+        expires_at = entry["expires_at"].replace(tzinfo=datetime.timezone.utc).timestamp()
+        # The TTL monitor runs about once a minute, so check expiry here too
+        if expires_at < time.time():
+            return None
+        self._remember(key, entry["response"], expires_at)
+        return entry["response"]
+
+    def _store(self, key: str, model: str, value: str):
+        expires_at = time.time() + self.ttl
+        self._remember(key, value, expires_at)
+        if self.persistent:
+            try:
+                self._db().save_llm_cache_entry(
+                    key, model, value,
+                    datetime.datetime.fromtimestamp(expires_at, datetime.timezone.utc).replace(tzinfo=None),
+                )
+            except Exception as e:
+                logger.warning(f"LLM cache write failed: {e}")
+
+    # ── Single-flight ────────────────────────────────────────────────────────
+    def _claim(self, key: str):
+        """Return (cached_value, future, is_leader)."""
+        with self._lock:
+            value = self._memory_get(key)
+            if value is not None:
+                self._stats["memory_hits"] += 1
+                return value, None, False
+            future = self._inflight.get(key)
+            if future is not None:
+                self._stats["shared_inflight"] += 1
+                return None, future, False
+            future = Future()
+            self._inflight[key] = future
+            return None, future, True
+
+    def _release(self, key: str, future: Future, value=None, error: Optional[BaseException] = None):
+        with self._lock:
+            self._inflight.pop(key, None)
+        if error is None:
+            future.set_result(value)
+        elif _request_scoped(error):
+            # Not a failure of the completion: a waiting call retries and becomes the new leader
+            future.set_result(_RETRY)
+        else:
+            future.set_exception(error)
+
+    def _follow(self, future: Future):
+        while True:
+            done, _ = wait([future], timeout=_wait_budget())
+            if done:
+                return future.result()
+
+    async def _afollow(self, future: Future):
+        # asyncio.wait never cancels the shared future, so one follower giving up does not affect the others
+        waiter = asyncio.wrap_future(future)
+        while True:
+            done, _ = await asyncio.wait({waiter}, timeout=_wait_budget())
+            if done:
+                return waiter.result()
+
+    def get_or_compute(self, model: str, messages, temperature: float, compute: Callable[[], str]) -> str:
+        if not self.cacheable(temperature):
+            self._count("bypassed")
+            return compute()
+        key = cache_key(model, messages, temperature)
+        while True:
+            value, future, leader = self._claim(key)
+            if value is not None:
+                return value
+            if leader:
+                break
+            value = self._follow(future)
+            if value is not _RETRY:
+                return value
+        try:
+            value = self._persistent_get(key)
+            if value is not None:
+                self._count("persistent_hits")
+            else:
+                self._count("misses")
+                value = compute()
+                if value:
+                    self._store(key, model, value)
+        except BaseException as e:
+            self._release(key, future, error=e)
+            raise
+        self._release(key, future, value)
+        return value
+
+    async def aget_or_compute(self, model: str, messages, temperature: float,
+                              compute: Callable[[], Awaitable[str]]) -> str:
+        if not self.cacheable(temperature):
+            self._count("bypassed")
+            return await compute()
+        key = cache_key(model, messages, temperature)
+        while True:
+            value, future, leader = self._claim(key)
+            if value is not None:
+                return value
+            if leader:
+                break
+            value = await self._afollow(future)
+            if value is not _RETRY:
+                return value
+        try:
+            value = await asyncio.to_thread(self._persistent_get, key)
+            if value is not None:
+                self._count("persistent_hits")
+            else:
+                self._count("misses")
+                value = await compute()
+                if value:
+                    await asyncio.to_thread(self._store, key, model, value)
+        except BaseException as e:
+            self._release(key, future, error=e)
+            raise
+        self._release(key, future, value)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._memory)
+            stats["inflight"] = len(self._inflight)
+        lookups = stats["memory_hits"] + stats["persistent_hits"] + stats["shared_inflight"] + stats["misses"]
+        stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+
+llm_response_cache = LLMResponseCache()
+
+
+def get_llm_cache_stats() -> Dict[str, Any]:
+    return llm_response_cache.stats()
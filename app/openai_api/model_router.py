@@ -0,0 +1,148 @@
+"""
+Per-call-site model routing
+
+Every LLM call names the route it belongs to. A route resolves to a model and
+an optional output-token limit, so high-volume calls (practice attempts,
+reflections) can go to a small fast model while the agent loop and final
+answers keep the main one:
+
+  LLM_ROUTE_MODELS="practice=gpt-4o-mini,reflection=gpt-4o-mini,error_summary=gpt-4o-mini"
+  LLM_ROUTE_MAX_TOKENS="practice=1024,reflection=800"
+
+Routes used in the code base:
+  - agent           decision steps of the TableSage agent loop
+  - final_answer    completions that must produce the answer (agent fast path /
+                    forced answer, core_progress final answers)
+  - practice        knowledge-base practice attempts
+  - reflection      student reflections after a successful strategy
+  - error_summary   error summaries / reflections after wrong answers
+  - report_summary  executive summary of the chat report
+
+Unlisted routes use LLM_MODEL and the caller's default max_tokens; a model
+passed explicitly by the caller wins over the route's model. Per route and
+model the router keeps call latency, errors and, where the caller can judge
+the answer, accuracy (see record_outcome), exposed by /health.
+"""
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, NamedTuple, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
+# 按调用点选择模型，例如 "practice=gpt-4o-mini,reflection=gpt-4o-mini"；未列出的路由使用 LLM_MODEL
+LLM_ROUTE_MODELS = os.getenv("LLM_ROUTE_MODELS", "")
+# 按调用点限制输出 token 数，例如 "practice=1024,reflection=800"；未列出的路由使用调用方的默认值
+LLM_ROUTE_MAX_TOKENS = os.getenv("LLM_ROUTE_MAX_TOKENS", "")
+
+ROUTES = ("agent", "final_answer", "practice", "reflection", "error_summary", "report_summary")
+DEFAULT_ROUTE = "default"
+
+
+class Route(NamedTuple):
+    name: str
+    model: str
+    max_tokens: Optional[int]
+
+
+def _parse_spec(spec: str) -> Dict[str, str]:
+    values = {}
+    for item in spec.split(","):
+        if "=" in item:
+            route, value = item.split("=", 1)
+            route, value = route.strip(), value.strip()
+            if route not in ROUTES:
+                logger.warning(f"[ModelRouter] Unknown route '{route}' in route config (known: {', '.join(ROUTES)})")
+            values[route] = value
+    return values
+
+
+class ModelRouter:
+    """Resolves call sites to models and keeps latency / accuracy statistics per route."""
+
+    def __init__(self, models: Optional[Dict[str, str]] = None, max_tokens: Optional[Dict[str, int]] = None,
+                 default_model: str = LLM_MODEL):
+        self.models = models if models is not None else _parse_spec(LLM_ROUTE_MODELS)
+        self.max_tokens = max_tokens if max_tokens is not None else {
+            route: int(value) for route, value in _parse_spec(LLM_ROUTE_MAX_TOKENS).items()
+        }
+        self.default_model = default_model
+        self._lock = threading.Lock()
+        self._stats: Dict[tuple, Dict[str, float]] = {}
+
+    def route(self, name: Optional[str] = None, model: Optional[str] = None) -> Route:
+        """
+        Resolve a call site.
+
+        Args:
+            name: Route name (see ROUTES); None for calls that belong to no route.
+            model: Model chosen explicitly by the caller; overrides the route's model.
+
+        Returns:
+            Route(name, model, max_tokens); max_tokens is None when the route sets no limit.
+        """
+        name = name or DEFAULT_ROUTE
+        return Route(name, model or self.models.get(name) or self.default_model, self.max_tokens.get(name))
+
+    # ── Statistics ───────────────────────────────────────────────────────────
+    def _entry(self, route_name: str, model: str) -> Dict[str, float]:
+        return self._stats.setdefault((route_name, model), {
+            "calls": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0, "judged": 0, "correct": 0,
+        })
+
+    def record(self, route: Route, seconds: float, ok: bool):
+        with self._lock:
+            entry = self._entry(route.name, route.model)
+            entry["calls"] += 1
+            entry["errors"] += 0 if ok else 1
+            entry["seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+
+    @contextmanager
+    def timed(self, route: Route):
+        """Record the latency of the LLM call made in the block (an exception counts as an error)."""
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.record(route, time.perf_counter() - start, ok)
+
+    def record_outcome(self, name: str, correct: bool, model: Optional[str] = None):
+        """Count a judged answer (e.g. a practice attempt checked against the true answer) for a route."""
+        route = self.route(name, model)
+        with self._lock:
+            entry = self._entry(route.name, route.model)
+            entry["judged"] += 1
+            entry["correct"] += 1 if correct else 0
+
+    def stats(self) -> Dict[str, Any]:
+        """{route: {model: {calls, errors, avg_ms, max_ms, judged, accuracy}}}"""
+        with self._lock:
+            result: Dict[str, Any] = {}
+            for (route_name, model), s in sorted(self._stats.items()):
+                calls = s["calls"] or 1
+                result.setdefault(route_name, {})[model] = {
+                    "calls": s["calls"],
+                    "errors": s["errors"],
+                    "avg_ms": round(s["seconds"] / calls * 1000, 2),
+                    "max_ms": round(s["max_seconds"] * 1000, 2),
+                    "judged": s["judged"],
+                    "accuracy": round(s["correct"] / s["judged"], 4) if s["judged"] else None,
+                }
+            return result
+
+
+model_router = ModelRouter()
+
+
+def get_route_stats() -> Dict[str, Any]:
+    return model_router.stats()
@@ -1,32 +1,383 @@
 import os
-from openai import OpenAI
+import time
+import asyncio
+import inspect
+import logging
+import threading
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from openai import OpenAI, AsyncOpenAI
 from dotenv import load_dotenv
 
+from openai_api.llm_cache import llm_response_cache
+from openai_api.model_router import model_router
+from utils.deadline import clamp_timeout, current_deadline
+from utils.cancellation import check_cancelled
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 _DEFAULT_MODEL = os.environ.get("LLM_MODEL", "gpt-3.5-turbo")
 
+# 进程级 LLM 网关配置
+# 同时在途的 LLM 请求上限（进程内同步调用与所有事件循环上的异步调用共同计数）
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+# 按模型的并发上限，例如 "gpt-4o=8,deepseek-chat=16"；未列出的模型只受全局上限约束
+LLM_MODEL_CONCURRENCY = os.getenv("LLM_MODEL_CONCURRENCY", "")
+# 每个端点连接池的最大连接数（在用连接数同时受上面的并发上限约束）
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", str(LLM_MAX_CONCURRENCY)))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+# 练习类调用（知识库题目作答）的温度；不高于 LLM_CACHE_MAX_TEMPERATURE 时结果可复用，会进入 LLM 响应缓存
+# 默认保持原来的 0.5（不缓存），需要缓存时由运维调低，例如 0.0
+LLM_PRACTICE_TEMPERATURE = float(os.getenv("LLM_PRACTICE_TEMPERATURE", "0.5"))
+
+
+def _parse_model_limits(spec: str) -> Dict[str, int]:
+    limits = {}
+    for item in spec.split(","):
+        if "=" in item:
+            model, limit = item.split("=", 1)
+            limits[model.strip()] = int(limit)
+    return limits
+
+
+def _endpoint(api_key: Optional[str], base_url: Optional[str]) -> Tuple[str, Optional[str]]:
+    api_key = api_key or os.environ.get("OPENAI_API_KEY")
+    base_url = base_url or os.environ.get("OPENAI_API_BASE") or None
+    if not api_key:
+        raise ValueError("未找到 OPENAI_API_KEY 环境变量")
+    return api_key, base_url
+
+
+class _SharedSemaphore:
+    """
+    Counting semaphore shared by threads and every event loop.
+
+    Sync callers block in acquire(); coroutines await aacquire() without tying up
+    a thread. A released slot is handed straight to the longest waiting caller,
+    whichever side it is on.
+    """
+
+    def __init__(self, value: int):
+        self._lock = threading.Lock()
+        self._value = value
+        self._waiters: deque = deque()
+
+    def _try_acquire(self) -> bool:
+        if self._value > 0 and not self._waiters:
+            self._value -= 1
+            return True
+        return False
+
+    def acquire(self):
+        with self._lock:
+            if self._try_acquire():
+                return
+            granted = threading.Event()
+            self._waiters.append(granted.set)
+        granted.wait()
+
+    async def aacquire(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._try_acquire():
+                return
+            future = loop.create_future()
+
+            def grant():
+                loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+            self._waiters.append(grant)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                waiting = grant in self._waiters
+                if waiting:
+                    self._waiters.remove(grant)
+            if not waiting:
+                # The slot was granted before the cancellation arrived: pass it on
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self._value += 1
+                return
+            grant = self._waiters.popleft()
+        try:
+            grant()
+        except RuntimeError:
+            # The waiter's event loop is already closed
+            self.release()
+
+
+class LLMGateway:
+    """
+    Process-wide access point for chat completions.
+
+    - one pooled sync client and one pooled async client (per event loop) per endpoint
+    - one global limiter plus optional per-model limiters bound in-flight calls across
+      threads and all event loops (including the private loops of sync agent runs);
+      every call holds a slot while it uses a pooled connection, so open connections
+      stay within the same bound
+    - per-model timing: calls, errors, time spent waiting for a slot and in the call
+    """
+
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY, model_limits=None,
+                 max_connections=LLM_MAX_CONNECTIONS, timeout=LLM_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.model_limits = model_limits if model_limits is not None else _parse_model_limits(LLM_MODEL_CONCURRENCY)
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sync_clients: Dict[Tuple, OpenAI] = {}
+        # AsyncClient pools are bound to the loop that created them
+        self._async_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+        self._global = _SharedSemaphore(max_concurrency)
+        self._models: Dict[str, _SharedSemaphore] = {}
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+
+    # ── Clients ──────────────────────────────────────────────────────────────
+    def get_client(self, api_key: Optional[str] = None, base_url: Optional[str] = None) -> OpenAI:
+        key = _endpoint(api_key, base_url)
+        with self._lock:
+            client = self._sync_clients.get(key)
+            if client is None:
+                client = OpenAI(
+                    api_key=key[0],
+                    base_url=key[1],
+                    timeout=self.timeout,
+                    http_client=httpx.Client(limits=self._limits(), timeout=self.timeout),
+                )
+                self._sync_clients[key] = client
+            return client
+
+    def get_async_client(self, api_key: Optional[str] = None, base_url: Optional[str] = None) -> AsyncOpenAI:
+        key = _endpoint(api_key, base_url)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._async_clients.setdefault(loop, {})
+            client = clients.get(key)
+            if client is None:
+                client = AsyncOpenAI(
+                    api_key=key[0],
+                    base_url=key[1],
+                    timeout=self.timeout,
+                    http_client=httpx.AsyncClient(limits=self._limits(), timeout=self.timeout),
+                )
+                clients[key] = client
+            return client
+
+    # ── Concurrency limits ───────────────────────────────────────────────────
+    def _model_semaphore(self, model: str) -> Optional[_SharedSemaphore]:
+        if model not in self.model_limits:
+            return None
+        with self._lock:
+            if model not in self._models:
+                self._models[model] = _SharedSemaphore(self.model_limits[model])
+            return self._models[model]
+
+    @contextmanager
+    def _sync_slot(self, model: str):
+        model_sem = self._model_semaphore(model)
+        start = time.perf_counter()
+        if model_sem:
+            model_sem.acquire()
+        self._global.acquire()
+        waited = time.perf_counter() - start
+        try:
+            yield waited
+        finally:
+            self._global.release()
+            if model_sem:
+                model_sem.release()
+
+    @asynccontextmanager
+    async def _async_slot(self, model: str):
+        global_sem, model_sem = self._global, self._model_semaphore(model)
+        start = time.perf_counter()
+        if model_sem:
+            await model_sem.aacquire()
+        try:
+            await global_sem.aacquire()
+        except BaseException:
+            if model_sem:
+                model_sem.release()
+            raise
+        waited = time.perf_counter() - start
+        try:
+            yield waited
+        finally:
+            global_sem.release()
+            if model_sem:
+                model_sem.release()
+
+    # ── Timing ───────────────────────────────────────────────────────────────
+    def _record(self, model: str, waited: float, seconds: float, ok: bool):
+        with self._lock:
+            stats = self._stats.setdefault(model, {
+                "calls": 0, "errors": 0, "wait_seconds": 0.0, "call_seconds": 0.0, "max_call_seconds": 0.0,
+            })
+            stats["calls"] += 1
+            stats["errors"] += 0 if ok else 1
+            stats["wait_seconds"] += waited
+            stats["call_seconds"] += seconds
+            stats["max_call_seconds"] = max(stats["max_call_seconds"], seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            result = {}
+            for model, s in self._stats.items():
+                calls = s["calls"] or 1
+                result[model] = {
+                    "calls": s["calls"],
+                    "errors": s["errors"],
+                    "avg_wait_ms": round(s["wait_seconds"] / calls * 1000, 2),
+                    "avg_call_ms": round(s["call_seconds"] / calls * 1000, 2),
+                    "max_call_ms": round(s["max_call_seconds"] * 1000, 2),
+                }
+            return result
+
+    # ── Calls ────────────────────────────────────────────────────────────────
+    def _apply_request_limits(self, client, kwargs: Dict[str, Any]):
+        """
+        Refuse calls for cancelled requests (utils.cancellation) and shorten the
+        request timeout to the caller's deadline (utils.deadline), if any.
+        SDK retries are disabled under a deadline since each retry would restart the timeout.
+        """
+        check_cancelled()
+        if current_deadline() is None:
+            return client
+        kwargs["timeout"] = clamp_timeout(kwargs.get("timeout", self.timeout))
+        max_retries = getattr(client, "max_retries", 0)
+        return client.with_options(max_retries=0) if isinstance(max_retries, int) and max_retries > 0 else client
+
+    def chat_completion(self, client: Optional[OpenAI] = None, **kwargs) -> Any:
+        """
+        Synchronous chat.completions.create through the limiter.
+        With stream=True the slot is held until the returned iterator is exhausted.
+        """
+        client = client or self.get_client()
+        model = kwargs.setdefault("model", _DEFAULT_MODEL)
+        client = self._apply_request_limits(client, kwargs)
+        if kwargs.get("stream"):
+            return self._stream(client, model, kwargs)
+        with self._sync_slot(model) as waited:
+            start = time.perf_counter()
+            ok = False
+            try:
+                response = client.chat.completions.create(**kwargs)
+                ok = True
+                return response
+            finally:
+                self._record(model, waited, time.perf_counter() - start, ok)
+
+    def _stream(self, client, model, kwargs):
+        with self._sync_slot(model) as waited:
+            start = time.perf_counter()
+            ok = False
+            stream = None
+            try:
+                stream = client.chat.completions.create(**kwargs)
+                for chunk in stream:
+                    yield chunk
+                ok = True
+            finally:
+                # Closing the iterator early (e.g. a cancelled request) drops the HTTP response too
+                close = getattr(stream, "close", None)
+                if callable(close):
+                    close()
+                self._record(model, waited, time.perf_counter() - start, ok)
+
+    async def achat_completion(self, client: Optional[AsyncOpenAI] = None, **kwargs) -> Any:
+        """Async counterpart of chat_completion (for stream=True use astream_completion)."""
+        client = client or self.get_async_client()
+        model = kwargs.setdefault("model", _DEFAULT_MODEL)
+        client = self._apply_request_limits(client, kwargs)
+        async with self._async_slot(model) as waited:
+            start = time.perf_counter()
+            ok = False
+            try:
+                response = await client.chat.completions.create(**kwargs)
+                ok = True
+                return response
+            finally:
+                self._record(model, waited, time.perf_counter() - start, ok)
+
+    def astream_completion(self, client: Optional[AsyncOpenAI] = None, **kwargs):
+        """
+        Async streaming chat completion; yields chunks while holding a slot.
+        Cancellation and the deadline are applied when this is called, like chat_completion.
+        """
+        client = client or self.get_async_client()
+        model = kwargs.setdefault("model", _DEFAULT_MODEL)
+        kwargs["stream"] = True
+        client = self._apply_request_limits(client, kwargs)
+        return self._astream(client, model, kwargs)
+
+    async def _astream(self, client, model, kwargs):
+        async with self._async_slot(model) as waited:
+            start = time.perf_counter()
+            ok = False
+            stream = None
+            try:
+                stream = await client.chat.completions.create(**kwargs)
+                async for chunk in stream:
+                    yield chunk
+                ok = True
+            finally:
+                close = getattr(stream, "close", None)
+                if callable(close):
+                    closing = close()
+                    if inspect.isawaitable(closing):
+                        await closing
+                self._record(model, waited, time.perf_counter() - start, ok)
+
+    async def aclose_loop_clients(self):
+        """Close the async clients bound to the running loop (for short-lived private loops)."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._async_clients.pop(loop, {})
+        for client in clients.values():
+            await client.close()
+
+llm_gateway = LLMGateway()
+
+
+def get_openai_client(api_key: Optional[str] = None, base_url: Optional[str] = None) -> OpenAI:
+    return llm_gateway.get_client(api_key, base_url)
+
+
+def get_async_openai_client(api_key: Optional[str] = None, base_url: Optional[str] = None) -> AsyncOpenAI:
+    return llm_gateway.get_async_client(api_key, base_url)
+
+
+def get_llm_stats() -> Dict[str, Any]:
+    return llm_gateway.stats()
+
+
 class OpenAIClient:
+    """Thin facade over the shared gateway; cheap to instantiate anywhere."""
+
     def __init__(self):
-        api_key = os.environ.get("OPENAI_API_KEY")
-        api_base = os.environ.get("OPENAI_API_BASE")
-        
-        if not api_key:
-            raise ValueError("未找到 OPENAI_API_KEY 环境变量")
-        
-        client_args = {"api_key": api_key}
-        if api_base:
-            client_args["base_url"] = api_base
-        
-        self.client = OpenAI(**client_args)
-    
-    def get_llm_response(self, messages, model=None, temperature=0.5):
-        model = model or _DEFAULT_MODEL
-        response = self.client.chat.completions.create(
-            model=model,
+        self.client = get_openai_client()
+
+    def _request(self, messages, model, temperature, max_tokens=None):
+        return dict(
+            model=model or _DEFAULT_MODEL,
             messages=messages,
             temperature=temperature,
-            max_tokens=4096,
+            max_tokens=max_tokens or 4096,
             n=1,
             stream=False,
             top_p=0.99,
@@ -34,8 +385,47 @@ class OpenAIClient:
             presence_penalty=0.0,
             timeout=60.0  # 增加超时时间到 60s，防止复杂推理时超时
         )
-        
-        return response.choices[0].message.content
+
+    def get_llm_response(self, messages, model=None, temperature=0.5, cache=False, route=None):
+        """
+        Args:
+            route: Call site name for openai_api.model_router; picks the model (unless
+                `model` is given) and max_tokens, and is used for per-route statistics.
+        """
+        selected = model_router.route(route, model)
+        request = self._request(messages, selected.model, temperature, selected.max_tokens)
+
+        def compute():
+            with model_router.timed(selected):
+                response = llm_gateway.chat_completion(self.client, **request)
+            return response.choices[0].message.content
+
+        if not cache:
+            return compute()
+        return llm_response_cache.get_or_compute(request["model"], messages, temperature, compute)
+
+    async def aget_llm_response(self, messages, model=None, temperature=0.5, cache=False, route=None):
+        selected = model_router.route(route, model)
+        request = self._request(messages, selected.model, temperature, selected.max_tokens)
+
+        async def compute():
+            with model_router.timed(selected):
+                response = await llm_gateway.achat_completion(**request)
+            return response.choices[0].message.content
+
+        if not cache:
+            return await compute()
+        return await llm_response_cache.aget_or_compute(request["model"], messages, temperature, compute)
+
+    def get_practice_response(self, messages, model=None, route="practice"):
+        """
+        Answer a knowledge-base practice prompt at LLM_PRACTICE_TEMPERATURE.
+
+        Identical prompts share one cached completion only when that temperature is
+        low enough for the cache (see LLM_CACHE_MAX_TEMPERATURE); at the default 0.5
+        every call goes to the model.
+        """
+        return self.get_llm_response(messages, model, temperature=LLM_PRACTICE_TEMPERATURE, cache=True, route=route)
 
 if __name__ == "__main__":
     client = OpenAIClient()
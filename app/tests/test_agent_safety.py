@@ -1,5 +1,5 @@
 import unittest
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 from agent.tablesage_agent import TableSageAgent
 from utils.utils import TableUtils
 import json
@@ -21,17 +21,10 @@ class TestAgentSafety(unittest.TestCase):
         result = TableUtils.table2format(invalid_table)
         self.assertTrue(result.startswith("Error: Invalid table format"))
 
-    @patch('agent.tablesage_agent.OpenAI')
-    @patch('agent.tablesage_agent.TableSageAgent._rag_retrieval')
+    @patch('agent.tablesage_agent.get_async_openai_client')
     @patch('agent.tablesage_agent.TableSageAgent._execute_tool')
-    def test_agent_enforces_context_structure(self, mock_execute, mock_rag, mock_openai):
+    def test_agent_enforces_context_structure(self, mock_execute, mock_openai):
         """Test that TableSageAgent overrides hallucinated string user_table."""
-        mock_rag.return_value = {
-            "similar_question_ids": ["q1"],
-            "similarity_scores": [0.9],
-            "question_skeleton": "..."
-        }
-        
         # Mock LLM calling generate_final_answer with a STRING user_table
         mock_response = MagicMock()
         mock_tc = MagicMock()
@@ -43,15 +36,23 @@ class TestAgentSafety(unittest.TestCase):
             "user_table": "hallucinated string table",
             "few_shot_ids": "not-a-list"
         })
-        mock_response.choices[0].message.tool_calls = [mock_tc]
+        mock_response.choices[0].message.content = ""
+        # The confidence guard requires a prior 'think' call
+        mock_think = MagicMock()
+        mock_think.id = "call_0"
+        mock_think.function.name = "think"
+        mock_think.function.arguments = json.dumps({"thought": "ok", "confidence_score": 0.9})
+        mock_response.choices[0].message.tool_calls = [mock_think, mock_tc]
         mock_response.choices[0].finish_reason = "tool_calls"
         
         # Second response to stop the loop
         mock_stop_response = MagicMock()
+        mock_stop_response.choices[0].message.content = "<Answer>1</Answer>"
         mock_stop_response.choices[0].message.tool_calls = []
         mock_stop_response.choices[0].finish_reason = "stop"
         
-        mock_openai.return_value.chat.completions.create.side_effect = [mock_response, mock_stop_response]
+        mock_execute.return_value = {"status": "ok", "confidence_score": 0.9}
+        mock_openai.return_value.chat.completions.create = AsyncMock(side_effect=[mock_response, mock_stop_response])
         
         agent = TableSageAgent(max_steps=2)
         agent.run(self.test_question, self.test_table)
@@ -0,0 +1,609 @@
+import asyncio
+import json
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from agent.tablesage_agent import TableSageAgent
+
+
+def make_tool_call(call_id, name, arguments):
+    tc = MagicMock()
+    tc.id = call_id
+    tc.function.name = name
+    tc.function.arguments = json.dumps(arguments)
+    return tc
+
+
+def make_response(tool_calls, content="", finish_reason="tool_calls"):
+    response = MagicMock()
+    response.choices[0].message.content = content
+    response.choices[0].message.tool_calls = tool_calls
+    response.choices[0].finish_reason = finish_reason
+    return response
+
+
+def make_stream(tool_calls, content="", finish_reason="tool_calls"):
+    """Split a response into streamed chunks: content in two deltas, each tool call's arguments in two."""
+    chunks = []
+
+    def chunk(content=None, tool_calls=None, finish_reason=None):
+        delta = SimpleNamespace(content=content, tool_calls=tool_calls)
+        return SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=finish_reason)])
+
+    if content:
+        middle = len(content) // 2
+        chunks += [chunk(content=content[:middle]), chunk(content=content[middle:])]
+    for index, tc in enumerate(tool_calls):
+        arguments = tc.function.arguments
+        middle = len(arguments) // 2
+        chunks.append(chunk(tool_calls=[SimpleNamespace(
+            index=index, id=tc.id, function=SimpleNamespace(name=tc.function.name, arguments=arguments[:middle]))]))
+        chunks.append(chunk(tool_calls=[SimpleNamespace(
+            index=index, id=None, function=SimpleNamespace(name=None, arguments=arguments[middle:]))]))
+    chunks.append(chunk(finish_reason=finish_reason))
+    # trailing usage chunk without choices
+    chunks.append(SimpleNamespace(choices=[]))
+    return AsyncChunks(chunks)
+
+
+class AsyncChunks:
+    """Async iterable over completion chunks, standing in for the SDK's AsyncStream."""
+
+    def __init__(self, chunks, on_close=None):
+        self.chunks = list(chunks)
+        self.on_close = on_close
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield chunk
+
+    async def close(self):
+        if self.on_close:
+            self.on_close()
+
+
+def async_llm(mock_factory):
+    """Give the client from the patched get_async_openai_client an awaitable create()."""
+    mock_factory.return_value.chat.completions.create = AsyncMock()
+    return mock_factory.return_value.chat.completions.create
+
+
+class TestConcurrentToolCalls(unittest.TestCase):
+    def setUp(self):
+        self.table = {"header": ["Name", "Score"], "rows": [["Alice", 90]]}
+        self.practice_calls = [
+            make_tool_call(f"call_{i}", "practice_question", {"table_id": f"t{i}"}) for i in range(3)
+        ]
+
+    def run_agent(self, mock_client, tool_calls, execute, stream=False):
+        if stream:
+            responses = [
+                make_stream(tool_calls),
+                make_stream([], content="<Answer>1</Answer>", finish_reason="stop"),
+            ]
+        else:
+            responses = [
+                make_response(tool_calls),
+                make_response([], content="<Answer>1</Answer>", finish_reason="stop"),
+            ]
+        mock_client.return_value.chat.completions.create.side_effect = responses
+        agent = TableSageAgent(max_steps=3, prefetch_retrieval=False)
+        with patch.object(TableSageAgent, "_execute_tool", side_effect=execute):
+            if stream:
+                return list(agent.run_stream("How many?", self.table))
+            return agent.run("How many?", self.table)
+
+    @patch("agent.tablesage_agent.get_async_openai_client")
+    def test_practice_calls_run_concurrently_in_order(self, mock_client):
+        async_llm(mock_client)
+        delays = {"t0": 0.3, "t1": 0.1, "t2": 0.2}
+
+        def execute(name, args):
+            time.sleep(delays[args["table_id"]])
+            return {"table_id": args["table_id"], "is_correct": True, "strategy_used": "direct"}
+
+        start = time.perf_counter()
+        events = self.run_agent(mock_client, self.practice_calls, execute, stream=True)
+        self.assertLess(time.perf_counter() - start, 0.55)
+
+        # Results stream in completion order
+        finished = [e["result_summary"] for e in events if e["step"] == "tool_result"]
+        self.assertEqual([s.split(",")[0] for s in finished], ["Practice: id=t1", "Practice: id=t2", "Practice: id=t0"])
+
+        # ...but the history sent back to the model keeps tool_call order
+        messages = mock_client.return_value.chat.completions.create.call_args_list[1].kwargs["messages"]
+        tool_messages = [m for m in messages if m["role"] == "tool"]
+        self.assertEqual([m["tool_call_id"] for m in tool_messages], ["call_0", "call_1", "call_2"])
+        self.assertEqual([json.loads(m["content"])["table_id"] for m in tool_messages], ["t0", "t1", "t2"])
+        trace = events[-1]["complete_result"]["reasoning_trace"]
+        self.assertEqual([t["arguments"]["table_id"] for t in trace if t["type"] == "tool_call"], ["t0", "t1", "t2"])
+
+    @patch("agent.tablesage_agent.get_async_openai_client")
+    def test_stateful_tools_run_after_earlier_calls(self, mock_client):
+        async_llm(mock_client)
+        active, peak = [0], [0]
+        lock = threading.Lock()
+        seen = []
+
+        def execute(name, args):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+                seen.append(name)
+            if name == "think":
+                return {"confidence_score": 0.9, "has_sufficient_context": True}
+            if name == "search_knowledge":
+                return {"results": [{"table_id": "s1"}]}
+            return {"status": "ok"}
+
+        calls = [
+            make_tool_call("a", "search_knowledge", {"query": "x"}),
+            make_tool_call("b", "practice_question", {"table_id": "t0"}),
+            make_tool_call("c", "think", {"thought": "ok", "confidence_score": 0.9}),
+            make_tool_call("d", "generate_final_answer", {"few_shot_ids": []}),
+        ]
+        result = self.run_agent(mock_client, calls, execute)
+
+        # search first, then practice+think together, then the guarded final answer
+        self.assertEqual(seen[0], "search_knowledge")
+        self.assertEqual(seen[-1], "generate_final_answer")
+        self.assertEqual(peak[0], 2)
+        self.assertEqual(result["tools_used"], ["search_knowledge", "practice_question", "think", "generate_final_answer"])
+        self.assertEqual(result["confidence"], 0.9)
+
+    @patch("agent.tablesage_agent.get_async_openai_client")
+    def test_practice_on_the_same_table_runs_in_order(self, mock_client):
+        async_llm(mock_client)
+        finished = []
+        delays = {("t0", "cot"): 0.2, ("t0", "direct"): 0.0, ("t1", "cot"): 0.0}
+
+        def execute(name, args):
+            time.sleep(delays[(args["table_id"], args["strategy"])])
+            finished.append((args["table_id"], args["strategy"]))
+            return {"table_id": args["table_id"], "is_correct": True}
+
+        calls = [
+            make_tool_call("a", "practice_question", {"table_id": "t0", "strategy": "cot"}),
+            make_tool_call("b", "practice_question", {"table_id": "t1", "strategy": "cot"}),
+            make_tool_call("c", "practice_question", {"table_id": "t0", "strategy": "direct"}),
+        ]
+        self.run_agent(mock_client, calls, execute)
+
+        # t0/cot and t1 overlap; the second t0 attempt waits for the first one's record writes
+        self.assertEqual(finished, [("t1", "cot"), ("t0", "cot"), ("t0", "direct")])
+
+
+class TestStreamedCompletions(unittest.TestCase):
+    @patch("agent.tablesage_agent.get_async_openai_client")
+    def test_answer_chunks_and_tool_call_deltas(self, mock_client):
+        async_llm(mock_client)
+        table = {"header": ["Name"], "rows": [["Alice"]]}
+        think = make_tool_call("call_0", "think", {"thought": "ok", "confidence_score": 0.9})
+        mock_client.return_value.chat.completions.create.side_effect = [
+            make_stream([think], content="Checking."),
+            make_stream([], content="<Answer>['Alice']</Answer>", finish_reason="stop"),
+        ]
+        seen_args = []
+
+        def execute(name, args):
+            seen_args.append(args)
+            return {"confidence_score": 0.9, "has_sufficient_context": True}
+
+        with patch.object(TableSageAgent, "_execute_tool", side_effect=execute):
+            events = list(TableSageAgent(max_steps=3, prefetch_retrieval=False).run_stream("Who?", table))
+
+        # tool-call arguments arrive split over two deltas and are reassembled
+        self.assertEqual(seen_args, [{"thought": "ok", "confidence_score": 0.9}])
+        chunks = [e for e in events if e["step"] == "answer_chunk"]
+        self.assertEqual("".join(c["content"] for c in chunks if c["agent_step"] == 2), "<Answer>['Alice']</Answer>")
+        self.assertLess(events.index(chunks[-1]), [e["step"] for e in events].index("end"))
+        self.assertEqual(events[-1]["answer"], "['Alice']")
+
+        requests = mock_client.return_value.chat.completions.create.call_args_list
+        self.assertTrue(all(call.kwargs["stream"] for call in requests))
+        assistant = requests[1].kwargs["messages"][2]
+        self.assertEqual(assistant["content"], "Checking.")
+        self.assertEqual(assistant["tool_calls"][0]["id"], "call_0")
+        self.assertEqual(assistant["tool_calls"][0]["function"]["name"], "think")
+
+
+class TestStepMetrics(unittest.TestCase):
+    @patch("agent.tablesage_agent.get_async_openai_client")
+    def test_metrics_events_trace_and_totals(self, mock_client):
+        async_llm(mock_client)
+        table = {"header": ["Name"], "rows": [["Alice"]]}
+        think = make_tool_call("call_0", "think", {"thought": "ok", "confidence_score": 0.9})
+        first = make_stream([think])
+        first.chunks[-1].usage = SimpleNamespace(prompt_tokens=120, completion_tokens=30)
+        # no usage chunk: the counts are estimated with tiktoken
+        second = make_stream([], content="<Answer>['Alice']</Answer>", finish_reason="stop")
+        mock_client.return_value.chat.completions.create.side_effect = [first, second]
+
+        def execute(name, args):
+            time.sleep(0.02)
+            return {"confidence_score": 0.9, "has_sufficient_context": True}
+
+        with patch.object(TableSageAgent, "_execute_tool", side_effect=execute):
+            events = list(TableSageAgent(max_steps=3, prefetch_retrieval=False).run_stream("Who?", table))
+
+        metrics = [e for e in events if e["step"] == "metrics"]
+        self.assertEqual([m["agent_step"] for m in metrics], [1, 2])
+        self.assertEqual((metrics[0]["prompt_tokens"], metrics[0]["completion_tokens"]), (120, 30))
+        self.assertEqual(metrics[0]["token_source"], "usage")
+        self.assertEqual(metrics[0]["tool_calls"], 1)
+        self.assertGreaterEqual(metrics[0]["tool_latency_ms"], 15)
+        self.assertGreater(metrics[0]["tool_result_chars"], 0)
+        self.assertEqual(metrics[1]["token_source"], "estimate")
+        self.assertGreater(metrics[1]["prompt_tokens"], 0)
+        self.assertEqual(metrics[1]["tool_calls"], 0)
+
+        result = events[-1]["complete_result"]
+        trace_metrics = [t for t in result["reasoning_trace"] if t["type"] == "metrics"]
+        self.assertEqual(len(trace_metrics), 2)
+        tool_trace = [t for t in result["reasoning_trace"] if t["type"] == "tool_call"][0]
+        self.assertEqual(tool_trace["result_chars"], metrics[0]["tool_result_chars"])
+
+        totals = result["metrics"]
+        self.assertEqual(totals["llm_calls"], 2)
+        self.assertEqual(totals["prompt_tokens"], 120 + metrics[1]["prompt_tokens"])
+        self.assertEqual(totals["tool_calls"], 1)
+        self.assertEqual(totals["estimated_steps"], 1)
+
+
+class TestRetrievalPrefetch(unittest.TestCase):
+    @patch("agent.tablesage_agent.TableUtils.table2format")
+    @patch("agent.tablesage_agent.get_async_openai_client")
+    def test_search_runs_with_message_construction(self, mock_client, mock_format):
+        async_llm(mock_client)
+        table = {"header": ["Name"], "rows": [["Alice"]]}
+        mock_format.side_effect = lambda *args, **kwargs: time.sleep(0.2) or "| Name |"
+        mock_client.return_value.chat.completions.create.side_effect = [
+            make_response([], content="<Answer>['Alice']</Answer>", finish_reason="stop"),
+        ]
+
+        def execute(name, args):
+            time.sleep(0.2)
+            return {"results": [{"table_id": "s1", "history_status": "Mastered"}]}
+
+        start = time.perf_counter()
+        with patch.object(TableSageAgent, "_execute_tool", side_effect=execute) as mock_execute:
+            result = TableSageAgent(max_steps=1).run("Who?", table)
+        # search and table formatting overlap
+        self.assertLess(time.perf_counter() - start, 0.35)
+        self.assertEqual(mock_execute.call_args[0][0], "search_knowledge")
+        self.assertEqual(mock_execute.call_args[0][1]["user_question"], "Who?")
+
+        # the first (and only) LLM call already sees a completed search exchange
+        messages = mock_client.return_value.chat.completions.create.call_args.kwargs["messages"]
+        self.assertEqual(messages[2]["tool_calls"][0]["function"]["name"], "search_knowledge")
+        self.assertEqual(messages[3]["tool_call_id"], messages[2]["tool_calls"][0]["id"])
+        self.assertEqual(json.loads(messages[3]["content"])["results"][0]["table_id"], "s1")
+        self.assertIn("already been run", messages[1]["content"])
+
+        self.assertEqual(result["answer"], "['Alice']")
+        self.assertEqual(result["tools_used"], ["search_knowledge"])
+        search = [t for t in result["reasoning_trace"] if t["type"] == "tool_call"][0]
+        self.assertEqual((search["step"], search["prefetched"]), (0, True))
+        self.assertEqual(result["metrics"]["llm_calls"], 1)
+        self.assertEqual(result["metrics"]["tool_calls"], 1)
+
+    @patch("agent.tablesage_agent.get_async_openai_client")
+    def test_search_started_before_the_run(self, mock_client):
+        create = async_llm(mock_client)
+        create.side_effect = lambda **kwargs: make_response([], content="<Answer>1</Answer>", finish_reason="stop")
+        table = {"header": ["Name"], "rows": [["Alice"]]}
+        searched = []
+
+        def execute(name, args):
+            searched.append(args["user_question"])
+            return {"results": [{"table_id": "s1", "history_status": "New"}]}
+
+        async def run(run_question):
+            agent = TableSageAgent(max_steps=1, fast_path=False)
+            prefetch = agent.start_retrieval("Who?", table)
+            await asyncio.sleep(0)  # the caller's own work (e.g. routing) overlaps the search
+            return await agent.arun(run_question, table, prefetch=prefetch)
+
+        with patch.object(TableSageAgent, "_execute_tool", side_effect=execute):
+            result = asyncio.run(run("Who?"))
+            self.assertEqual((searched, result["tools_used"]), (["Who?"], ["search_knowledge"]))
+
+            # a search made for another question is not handed to the run
+            searched.clear()
+            asyncio.run(run("Who scored?"))
+            self.assertEqual(sorted(searched), ["Who scored?", "Who?"])
+        messages = create.call_args.kwargs["messages"]
+        self.assertEqual(json.loads(messages[3]["content"])["results"][0]["table_id"], "s1")
+
+
+class TestFastPath(unittest.TestCase):
+    def setUp(self):
+        self.table = {"header": ["Name"], "rows": [["Alice"]]}
+        self.executed = []
+
+    def run_agent(self, mock_client, search_results):
+        def execute(name, args):
+            self.executed.append((name, args))
+            if name == "search_knowledge":
+                return {"results": search_results}
+            if name == "generate_final_answer":
+                return {"enriched_context": "ctx", "context_used": "strategy_only"}
+            return {"confidence_score": 0.9}
+
+        with patch.object(TableSageAgent, "_execute_tool", side_effect=execute):
+            return TableSageAgent(max_steps=3).run("Who?", self.table)
+
+    @patch("agent.tablesage_agent.get_async_openai_client")
+    def test_mastered_neighbourhood_takes_one_call(self, mock_client):
+        async_llm(mock_client)
+        create = mock_client.return_value.chat.completions.create
+        create.side_effect = [make_response([], content="<Answer>['Alice']</Answer>", finish_reason="stop")]
+        result = self.run_agent(mock_client, [
+            {"table_id": "m1", "history_status": "Mastered (Direct Success)", "similarity": 0.95},
+            {"table_id": "s1", "history_status": "Strategic Success (CoT/Sorting/etc.)", "similarity": 0.93},
+        ])
+
+        self.assertEqual(create.call_count, 1)
+        self.assertEqual(create.call_args.kwargs["tool_choice"], "none")
+        self.assertEqual([name for name, _ in self.executed], ["search_knowledge", "generate_final_answer"])
+        # only Strategic Success neighbours carry few-shot reflections
+        final_args = self.executed[1][1]
+        self.assertEqual(final_args["few_shot_ids"], ["s1"])
+        self.assertEqual(final_args["user_question"], "Who?")
+
+        self.assertTrue(result["fast_path"])
+        self.assertEqual(result["answer"], "['Alice']")
+        self.assertEqual(result["context_used"], "strategy_only")
+        self.assertEqual(result["confidence"], 0.93)
+        fast = [t for t in result["reasoning_trace"] if t["type"] == "fast_path"][0]
+        self.assertEqual(fast["neighbour_ids"], ["m1", "s1"])
+
+    @patch("agent.tablesage_agent.get_async_openai_client")
+    def test_new_or_distant_neighbours_use_the_loop(self, mock_client):
+        async_llm(mock_client)
+        for results in (
+            [{"table_id": "m1", "history_status": "Mastered (Direct Success)", "similarity": 0.95},
+             {"table_id": "n1", "history_status": "New", "similarity": 0.97}],
+            [{"table_id": "m1", "history_status": "Mastered (Direct Success)", "similarity": 0.95},
+             {"table_id": "m2", "history_status": "Mastered (Direct Success)", "similarity": 0.6}],
+        ):
+            create = mock_client.return_value.chat.completions.create
+            create.reset_mock()
+            create.side_effect = [make_response([], content="<Answer>1</Answer>", finish_reason="stop")]
+            result = self.run_agent(mock_client, results)
+            self.assertFalse(result["fast_path"])
+            self.assertEqual(create.call_args.kwargs["tool_choice"], "auto")
+
+
+class TestStructuredProtocol(unittest.TestCase):
+    @patch("agent.tools.submit_answer_tool.generate_final_answer_tool")
+    @patch("agent.tablesage_agent.get_async_openai_client")
+    def test_submit_answer_ends_the_run(self, mock_client, mock_context):
+        async_llm(mock_client)
+        table = {"header": ["Name"], "rows": [["Alice"]]}
+        mock_context.return_value = {"enriched_context": "Similar question: ..."}
+        low = make_tool_call("call_0", "submit_answer", {
+            "reasoning": "r", "confidence_score": 0.5, "answer": "<Answer>['Bob']</Answer>", "few_shot_ids": ["s1"]})
+        high = make_tool_call("call_1", "submit_answer", {
+            "reasoning": "r", "confidence_score": 0.9, "answer": "<Answer>['Alice']</Answer>", "few_shot_ids": ["s1"]})
+        create = mock_client.return_value.chat.completions.create
+        create.side_effect = [make_response([low]), make_response([high])]
+
+        agent = TableSageAgent(max_steps=5, prefetch_retrieval=False, tool_protocol="structured")
+        result = agent.run("Who?", table)
+
+        # the rejection carries the server-side context; the accepted call needs no further turn
+        self.assertEqual(create.call_count, 2)
+        rejected = json.loads(create.call_args_list[1].kwargs["messages"][-1]["content"])
+        self.assertFalse(rejected["accepted"])
+        self.assertEqual(rejected["enriched_context"], "Similar question: ...")
+        self.assertEqual(mock_context.call_args.kwargs["few_shot_ids"], ["s1"])
+
+        tool_names = {t["function"]["name"] for t in create.call_args.kwargs["tools"]}
+        self.assertIn("submit_answer", tool_names)
+        self.assertNotIn("think", tool_names)
+        self.assertIn("submit_answer", create.call_args.kwargs["messages"][0]["content"])
+
+        self.assertEqual(result["answer"], "['Alice']")
+        self.assertEqual(result["confidence"], 0.9)
+        self.assertEqual(result["context_used"], "strategy_only")
+        self.assertEqual(result["tools_used"], ["submit_answer", "submit_answer"])
+
+    def test_answer_without_tags_is_rejected(self):
+        from agent.tools.submit_answer_tool import submit_answer_tool
+        with patch("agent.tools.submit_answer_tool.generate_final_answer_tool", return_value={}):
+            result = submit_answer_tool("r", 0.95, "Alice", "Who?", {"header": [], "rows": []})
+        self.assertFalse(result["accepted"])
+        self.assertIn("<Answer>", result["error"])
+
+
+class TestDeadline(unittest.TestCase):
+    def setUp(self):
+        self.table = {"header": ["Name"], "rows": [["Alice"]]}
+
+    @patch("agent.tablesage_agent.AGENT_DEADLINE_RESERVE_SECONDS", 1.0)
+    @patch("agent.tablesage_agent.get_async_openai_client")
+    def test_final_answer_is_forced_near_the_deadline(self, mock_client):
+        async_llm(mock_client)
+        from utils.deadline import remaining
+        practice = make_tool_call("call_0", "practice_question", {"table_id": "t0"})
+        create = mock_client.return_value.chat.completions.create
+        create.side_effect = [
+            make_response([practice]),
+            make_response([], content="<Answer>['Alice']</Answer>", finish_reason="stop"),
+        ]
+        seen_remaining = []
+
+        def execute(name, args):
+            seen_remaining.append(remaining())
+            time.sleep(1.2)
+            return {"table_id": "t0", "is_correct": True}
+
+        agent = TableSageAgent(max_steps=10, prefetch_retrieval=False, deadline_seconds=3.0)
+        start = time.perf_counter()
+        with patch.object(TableSageAgent, "_execute_tool", side_effect=execute):
+            result = agent.run("Who?", self.table)
+        self.assertLess(time.perf_counter() - start, 3.0)
+
+        # the tool ran under the step deadline (3s minus the 1s reserve)
+        self.assertLessEqual(seen_remaining[0], 2.0)
+        self.assertLessEqual(create.call_args_list[0].kwargs["timeout"], 2.0)
+        forced = create.call_args_list[1].kwargs
+        self.assertEqual(forced["tool_choice"], "none")
+        self.assertIn("TIME LIMIT", forced["messages"][-1]["content"])
+        self.assertTrue(result["deadline_exceeded"])
+        self.assertEqual(result["answer"], "['Alice']")
+
+    @patch("agent.tablesage_agent.get_async_openai_client")
+    def test_step_timeout_falls_back_to_forced_answer(self, mock_client):
+        async_llm(mock_client)
+        import httpx
+        from openai import APITimeoutError
+        create = mock_client.return_value.chat.completions.create
+        create.side_effect = [
+            APITimeoutError(request=httpx.Request("POST", "http://llm")),
+            make_response([], content="<Answer>1</Answer>", finish_reason="stop"),
+        ]
+        result = TableSageAgent(max_steps=3, prefetch_retrieval=False, deadline_seconds=60).run("Who?", self.table)
+        self.assertTrue(result["deadline_exceeded"])
+        self.assertEqual(result["answer"], "1")
+
+        # without a deadline the timeout is still an error
+        create.side_effect = [APITimeoutError(request=httpx.Request("POST", "http://llm"))]
+        with self.assertRaises(APITimeoutError):
+            TableSageAgent(max_steps=3, prefetch_retrieval=False, deadline_seconds=0).run("Who?", self.table)
+
+
+class TestToolMemo(unittest.TestCase):
+    def setUp(self):
+        self.table = {"header": ["Name"], "rows": [["Alice"]]}
+
+    def run_agent(self, mock_client, steps, execute):
+        create = async_llm(mock_client)
+        create.side_effect = [make_response(calls) for calls in steps] + [
+            make_response([], content="<Answer>1</Answer>", finish_reason="stop"),
+        ]
+        with patch.object(TableSageAgent, "_execute_tool", side_effect=execute) as mock_execute:
+            result = TableSageAgent(max_steps=len(steps) + 1, prefetch_retrieval=False).run("Who?", self.table)
+        return result, mock_execute
+
+    @patch("agent.tablesage_agent.get_async_openai_client")
+    def test_repeated_calls_reuse_the_first_result(self, mock_client):
+        def practice(call_id, table_id, strategy="direct"):
+            return make_tool_call(call_id, "practice_question", {"table_id": table_id, "strategy": strategy})
+
+        result, mock_execute = self.run_agent(mock_client, [
+            [practice("a", "t0"), practice("b", "t0")],        # duplicate within one step
+            [practice("c", "t0"), practice("d", "t0", "cot")],  # repeat across steps, and a new strategy
+        ], lambda name, args: {"table_id": args["table_id"], "strategy_used": args["strategy"], "is_correct": True})
+
+        executed = [call.args[1]["strategy"] for call in mock_execute.call_args_list]
+        self.assertEqual(sorted(executed), ["cot", "direct"])
+        trace = [t for t in result["reasoning_trace"] if t["type"] == "tool_call"]
+        self.assertEqual([t.get("cached", False) for t in trace], [False, True, True, False])
+        self.assertEqual(result["metrics"]["tool_cache_hits"], 2)
+        self.assertEqual(result["metrics"]["tool_calls"], 4)
+
+    @patch("agent.tablesage_agent.get_async_openai_client")
+    def test_explicit_defaults_share_the_memo_key(self, mock_client):
+        _, mock_execute = self.run_agent(mock_client, [
+            [make_tool_call("a", "practice_question", {"table_id": "t0"})],
+            [make_tool_call("b", "practice_question", {"table_id": "t0", "strategy": "direct", "use_learning": True})],
+        ], lambda name, args: {"table_id": args["table_id"], "is_correct": True, "record_saved": "none"})
+        self.assertEqual(mock_execute.call_count, 1)
+
+    @patch("agent.tablesage_agent.get_async_openai_client")
+    def test_saved_learning_record_drops_the_table_memo(self, mock_client):
+        def practice(call_id, strategy="direct"):
+            return make_tool_call(call_id, "practice_question", {"table_id": "t0", "strategy": strategy})
+
+        outcomes = iter([
+            {"table_id": "t0", "is_correct": False, "record_saved": "none"},
+            {"table_id": "t0", "is_correct": True, "record_saved": "flag1"},  # cot success saves a reflection
+            {"table_id": "t0", "is_correct": True, "record_saved": "none"},   # guided retry
+        ])
+        result, mock_execute = self.run_agent(
+            mock_client, [[practice("a")], [practice("b", "cot")], [practice("c")]], lambda name, args: next(outcomes)
+        )
+        executed = [call.args[1]["strategy"] for call in mock_execute.call_args_list]
+        self.assertEqual(executed, ["direct", "cot", "direct"])
+        self.assertEqual(result["metrics"].get("tool_cache_hits", 0), 0)
+
+    @patch("agent.tablesage_agent.get_async_openai_client")
+    def test_repeated_searches_fetch_new_neighbours(self, mock_client):
+        search = make_tool_call("a", "search_knowledge", {"top_n": 1})
+        pages = iter([{"results": [{"table_id": "s1"}]}, {"results": [{"table_id": "s2"}]}])
+
+        result, mock_execute = self.run_agent(mock_client, [[search], [search]], lambda name, args: next(pages))
+        excluded = [call.args[1]["exclude_ids"] for call in mock_execute.call_args_list]
+        self.assertEqual(excluded, [[], ["s1"]])
+        self.assertEqual(result["metrics"].get("tool_cache_hits", 0), 0)
+
+    @patch("agent.tablesage_agent.get_async_openai_client")
+    def test_errors_and_final_answers_are_not_reused(self, mock_client):
+        practice = make_tool_call("a", "practice_question", {"table_id": "t0"})
+        think = make_tool_call("b", "think", {"thought": "ok", "confidence_score": 0.9})
+        final = make_tool_call("c", "generate_final_answer", {"few_shot_ids": []})
+
+        def execute(name, args):
+            if name == "practice_question":
+                return {"error": "LLM timeout"}
+            return {"confidence_score": 0.9, "enriched_context": "ctx"}
+
+        _, mock_execute = self.run_agent(mock_client, [[practice], [practice, think], [final], [final]], execute)
+        executed = [call.args[0] for call in mock_execute.call_args_list]
+        self.assertEqual(executed.count("practice_question"), 2)
+        self.assertEqual(executed.count("generate_final_answer"), 2)
+
+
+class TestAsyncEngine(unittest.TestCase):
+    def setUp(self):
+        self.table = {"header": ["Name"], "rows": [["Alice"]]}
+
+    @patch("agent.tablesage_agent.get_async_openai_client")
+    def test_concurrent_runs_share_one_loop(self, mock_client):
+        create = async_llm(mock_client)
+
+        async def slow_answer(**kwargs):
+            await asyncio.sleep(0.3)
+            return make_response([], content="<Answer>1</Answer>", finish_reason="stop")
+
+        create.side_effect = slow_answer
+
+        async def main():
+            agents = [TableSageAgent(max_steps=1, prefetch_retrieval=False) for _ in range(5)]
+            return await asyncio.gather(*(agent.arun("Who?", self.table) for agent in agents))
+
+        start = time.perf_counter()
+        results = asyncio.run(main())
+        # the LLM waits overlap on the event loop instead of holding a thread each
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertEqual([r["answer"] for r in results], ["1"] * 5)
+
+    @patch("agent.tablesage_agent.get_async_openai_client")
+    def test_closing_the_stream_cancels_the_run(self, mock_client):
+        from utils.cancellation import CancelToken
+        create = async_llm(mock_client)
+        create.side_effect = [make_stream([make_tool_call("call_0", "practice_question", {"table_id": "t0"})])]
+        token = CancelToken()
+
+        async def consume():
+            stream = TableSageAgent(max_steps=3, prefetch_retrieval=False).arun_stream("Who?", self.table, cancel_token=token)
+            async for event in stream:
+                if event["step"] == "tool_call":
+                    break
+            await stream.aclose()
+
+        asyncio.run(consume())
+        # tools still running in the pool see the cancelled token at their next check
+        self.assertTrue(token.cancelled)
+        self.assertEqual(create.call_count, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from core_progress.answer_processor import AnsweringProcessor
+
+
+class TestConcurrentAnswering(unittest.TestCase):
+    def setUp(self):
+        knowledge = {
+            tid: {"table_id": tid, "question": f"q{tid}", "answer": f"a{tid}", "table": {"header": ["h"], "rows": [["v"]]}}
+            for tid in (1, 2, 3, 4, 5)
+        }
+        self.db = MagicMock()
+        self.db.batch_get_learning_records.return_value = {
+            1: {"table_id": 1, "flag": 0},
+            2: {"table_id": 2, "flag": 1, "rethink_summary": "guided"},
+            3: {"table_id": 3, "flag": 2, "rethink_summary": "reflect"},
+        }
+        self.db.batch_get_knowledge_by_ids.side_effect = lambda ids: {i: knowledge[i] for i in ids}
+
+        with patch("core_progress.answer_processor.DatabaseManager", return_value=self.db), \
+                patch("core_progress.answer_processor.OpenAIClient"):
+            self.processor = AnsweringProcessor(confidence_threshold=0.8, max_workers=4)
+        self.processor.table_utils = MagicMock()
+        self.processor.table_utils.table2format.return_value = "table"
+        self.processor.table_utils.is_answer_correct.side_effect = lambda model, true: model == true
+
+    def test_prompts_run_concurrently_and_results_keep_order(self):
+        active, peak = [0], [0]
+        lock = threading.Lock()
+        # q2 and q4 are answered correctly
+        answers = {"q2": "a2", "q3": "wrong", "q4": "a4", "q5": "wrong"}
+
+        def respond(messages):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+            content = messages[0]["content"]
+            return next(a for q, a in answers.items() if f"\n        {q}\n" in content)
+
+        self.processor.openai_client.get_practice_response.side_effect = respond
+        result = self.processor.process_answering([1, 2, 3, 4, 5])
+
+        self.assertGreater(peak[0], 1)
+        self.assertEqual([r["table_id"] for r in result["processed_results"]], [2, 3, 4, 5])
+        self.assertEqual(result["processed_results"][0]["strategy_used"], "flag_1")
+        self.assertEqual(result["processed_results"][1]["strategy_used"], "flag_2")
+        # flag_0 record + correct flag_1 record + correct new record
+        self.assertEqual(result["flag_0_count"], 3)
+        self.assertAlmostEqual(result["confidence"], 3 / 5)
+        self.assertTrue(result["need_strategy"])
+        self.assertEqual(result["incorrect_table_ids"], [3, 5])
+        self.assertEqual(result["not_found"], [4, 5])
+
+        self.db.batch_get_learning_records.assert_called_once_with([1, 2, 3, 4, 5])
+        self.db.bulk_add_learning_records.assert_called_once_with([(4, 0), (5, 3)])
+        self.db.get_learning_record.assert_not_called()
+        self.db.add_learning_record.assert_not_called()
+
+    def test_missing_knowledge_is_skipped(self):
+        self.db.batch_get_knowledge_by_ids.side_effect = lambda ids: {}
+        result = self.processor.process_answering([1, 4])
+
+        self.processor.openai_client.get_practice_response.assert_not_called()
+        self.assertEqual(result["processed_results"], [])
+        self.assertEqual(result["confidence"], 0.5)
+        self.db.bulk_add_learning_records.assert_called_once_with([])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+import asyncio
+import json
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from agent.tablesage_agent import TableSageAgent
+from openai_api.openai_client import LLMGateway
+from utils.cancellation import CancelToken, RunCancelled, cancel_scope, current_token, iterate_in_thread
+
+
+def make_tool_call(call_id, name, arguments):
+    tc = MagicMock()
+    tc.id = call_id
+    tc.function.name = name
+    tc.function.arguments = json.dumps(arguments)
+    return tc
+
+
+def make_response(tool_calls, content="", finish_reason="tool_calls"):
+    response = MagicMock()
+    response.choices[0].message.content = content
+    response.choices[0].message.tool_calls = tool_calls
+    response.choices[0].finish_reason = finish_reason
+    return response
+
+
+def async_llm(mock_factory):
+    """Give the client from the patched get_async_openai_client an awaitable create()."""
+    mock_factory.return_value.chat.completions.create = AsyncMock()
+    return mock_factory.return_value.chat.completions.create
+
+
+class TestCancelToken(unittest.TestCase):
+    def test_child_follows_its_parent_but_not_the_reverse(self):
+        parent = CancelToken()
+        child = CancelToken(parent=parent)
+        child.cancel("loser")
+        self.assertFalse(parent.cancelled)
+
+        other = CancelToken(parent=parent)
+        parent.cancel("client disconnected")
+        self.assertTrue(other.cancelled)
+        with self.assertRaises(RunCancelled):
+            other.raise_if_cancelled()
+
+
+class TestIterateInThread(unittest.TestCase):
+    def test_early_exit_cancels_the_token(self):
+        async def consume(token, stop_after):
+            seen = []
+            stream = iterate_in_thread(iter(range(5)), token)
+            async for item in stream:
+                seen.append(item)
+                if len(seen) == stop_after:
+                    break
+            await stream.aclose()
+            return seen
+
+        token = CancelToken()
+        self.assertEqual(asyncio.run(consume(token, 10)), [0, 1, 2, 3, 4])
+        self.assertFalse(token.cancelled)
+
+        token = CancelToken()
+        self.assertEqual(asyncio.run(consume(token, 2)), [0, 1])
+        self.assertTrue(token.cancelled)
+
+    def test_generator_runs_under_the_token(self):
+        def stages():
+            yield current_token()
+            yield current_token()
+
+        async def consume(token):
+            return [item async for item in iterate_in_thread(stages(), token)]
+
+        token = CancelToken()
+        self.assertEqual(asyncio.run(consume(token)), [token, token])
+        self.assertIsNone(current_token())
+
+    def test_gateway_refuses_cancelled_requests(self):
+        gateway = LLMGateway(max_concurrency=2, model_limits={})
+        client = MagicMock()
+        token = CancelToken()
+        token.cancel("gone")
+        with cancel_scope(token), self.assertRaises(RunCancelled):
+            gateway.chat_completion(client, model="m", messages=[])
+        client.chat.completions.create.assert_not_called()
+
+
+class TestAgentCancellation(unittest.TestCase):
+    def setUp(self):
+        self.table = {"header": ["Name"], "rows": [["Alice"]]}
+
+    @patch("agent.tablesage_agent.AGENT_STREAM_COMPLETIONS", False)
+    @patch("agent.tablesage_agent.get_async_openai_client")
+    def test_cancel_stops_before_the_next_step(self, mock_client):
+        async_llm(mock_client)
+        practice = make_tool_call("call_0", "practice_question", {"table_id": "t0"})
+        create = mock_client.return_value.chat.completions.create
+        create.side_effect = [make_response([practice]), make_response([], content="<Answer>1</Answer>", finish_reason="stop")]
+        token = CancelToken()
+        tokens_seen = []
+
+        def execute(name, args):
+            tokens_seen.append(current_token())
+            return {"table_id": "t0", "is_correct": True}
+
+        agent = TableSageAgent(max_steps=3, prefetch_retrieval=False, fast_path=False)
+        events = []
+        with patch.object(TableSageAgent, "_execute_tool", side_effect=execute):
+            for event in agent.run_stream("Who?", self.table, cancel_token=token):
+                events.append(event)
+                if event["step"] == "tool_result":
+                    token.cancel("client disconnected")
+
+        # the tool ran under the request's token; no further LLM call was made
+        self.assertIs(tokens_seen[0], token)
+        self.assertEqual(create.call_count, 1)
+        self.assertEqual(events[-1]["step"], "cancelled")
+
+    @patch("agent.tablesage_agent.get_async_openai_client")
+    def test_cancel_closes_an_in_flight_stream(self, mock_client):
+        async_llm(mock_client)
+        token = CancelToken()
+        closed = []
+
+        class Chunks:
+            async def __aiter__(self):
+                for text in ["<Answer>", "Ali", "ce</Answer>"]:
+                    delta = SimpleNamespace(content=text, tool_calls=None)
+                    yield SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=None)])
+                    token.cancel("client disconnected")
+
+            async def close(self):
+                closed.append(True)
+
+        mock_client.return_value.chat.completions.create.side_effect = [Chunks()]
+        agent = TableSageAgent(max_steps=3, prefetch_retrieval=False)
+        events = list(agent.run_stream("Who?", self.table, cancel_token=token))
+
+        self.assertEqual([e["content"] for e in events if e["step"] == "answer_chunk"], ["<Answer>"])
+        self.assertEqual(closed, [True])
+        self.assertEqual(events[-1]["step"], "cancelled")
+
+
+if __name__ == "__main__":
+    unittest.main()
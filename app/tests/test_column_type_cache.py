@@ -0,0 +1,73 @@
+import unittest
+from unittest.mock import patch
+
+from utils import table_structure_extract
+from utils.table_structure_extract import ColumnTypeCache, get_table_structure_from_api
+
+
+class TestColumnTypeCache(unittest.TestCase):
+    def setUp(self):
+        self.table = {
+            "header": ["Year", "Name", "Country"],
+            "rows": [["2001", "James", "UK"]],
+        }
+        self.cache = ColumnTypeCache(max_size=10, persistent=False, model_version="v1")
+        patcher = patch.object(table_structure_extract, "column_type_cache", self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _response(self, types, model_version="v1"):
+        return {"table_structure": types, "model_version": model_version}
+
+    @patch("utils.table_structure_extract._post_headers")
+    def test_only_unseen_headers_reach_the_service(self, mock_post):
+        mock_post.return_value = self._response(["date", "string", "string"])
+        first = get_table_structure_from_api(self.table)
+
+        mock_post.return_value = self._response(["int"])
+        table = {"header": ["Year", "Rank"], "rows": [["2001", "3"]]}
+        second = get_table_structure_from_api(table)
+
+        self.assertEqual(first, ["date", "string", "string"])
+        self.assertEqual(second, ["date", "int"])
+        self.assertEqual(mock_post.call_args[0][1], ['Rank("3")'])
+        stats = self.cache.stats()
+        self.assertEqual(stats["memory_hits"], 1)
+        self.assertEqual(stats["misses"], 4)
+
+    @patch("utils.table_structure_extract._post_headers")
+    def test_model_version_change_invalidates(self, mock_post):
+        mock_post.return_value = self._response(["date", "string", "string"])
+        get_table_structure_from_api(self.table)
+
+        self.cache.set_model_version("v2")
+        self.assertEqual(self.cache.get_many(['Year("2001")']), {})
+        self.assertEqual(self.cache.stats()["size"], 0)
+
+    def test_version_switch_keeps_other_workers_rows(self):
+        cache = ColumnTypeCache(max_size=10, persistent=True, model_version="fp32")
+        with patch.object(ColumnTypeCache, "_db") as mock_db:
+            cache.set_model_version("int8")
+            cache.get_many(['Year("2001")'])
+        # Only a lookup scoped to the new version; rows of the old one are left to the TTL index
+        self.assertEqual([call[0] for call in mock_db.return_value.method_calls], ["batch_get_column_types"])
+        self.assertEqual(mock_db.return_value.batch_get_column_types.call_args.args[1], "int8")
+
+    @patch("utils.table_structure_extract._post_headers")
+    def test_service_failure_falls_back_without_caching(self, mock_post):
+        mock_post.side_effect = ConnectionError("service down")
+        result = get_table_structure_from_api(self.table)
+
+        self.assertEqual(result, ["date", "string", "string"])
+        self.assertEqual(self.cache.stats()["size"], 0)
+
+    def test_lru_eviction(self):
+        cache = ColumnTypeCache(max_size=2, persistent=False, model_version="v1")
+        cache.put_many({"a": "int", "b": "int"})
+        cache.get_many(["a"])
+        cache.put_many({"c": "int"})
+        self.assertEqual(set(cache.get_many(["a", "b", "c"])), {"a", "c"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import json
+import unittest
+
+from agent.context_compaction import ContextCompactor, summarize_tool_content
+
+
+def search_result(ids):
+    return json.dumps({
+        "question_searched": "How many gold medals did Norway win?",
+        "results": [
+            {"table_id": tid, "question": "q" * 300, "history_status": "Lesson Learned",
+             "rethink_summary": "r" * 200, "similarity": 0.8}
+            for tid in ids
+        ],
+        "instruction": "Scan the results. " * 20,
+    })
+
+
+def step(call_id, name, content):
+    return [
+        {"role": "assistant", "content": None, "tool_calls": [
+            {"id": call_id, "type": "function", "function": {"name": name, "arguments": "{}"}}]},
+        {"role": "tool", "tool_call_id": call_id, "content": content},
+    ]
+
+
+class TestContextCompaction(unittest.TestCase):
+    def setUp(self):
+        self.messages = [
+            {"role": "system", "content": "system prompt"},
+            {"role": "user", "content": "## User's Table:\n" + "| a | b |\n" * 50},
+        ]
+        self.messages += step("c1", "search_knowledge", search_result(["t1", "t2", "t3", "t4", "t5", "t6", "t7"]))
+        self.messages += step("c2", "practice_question", json.dumps({"table_id": "t1", "is_correct": True, "new_reflection": "x" * 500}))
+        self.messages += step("c3", "search_knowledge", search_result(["t8"]))
+
+    def test_old_tool_results_are_summarized(self):
+        compactor = ContextCompactor(budget=100000, keep_recent_steps=1)
+        original = json.loads(json.dumps(self.messages))
+        sent = compactor.compact(self.messages)
+
+        self.assertEqual(self.messages, original)
+        self.assertEqual(len(sent), len(self.messages))
+        self.assertEqual(sent[:2], self.messages[:2])
+        # the latest step is sent in full
+        self.assertEqual(sent[-1], self.messages[-1])
+        old_search = json.loads(sent[3]["content"])
+        self.assertTrue(old_search["compacted"])
+        self.assertNotIn("instruction", old_search)
+        self.assertEqual([r["table_id"] for r in old_search["results"][:5]], ["t1", "t2", "t3", "t4", "t5"])
+        self.assertEqual(old_search["results"][5], "... 2 more")
+        self.assertEqual(json.loads(sent[5]["content"])["table_id"], "t1")
+        self.assertEqual([m.get("tool_call_id") for m in sent], [m.get("tool_call_id") for m in self.messages])
+
+        report = compactor.report()
+        self.assertGreater(report["tokens_saved"], 0)
+        self.assertEqual(report["steps"][0]["compacted"], 2)
+
+    def test_budget_summarizes_recent_results(self):
+        loose = ContextCompactor(budget=100000)
+        loose_tokens = loose.message_tokens
+        full = sum(loose_tokens(m) for m in loose.compact(self.messages))
+
+        compactor = ContextCompactor(budget=full - 50)
+        sent = compactor.compact(self.messages)
+        self.assertTrue(json.loads(sent[-1]["content"])["compacted"])
+        self.assertLessEqual(compactor.report()["sent_tokens"], full - 50)
+        self.assertFalse(compactor.steps[0]["over_budget"])
+
+    def test_small_results_and_disabled_mode(self):
+        think = json.dumps({"acknowledged": True, "confidence_score": 0.9})
+        self.assertIn("compacted", summarize_tool_content(think))
+        messages = self.messages[:2] + step("c1", "think", think) + step("c2", "think", think)
+        sent = ContextCompactor(budget=100000).compact(messages)
+        self.assertEqual(sent[3]["content"], think)
+
+        disabled = ContextCompactor(enabled=False)
+        self.assertIs(disabled.compact(self.messages), self.messages)
+        self.assertEqual(disabled.report()["tokens_saved"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+from openai_api.openai_client import LLMGateway
+from utils.deadline import (
+    DeadlineExceeded, clamp_timeout, deadline_after, deadline_scope, remaining, submit_with_context,
+)
+
+
+class TestDeadline(unittest.TestCase):
+    def test_scope_clamps_and_only_shortens(self):
+        self.assertIsNone(remaining())
+        self.assertEqual(clamp_timeout(60.0), 60.0)
+        with deadline_scope(deadline_after(2.0)):
+            self.assertLessEqual(clamp_timeout(60.0), 2.0)
+            self.assertEqual(clamp_timeout(0.5), 0.5)
+            with deadline_scope(deadline_after(10.0)):
+                self.assertLessEqual(remaining(), 2.0)
+            with deadline_scope(deadline_after(1.0)):
+                self.assertLessEqual(remaining(), 1.0)
+        self.assertIsNone(remaining())
+
+    def test_expired_deadline(self):
+        with self.assertRaises(DeadlineExceeded):
+            with deadline_scope(time.monotonic() - 1):
+                pass
+        with deadline_scope(deadline_after(0.05)):
+            time.sleep(0.06)
+            with self.assertRaises(DeadlineExceeded):
+                clamp_timeout(60.0)
+
+    def test_submit_with_context_carries_deadline(self):
+        with ThreadPoolExecutor(max_workers=1) as pool, deadline_scope(deadline_after(5.0)):
+            self.assertIsNotNone(submit_with_context(pool, remaining).result())
+            self.assertIsNone(pool.submit(remaining).result())
+
+    def test_gateway_clamps_request_timeout(self):
+        gateway = LLMGateway(max_concurrency=2, model_limits={}, timeout=60.0)
+        client = MagicMock(max_retries=2)
+        gateway.chat_completion(client, model="m", messages=[])
+        self.assertNotIn("timeout", client.chat.completions.create.call_args.kwargs)
+        with deadline_scope(deadline_after(3.0)):
+            gateway.chat_completion(client, model="m", messages=[], timeout=60.0)
+        client.with_options.assert_called_once_with(max_retries=0)
+        create = client.with_options.return_value.chat.completions.create
+        self.assertLessEqual(create.call_args.kwargs["timeout"], 3.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from core_progress.guidance_processor import GuidancingProcessor
+from utils.cancellation import CancelToken, cancel_scope, current_token
+
+
+class TestSpeculativeStrategies(unittest.TestCase):
+    def make_processor(self, speculative, correct_strategies, delay=0.05):
+        with patch("core_progress.guidance_processor.DatabaseManager"), \
+                patch("core_progress.guidance_processor.OpenAIClient"):
+            processor = GuidancingProcessor(speculative=speculative)
+        processor.find_optimal_strategy = MagicMock(return_value="schema_linking")
+        processor._handle_success_case = MagicMock(return_value=("success", None))
+        processor._handle_failure_case = MagicMock(return_value=("failure", None))
+        self.calls = []
+        lock = threading.Lock()
+
+        def try_strategy(table_id, knowledge, strategy):
+            with lock:
+                self.calls.append(strategy)
+            time.sleep(delay)
+            return {"is_correct": strategy in correct_strategies, "model_answer": f"answer-{strategy}"}
+
+        processor._try_single_strategy = try_strategy
+        return processor
+
+    def test_preference_order_wins_over_completion_order(self):
+        for speculative in (False, True):
+            processor = self.make_processor(speculative, {"cot", "coloumn_sorting"})
+            processor._reteach_problem(1, {"answer": "x"}, {"flag": 1})
+            strategy = processor._handle_success_case.call_args[0][2]
+            # optimal strategy first, then the remaining ones in declared order
+            self.assertEqual(strategy, "cot")
+            self.assertEqual(processor._handle_success_case.call_args[0][4], 1)
+
+    def test_failure_uses_last_strategy_answer(self):
+        for speculative in (False, True):
+            processor = self.make_processor(speculative, set())
+            processor._reteach_problem(1, {"answer": "x"}, {"flag": 1, "guidance_error_count": 2})
+            args = processor._handle_failure_case.call_args[0]
+            self.assertEqual(args[3], "answer-coloumn_sorting")
+            self.assertEqual(args[6], 2)
+            processor._handle_success_case.assert_not_called()
+
+    def test_speculative_mode_costs_one_round_trip(self):
+        processor = self.make_processor(True, set(), delay=0.2)
+        start = time.perf_counter()
+        processor._reteach_problem(1, {"answer": "x"}, None)
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(sorted(self.calls), sorted(processor.available_strategies))
+
+    def test_speculative_mode_is_opt_in(self):
+        with patch("core_progress.guidance_processor.DatabaseManager"), \
+                patch("core_progress.guidance_processor.OpenAIClient"):
+            self.assertFalse(GuidancingProcessor().speculative)
+
+    def test_losing_strategies_are_cancelled(self):
+        processor = self.make_processor(True, {"schema_linking"})
+        seen = {}
+
+        def try_strategy(table_id, knowledge, strategy):
+            if strategy != "schema_linking":
+                # a loser still waiting for its model call
+                deadline = time.monotonic() + 1
+                while not current_token().cancelled and time.monotonic() < deadline:
+                    time.sleep(0.01)
+            seen[strategy] = current_token().cancelled
+            return {"is_correct": strategy == "schema_linking", "model_answer": strategy}
+
+        processor._try_single_strategy = try_strategy
+        request = CancelToken()
+        with cancel_scope(request):
+            processor._reteach_problem(1, {"answer": "x"}, None)
+        time.sleep(0.1)
+        self.assertFalse(seen["schema_linking"])
+        self.assertTrue(all(cancelled for strategy, cancelled in seen.items() if strategy != "schema_linking"))
+        self.assertEqual(len(seen), len(processor.available_strategies))
+        self.assertFalse(request.cancelled)
+
+
+class TestConcurrentGuidance(unittest.TestCase):
+    def setUp(self):
+        self.db = MagicMock()
+        self.db.batch_get_knowledge_by_ids.return_value = {
+            tid: {"table_id": tid, "question": f"q{tid}", "answer": f"a{tid}"} for tid in (1, 2, 3, 4)
+        }
+        self.db.batch_get_learning_records.return_value = {
+            1: {"table_id": 1, "flag": 3},
+            2: {"table_id": 2, "flag": 1, "guidance_error_count": 0, "rethink_summary": "s"},
+            3: {"table_id": 3, "flag": 2, "rethink_summary": "s"},
+        }
+        self.db.batch_get_teaching_records.return_value = {2: {"table_id": 2, "strategy_type": "schema_linking"}}
+        self.db.get_guidance_knowledge_with_lookup.return_value = []
+        with patch("core_progress.guidance_processor.DatabaseManager", return_value=self.db), \
+                patch("core_progress.guidance_processor.OpenAIClient"):
+            self.processor = GuidancingProcessor(speculative=False, max_workers=4)
+        self.processor._generate_student_reflection = MagicMock(return_value="reflection")
+        self.processor._generate_student_error_summary = MagicMock(return_value="error summary")
+
+    def test_guidance_runs_concurrently_and_commits_in_bulk(self):
+        active, peak = [0], [0]
+        lock = threading.Lock()
+        # 1 and 4 succeed with cot, 2 and 3 fail every strategy
+        correct = {1, 4}
+
+        def try_strategy(table_id, knowledge, strategy):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+            return {"table_id": table_id, "is_correct": table_id in correct, "model_answer": "m"}
+
+        self.processor._try_single_strategy = try_strategy
+        result = self.processor.process_guidance([1, 2, 3, 4, 5], initial_confidence=0.5, total_questions=10)
+
+        self.assertGreater(peak[0], 1)
+        guided = result["guided_results"]
+        self.assertEqual([r["table_id"] for r in guided], [1, 2, 3, 4, 5])
+        self.assertEqual([r.get("guidance_result") for r in guided],
+                         ["new_success", "flag1_error_count_increase", "flag2_no_change", "new_success", None])
+        self.assertEqual(guided[4]["error"], "Knowledge not found")
+        self.assertEqual(result["updated_records"], [{"table_id": 1, "flag": 1}, {"table_id": 4, "flag": 1}])
+        # 5 from the first round + 2 newly guided
+        self.assertAlmostEqual(result["recalculated_confidence"], 0.7)
+
+        learning_updates = dict(self.db.bulk_update_learning_records.call_args[0][0])
+        self.assertEqual(learning_updates[1]["flag"], 1)
+        self.assertEqual(learning_updates[2], {"guidance_error_count": 1})
+        self.assertEqual(sorted(learning_updates), [1, 2, 4])
+        teaching_ops = self.db.bulk_write_teaching_records.call_args[0][0]
+        self.assertEqual(sorted((action, tid) for action, tid, _ in teaching_ops), [("insert", 1), ("insert", 4)])
+
+        for single in ("get_knowledge_by_id", "get_learning_record", "get_teaching_record",
+                       "add_or_update_learning_record", "update_teaching_record", "add_teaching_record"):
+            getattr(self.db, single).assert_not_called()
+
+    def test_overlapping_calls_keep_their_own_batches(self):
+        knowledge = self.db.batch_get_knowledge_by_ids.return_value
+        self.db.batch_get_knowledge_by_ids.side_effect = lambda ids: {tid: knowledge[tid] for tid in ids}
+        self.db.batch_get_learning_records.side_effect = lambda ids: {}
+        self.db.batch_get_teaching_records.side_effect = lambda ids: {}
+        second_done = threading.Event()
+
+        def try_strategy(table_id, knowledge, strategy):
+            if table_id == 1:
+                # the first call is still guiding while the second one starts and commits
+                second_done.wait(timeout=5)
+            return {"table_id": table_id, "is_correct": True, "model_answer": "m"}
+
+        self.processor._try_single_strategy = try_strategy
+        results = {}
+        first = threading.Thread(target=lambda: results.setdefault(1, self.processor.process_guidance([1])))
+        first.start()
+        results[2] = self.processor.process_guidance([2])
+        second_done.set()
+        first.join(timeout=5)
+
+        self.assertEqual(results[1]["updated_records"], [{"table_id": 1, "flag": 1}])
+        self.assertEqual(results[2]["updated_records"], [{"table_id": 2, "flag": 1}])
+        committed = [[tid for tid, _ in call[0][0]] for call in self.db.bulk_update_learning_records.call_args_list]
+        self.assertEqual(committed, [[2], [1]])
+        teaching = [[tid for _, tid, _ in call[0][0]] for call in self.db.bulk_write_teaching_records.call_args_list]
+        self.assertEqual(teaching, [[2], [1]])
+        # nothing bypassed the batches
+        self.db.add_or_update_learning_record.assert_not_called()
+        self.db.add_teaching_record.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
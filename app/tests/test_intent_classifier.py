@@ -0,0 +1,109 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from agent.intent_classifier import IntentClassifier, train_intent_model
+from agent.router_agent import RouterAgent
+
+
+def make_response(content):
+    response = MagicMock()
+    response.choices[0].message.content = content
+    return response
+
+
+def flags(plan):
+    return plan["needs_data_query"], plan["needs_visualization"], plan["needs_report"]
+
+
+class TestIntentRules(unittest.TestCase):
+    def setUp(self):
+        self.classifier = IntentClassifier(model_path=None)
+
+    def test_single_intent_inputs_are_decided_locally(self):
+        cases = {
+            "画一个饼图": (False, True, False),
+            "Draw a bar chart of the scores": (False, True, False),
+            "平均分是多少？": (True, False, False),
+            "How many students scored above 90?": (True, False, False),
+            "生成一份分析报告": (False, False, True),
+        }
+        for text, expected in cases.items():
+            plan = self.classifier.classify(text, has_cached_data=False)
+            self.assertIsNotNone(plan, text)
+            self.assertEqual(flags(plan), expected, text)
+            self.assertEqual(plan["router_source"], "rules")
+            self.assertEqual(plan["core_question"], text)
+
+    def test_ambiguous_inputs_go_to_the_llm(self):
+        self.assertIsNone(self.classifier.classify("找出前3名并画柱状图", False))  # several intents
+        self.assertIsNone(self.classifier.classify("不要画图，只看数据", False))  # negation
+        self.assertIsNone(self.classifier.classify("你好", False))  # no cue
+        self.assertIsNone(self.classifier.classify("x" * 500, False))  # too long
+
+    def test_back_references_need_history_resolved_by_the_llm(self):
+        history = [{"role": "user", "content": "列出所有学生"}]
+        self.assertIsNone(self.classifier.classify("它们的平均分是多少", False, history))
+        self.assertIsNotNone(self.classifier.classify("它们的平均分是多少", False, []))
+        # a chart of the previous result needs no rewritten core_question
+        self.assertEqual(flags(self.classifier.classify("把它画成饼图", True, history)), (False, True, False))
+
+
+class TestIntentModel(unittest.TestCase):
+    def test_model_decides_what_the_rules_cannot(self):
+        decisions = []
+        for i in range(30):
+            decisions.append({"user_input": f"show me table trend {i}",
+                              "plan": {"needs_data_query": False, "needs_visualization": True, "needs_report": False}})
+            decisions.append({"user_input": f"list the rows for class {i}",
+                              "plan": {"needs_data_query": True, "needs_visualization": False, "needs_report": False}})
+        classifier = IntentClassifier(model_path=None, min_confidence=0.6)
+        classifier.set_model(train_intent_model(decisions))
+
+        plan = classifier.classify("show me table trend", False)
+        self.assertEqual((plan["router_source"], flags(plan)), ("model", (False, True, False)))
+        self.assertEqual(flags(classifier.classify("list the rows for class", False)), (True, False, False))
+
+    def test_model_uses_the_context_the_labels_depended_on(self):
+        decisions = []
+        for i in range(30):
+            # with data at hand the LLM only redraws; without it the data must be queried first
+            decisions.append({"user_input": f"trend for class {i}", "has_cached_data": True, "has_history": True,
+                              "plan": {"needs_data_query": False, "needs_visualization": True, "needs_report": False}})
+            decisions.append({"user_input": f"trend for class {i}", "has_cached_data": False, "has_history": False,
+                              "plan": {"needs_data_query": True, "needs_visualization": True, "needs_report": False}})
+        classifier = IntentClassifier(model_path=None, min_confidence=0.6)
+        classifier.set_model(train_intent_model(decisions))
+
+        self.assertEqual(flags(classifier.classify("trend for class", False)), (True, True, False))
+        cached = classifier.classify("trend for class", True, [{"role": "user", "content": "q"}])
+        self.assertEqual(flags(cached), (False, True, False))
+
+    def test_too_few_decisions_are_rejected(self):
+        with self.assertRaises(ValueError):
+            train_intent_model([{"user_input": "a", "plan": {"needs_data_query": True}}])
+
+
+class TestRouterAgent(unittest.TestCase):
+    def test_confident_inputs_skip_the_llm(self):
+        router = RouterAgent()
+        router.classifier = IntentClassifier(model_path=None)
+        with patch("agent.router_agent.llm_gateway.achat_completion", new_callable=AsyncMock) as call:
+            plan = asyncio.run(router.analyze_intent("画一个饼图", has_cached_data=True))
+        call.assert_not_awaited()
+        self.assertEqual(flags(plan), (False, True, False))
+
+    @patch("agent.router_agent.ROUTER_LOG_DECISIONS", False)
+    def test_uncertain_inputs_use_the_llm(self):
+        router = RouterAgent()
+        router.classifier = IntentClassifier(model_path=None)
+        reply = make_response('{"needs_data_query": true, "needs_visualization": true, "needs_report": false, '
+                              '"core_question": "top 3", "visualization_instruction": "bar"}')
+        with patch("agent.router_agent.llm_gateway.achat_completion", new=AsyncMock(return_value=reply)) as call:
+            plan = asyncio.run(router.analyze_intent("找出前3名并画柱状图", has_cached_data=False))
+        call.assert_awaited_once()
+        self.assertEqual((flags(plan), plan["router_source"]), ((True, True, False), "llm"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from openai_api.llm_cache import LLMResponseCache, cache_key
+from utils.cancellation import CancelToken, RunCancelled, cancel_scope
+from utils.deadline import DeadlineExceeded, deadline_after, deadline_scope
+
+
+class TestLLMResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = LLMResponseCache(max_size=2, ttl=60, persistent=False, max_temperature=0.2, enabled=True)
+        self.messages = [{"role": "user", "content": "Question?"}]
+
+    def test_key_is_canonical(self):
+        a = cache_key("m", [{"role": "user", "content": "Q\r\n"}], 0)
+        b = cache_key("m", [{"content": "Q", "role": "user", "name": None}], 0.0)
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, cache_key("m", [{"role": "user", "content": "Q"}], 0.1))
+        self.assertNotEqual(a, cache_key("other", [{"role": "user", "content": "Q"}], 0))
+
+    def test_concurrent_identical_calls_share_one_request(self):
+        calls = []
+        gate = threading.Event()
+
+        def compute():
+            calls.append(1)
+            gate.wait(1)
+            return "<Answer>42</Answer>"
+
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            futures = [pool.submit(self.cache.get_or_compute, "m", self.messages, 0.0, compute) for _ in range(5)]
+            time.sleep(0.1)
+            gate.set()
+            results = [f.result() for f in futures]
+
+        self.assertEqual(results, ["<Answer>42</Answer>"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.cache.get_or_compute("m", self.messages, 0.0, lambda: "new"), "<Answer>42</Answer>")
+
+    def test_high_temperature_bypasses_cache(self):
+        answers = iter(["a", "b"])
+        self.cache.get_or_compute("m", self.messages, 0.7, lambda: next(answers))
+        self.assertEqual(self.cache.get_or_compute("m", self.messages, 0.7, lambda: next(answers)), "b")
+        self.assertEqual(self.cache.stats()["bypassed"], 2)
+
+    def test_ttl_and_errors(self):
+        cache = LLMResponseCache(ttl=0, persistent=False, max_temperature=0.2, enabled=True)
+        cache.get_or_compute("m", self.messages, 0.0, lambda: "old")
+        time.sleep(0.01)
+        self.assertEqual(cache.get_or_compute("m", self.messages, 0.0, lambda: "fresh"), "fresh")
+
+        def boom():
+            raise RuntimeError("llm down")
+        with self.assertRaises(RuntimeError):
+            self.cache.get_or_compute("m", [{"role": "user", "content": "x"}], 0.0, boom)
+        self.assertEqual(self.cache.stats()["inflight"], 0)
+
+    def test_async_single_flight(self):
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        async def main():
+            return await asyncio.gather(*[
+                self.cache.aget_or_compute("m", self.messages, 0.0, compute) for _ in range(4)
+            ])
+
+        self.assertEqual(asyncio.run(main()), ["ok"] * 4)
+        self.assertEqual(len(calls), 1)
+
+    def test_follower_takes_over_when_the_leader_is_cancelled(self):
+        leader_started, release_leader = threading.Event(), threading.Event()
+        calls = []
+
+        def leader_compute():
+            calls.append("leader")
+            leader_started.set()
+            release_leader.wait(1)
+            raise RunCancelled("client disconnected")
+
+        def follower_compute():
+            calls.append("follower")
+            return "ok"
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(self.cache.get_or_compute, "m", self.messages, 0.0, leader_compute)
+            leader_started.wait(1)
+            follower = pool.submit(self.cache.get_or_compute, "m", self.messages, 0.0, follower_compute)
+            time.sleep(0.05)
+            release_leader.set()
+            with self.assertRaises(RunCancelled):
+                leader.result()
+            self.assertEqual(follower.result(), "ok")
+        self.assertEqual(calls, ["leader", "follower"])
+
+        # a real failure of the completion is still shared
+        gate = threading.Event()
+
+        def failing():
+            gate.wait(1)
+            raise RuntimeError("llm down")
+
+        other = [{"role": "user", "content": "other"}]
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            futures = [pool.submit(self.cache.get_or_compute, "m", other, 0.0, failing) for _ in range(2)]
+            time.sleep(0.05)
+            gate.set()
+            for future in futures:
+                self.assertRaises(RuntimeError, future.result)
+
+    def test_follower_honours_its_own_deadline_and_token(self):
+        gate = threading.Event()
+
+        def slow():
+            gate.wait(2)
+            return "late"
+
+        def follow_with_deadline():
+            with deadline_scope(deadline_after(0.1)):
+                return self.cache.get_or_compute("m", self.messages, 0.0, lambda: "unused")
+
+        token = CancelToken()
+
+        async def follow_with_token():
+            async def unused():
+                return "unused"
+            with cancel_scope(token):
+                return await self.cache.aget_or_compute("m", self.messages, 0.0, unused)
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(self.cache.get_or_compute, "m", self.messages, 0.0, slow)
+            time.sleep(0.05)
+            start = time.perf_counter()
+            with self.assertRaises(DeadlineExceeded):
+                follow_with_deadline()
+            self.assertLess(time.perf_counter() - start, 0.5)
+
+            threading.Timer(0.1, token.cancel).start()
+            with self.assertRaises(RunCancelled):
+                asyncio.run(follow_with_token())
+            gate.set()
+            self.assertEqual(leader.result(), "late")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+from openai_api.openai_client import LLMGateway
+
+
+class _ConcurrencyProbe:
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def enter(self):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+    def exit(self):
+        with self._lock:
+            self.active -= 1
+
+
+class TestLLMGateway(unittest.TestCase):
+    def test_clients_are_shared_per_endpoint(self):
+        gateway = LLMGateway()
+        self.assertIs(gateway.get_client("k", "http://a/v1"), gateway.get_client("k", "http://a/v1"))
+        self.assertIsNot(gateway.get_client("k", "http://a/v1"), gateway.get_client("k", "http://b/v1"))
+
+    def test_sync_calls_respect_model_limit(self):
+        gateway = LLMGateway(max_concurrency=8, model_limits={"small": 2})
+        probe = _ConcurrencyProbe()
+        client = MagicMock()
+
+        def create(**kwargs):
+            probe.enter()
+            time.sleep(0.05)
+            probe.exit()
+            return "ok"
+
+        client.chat.completions.create.side_effect = create
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            results = list(pool.map(lambda _: gateway.chat_completion(client, model="small", messages=[]), range(6)))
+
+        self.assertEqual(results, ["ok"] * 6)
+        self.assertEqual(probe.peak, 2)
+        stats = gateway.stats()["small"]
+        self.assertEqual(stats["calls"], 6)
+        self.assertGreater(stats["avg_wait_ms"], 0)
+
+    def test_async_calls_respect_global_limit(self):
+        gateway = LLMGateway(max_concurrency=3, model_limits={})
+        probe = _ConcurrencyProbe()
+        client = MagicMock()
+
+        async def create(**kwargs):
+            probe.enter()
+            await asyncio.sleep(0.02)
+            probe.exit()
+            if kwargs["messages"] == "boom":
+                raise RuntimeError("boom")
+            return "ok"
+
+        client.chat.completions.create.side_effect = create
+
+        async def main():
+            calls = [gateway.achat_completion(client, model="m", messages=[]) for _ in range(9)]
+            calls.append(gateway.achat_completion(client, model="m", messages="boom"))
+            return await asyncio.gather(*calls, return_exceptions=True)
+
+        results = asyncio.run(main())
+        self.assertEqual(results[:9], ["ok"] * 9)
+        self.assertIsInstance(results[9], RuntimeError)
+        self.assertEqual(probe.peak, 3)
+        self.assertEqual(gateway.stats()["m"]["errors"], 1)
+
+    def test_limit_is_shared_by_threads_and_every_event_loop(self):
+        gateway = LLMGateway(max_concurrency=3, model_limits={})
+        probe = _ConcurrencyProbe()
+        client = MagicMock()
+
+        def create(**kwargs):
+            probe.enter()
+            time.sleep(0.03)
+            probe.exit()
+            return "ok"
+
+        async def acreate(**kwargs):
+            probe.enter()
+            await asyncio.sleep(0.03)
+            probe.exit()
+            return "ok"
+
+        async_client = MagicMock()
+        async_client.chat.completions.create.side_effect = acreate
+        client.chat.completions.create.side_effect = create
+
+        def private_loop(_):
+            # like TableSageAgent.run(): each sync run drives its own event loop
+            async def main():
+                return await asyncio.gather(*[
+                    gateway.achat_completion(async_client, model="m", messages=[]) for _ in range(3)
+                ])
+            return asyncio.run(main())
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            loops = [pool.submit(private_loop, i) for i in range(4)]
+            sync = [pool.submit(gateway.chat_completion, client, model="m", messages=[]) for _ in range(4)]
+            results = [f.result() for f in loops + sync]
+
+        self.assertEqual(results[:4], [["ok"] * 3] * 4)
+        self.assertEqual(results[4:], ["ok"] * 4)
+        self.assertEqual(probe.peak, 3)
+        self.assertEqual(gateway.stats()["m"]["calls"], 16)
+
+    def test_cancelled_waiter_does_not_leak_a_slot(self):
+        gateway = LLMGateway(max_concurrency=1, model_limits={})
+
+        async def main():
+            async with gateway._async_slot("m"):
+                waiter = asyncio.ensure_future(gateway._async_slot("m").__aenter__())
+                await asyncio.sleep(0.01)
+                waiter.cancel()
+            async with gateway._async_slot("m"):
+                return "free"
+
+        self.assertEqual(asyncio.run(asyncio.wait_for(main(), 1)), "free")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from openai_api.model_router import ModelRouter, _parse_spec
+
+
+def make_response(content, finish_reason="stop"):
+    response = MagicMock()
+    response.choices[0].message.content = content
+    response.choices[0].message.tool_calls = []
+    response.choices[0].finish_reason = finish_reason
+    return response
+
+
+class TestModelRouter(unittest.TestCase):
+    def test_routes_resolve_to_configured_models(self):
+        router = ModelRouter(models={"practice": "small"}, max_tokens={"practice": 512}, default_model="main")
+        self.assertEqual(tuple(router.route("practice")), ("practice", "small", 512))
+        self.assertEqual(tuple(router.route("final_answer")), ("final_answer", "main", None))
+        self.assertEqual(tuple(router.route(None)), ("default", "main", None))
+        # a model chosen by the caller wins over the route's model, the token limit still applies
+        self.assertEqual(tuple(router.route("practice", "gpt-4o")), ("practice", "gpt-4o", 512))
+
+    def test_spec_parsing(self):
+        self.assertEqual(_parse_spec(" practice = small ,reflection=small,bad"), {"practice": "small", "reflection": "small"})
+
+    def test_latency_errors_and_accuracy_per_route_and_model(self):
+        router = ModelRouter(models={"practice": "small"}, max_tokens={}, default_model="main")
+        with router.timed(router.route("practice")):
+            pass
+        with self.assertRaises(ValueError), router.timed(router.route("practice")):
+            raise ValueError("boom")
+        router.record_outcome("practice", True)
+        router.record_outcome("practice", False)
+        router.record_outcome("practice", True)
+
+        stats = router.stats()["practice"]["small"]
+        self.assertEqual((stats["calls"], stats["errors"], stats["judged"]), (2, 1, 3))
+        self.assertAlmostEqual(stats["accuracy"], 0.6667)
+        self.assertNotIn("main", router.stats()["practice"])
+
+
+class TestRoutedCalls(unittest.TestCase):
+    def test_openai_client_uses_the_route(self):
+        from openai_api import openai_client
+        router = ModelRouter(models={"reflection": "small"}, max_tokens={"reflection": 300}, default_model="main")
+        with patch.object(openai_client, "model_router", router), \
+                patch.object(openai_client.llm_gateway, "chat_completion", return_value=make_response("ok")) as call, \
+                patch.object(openai_client, "get_openai_client"):
+            client = openai_client.OpenAIClient()
+            self.assertEqual(client.get_llm_response([{"role": "user", "content": "x"}], route="reflection"), "ok")
+            self.assertEqual((call.call_args.kwargs["model"], call.call_args.kwargs["max_tokens"]), ("small", 300))
+            client.get_llm_response([{"role": "user", "content": "x"}])
+            self.assertEqual((call.call_args.kwargs["model"], call.call_args.kwargs["max_tokens"]), ("main", 4096))
+        self.assertEqual(router.stats()["reflection"]["small"]["calls"], 1)
+
+    @patch("agent.tablesage_agent.get_async_openai_client")
+    def test_agent_steps_and_training_accuracy(self, mock_client):
+        from agent.tablesage_agent import TableSageAgent
+        router = ModelRouter(models={"agent": "small", "final_answer": "main"}, max_tokens={"agent": 800},
+                             default_model="main")
+        create = mock_client.return_value.chat.completions.create = AsyncMock(
+            return_value=make_response("<Answer>1</Answer>")
+        )
+        with patch("agent.tablesage_agent.model_router", router):
+            agent = TableSageAgent(max_steps=1, prefetch_retrieval=False)
+            result = agent.run("How many?", {"header": ["n"], "rows": [["1"]]}, is_training=True, true_answer="1")
+
+        self.assertEqual((create.call_args.kwargs["model"], create.call_args.kwargs["max_tokens"]), ("small", 800))
+        step = [t for t in result["reasoning_trace"] if t["type"] == "metrics"][0]
+        self.assertEqual((step["route"], step["model"]), ("agent", "small"))
+        self.assertTrue(result["is_correct"])
+        stats = router.stats()["agent"]["small"]
+        self.assertEqual((stats["calls"], stats["judged"], stats["accuracy"]), (1, 1, 1.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+import httpx
+
+from utils.resilient_client import CircuitBreaker, CircuitOpenError, Dependency, LatencyHistogram
+
+
+class TestResilientClient(unittest.TestCase):
+    def _dependency(self, retries=0):
+        return Dependency("test", timeout=1.0, retries=retries, failure_threshold=2, reset_timeout=60.0)
+
+    def test_breaker_opens_after_threshold_and_fails_fast(self):
+        dependency = self._dependency()
+        calls = []
+
+        def failing():
+            calls.append(1)
+            raise ConnectionError("down")
+
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                dependency.call(failing)
+        with self.assertRaises(CircuitOpenError):
+            dependency.call(failing)
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(dependency.stats()["state"], CircuitBreaker.OPEN)
+
+    def test_half_open_trial_closes_on_success(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow_request())
+        # Only one trial request may probe while half-open
+        self.assertFalse(breaker.allow_request())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_retry_then_success(self):
+        dependency = self._dependency(retries=1)
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise TimeoutError("slow")
+            return "ok"
+
+        self.assertEqual(dependency.call(flaky), "ok")
+        latency = dependency.stats()["latency"]
+        self.assertEqual(latency["count"], 2)
+        self.assertEqual(latency["errors"], 1)
+
+    def test_cancelled_trial_frees_the_half_open_slot(self):
+        dependency = Dependency("test", timeout=1.0, retries=0, failure_threshold=1, reset_timeout=0.0)
+        with self.assertRaises(ConnectionError):
+            dependency.call(self._raise, ConnectionError("down"))
+
+        async def cancelled():
+            raise asyncio.CancelledError()
+
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(dependency.acall(cancelled))
+        self.assertEqual(dependency.call(lambda: "ok"), "ok")
+        self.assertEqual(dependency.stats()["state"], CircuitBreaker.CLOSED)
+
+    def test_client_errors_do_not_open_the_breaker(self):
+        dependency = self._dependency()
+        request = httpx.Request("POST", "http://service/predict")
+        bad_request = httpx.HTTPStatusError("422", request=request, response=httpx.Response(422, request=request))
+        for _ in range(3):
+            with self.assertRaises(httpx.HTTPStatusError):
+                dependency.call(self._raise, bad_request)
+        self.assertEqual(dependency.stats()["state"], CircuitBreaker.CLOSED)
+
+        unavailable = httpx.HTTPStatusError("503", request=request, response=httpx.Response(503, request=request))
+        for _ in range(2):
+            with self.assertRaises(httpx.HTTPStatusError):
+                dependency.call(self._raise, unavailable)
+        self.assertEqual(dependency.stats()["state"], CircuitBreaker.OPEN)
+
+    def test_per_call_timeout_overrides_the_policy(self):
+        dependency = self._dependency()
+
+        async def slow():
+            await asyncio.sleep(0.2)
+            return "done"
+
+        self.assertEqual(asyncio.run(dependency.acall(slow, timeout=1.0)), "done")
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(dependency.acall(slow, timeout=0.05))
+
+    @patch("mcp_client.connection._open_session")
+    def test_mcp_calls_use_the_tool_timeout(self, mock_open):
+        from mcp_client import connection
+
+        calls = []
+
+        async def acall(fn, *args, timeout=None, **kwargs):
+            calls.append(timeout)
+            return "ok"
+
+        dependency = Dependency("mcp:charts", timeout=300.0, retries=0, failure_threshold=3, reset_timeout=60.0)
+        dependency.acall = acall
+        with patch.dict(connection.mcp_servers, {"charts": connection.MCPServerConfig(name="charts", url="http://c")}), \
+                patch.dict(connection.tool_timeouts, {"generate_chart": 600.0}), \
+                patch("mcp_client.connection._server_dependency", return_value=dependency):
+            asyncio.run(connection.call_tool("charts", "generate_chart", {}))
+            asyncio.run(connection.call_tool("charts", "other_tool", {}))
+        self.assertEqual(calls, [600.0, None])
+        self.assertEqual(connection._parse_tool_timeouts("a=120, b = 5.5,bad=x,c"), {"a": 120.0, "b": 5.5})
+
+    @staticmethod
+    def _raise(error):
+        raise error
+
+    def test_histogram_quantiles(self):
+        histogram = LatencyHistogram()
+        for seconds in [0.001] * 90 + [2.0] * 10:
+            histogram.observe(seconds)
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot["p50_le_s"], 0.005)
+        self.assertEqual(snapshot["p99_le_s"], 2.5)
+
+
+class TestEmbeddingFallback(unittest.TestCase):
+    @patch("core_progress.search_similar_question.DatabaseManager")
+    @patch("core_progress.search_similar_question.BM25Searcher")
+    def test_retrieval_keeps_the_bm25_order_without_an_embedding(self, mock_bm25, mock_db):
+        from agent.tablesage_agent import AGENT_FAST_PATH_MIN_SIMILARITY
+        from core_progress.search_similar_question import find_topn_question
+        from utils.question_skeleton_extract import deal_question_skeleton
+
+        with patch("utils.question_skeleton_extract.embedding_text", side_effect=ConnectionError("down")):
+            embedding, skeleton = deal_question_skeleton("how many rows", {"header": ["a"], "rows": [["1"]]})
+        self.assertEqual(embedding, [])
+
+        mock_bm25.return_value.search.return_value = [{"table_id": tid} for tid in ("t1", "t2", "t3")]
+        mock_db.return_value.fetch_records_by_ids.return_value = [
+            {"table_id": tid, "sk_embedding": [1.0, 0.0], "table_structure": "text"} for tid in ("t1", "t2", "t3")
+        ]
+        ids, scores = find_topn_question(skeleton, embedding, "text", top_n=2)
+        self.assertEqual(ids, ["t1", "t2"])
+        self.assertGreater(scores[0], scores[1])
+        # Lexical rank is not an embedding similarity: it must not pass the fast-path threshold
+        self.assertLess(scores[0], AGENT_FAST_PATH_MIN_SIMILARITY)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import random
+import unittest
+from unittest.mock import patch
+
+from utils.question_skeleton_extract import (
+    PUNKS, STOPWORDS, compute_cell_value_linking, preprocess_header, preprocess_question_tokens,
+)
+from utils.table_sampling import ColumnValueIndex, sample_row_ids, sample_table
+from utils.utils import TableUtils
+
+
+def brute_force_cell_value_linking(tokens, header_tokens, rows):
+    """Row-scanning reference implementation the index must agree with."""
+    def isnumber(word):
+        try:
+            float(word)
+            return True
+        except ValueError:
+            return False
+
+    def partial(word, value):
+        word = str(word).lower()
+        return f" {word} " in f" {value} " or value.startswith(f"{word} ") or value.endswith(f" {word}") or value == word
+
+    column_values = {c: [str(r[c]).lower() if r[c] is not None else "" for r in rows if c < len(r)]
+                     for c in range(len(header_tokens))}
+    num_date_match, cell_match = {}, {}
+    for col_id, values in column_values.items():
+        is_num = all(v == "" or isnumber(v) for v in values)
+        match_q_ids = []
+        for q_id, word in enumerate(tokens):
+            if not word.strip() or word.lower() in STOPWORDS or word in PUNKS:
+                continue
+            if isnumber(word) and is_num:
+                num_date_match[f"{q_id},{col_id}"] = "NUMBER"
+                continue
+            if any(v and partial(word, v) for v in values):
+                match_q_ids.append(q_id)
+        f = 0
+        while f < len(match_q_ids):
+            t = f + 1
+            while t < len(match_q_ids) and match_q_ids[t] == match_q_ids[t - 1] + 1:
+                t += 1
+            phrase = " ".join(tokens[match_q_ids[f]:match_q_ids[t - 1] + 1]).lower()
+            flag = "EXACTMATCH" if any(v and v == phrase for v in values) else "PARTIALMATCH"
+            for q_id in range(match_q_ids[f], match_q_ids[t - 1] + 1):
+                cell_match[f"{q_id},{col_id}"] = flag
+            f = t
+    return {"num_date_match": num_date_match, "cell_match": cell_match}
+
+
+class TestTableSampling(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        words = ["New", "York", "Boston", "red", "Sox", "2001", "3.5", "the", "Cup", "Final", "", None, "new york"]
+        self.header = ["City", "Team", "Year", "Score", "Notes"]
+        self.rows = [[" ".join(w for w in rng.sample(words[:10], rng.randint(1, 3)) if w) or rng.choice(words[10:])
+                      for _ in range(5)] for _ in range(300)]
+        for row in self.rows:
+            row[2] = str(rng.randint(1990, 2020))
+        self.rows[5] = self.rows[5][:3]
+
+    def test_index_matches_row_scan(self):
+        header_tokens = preprocess_header(self.header)
+        for question in ["Which team won the Cup Final in 2001?", "how many red sox games in new york",
+                         "score of boston 3.5", "New York Boston red"]:
+            tokens = preprocess_question_tokens(question)
+            self.assertEqual(
+                compute_cell_value_linking(tokens, header_tokens, self.rows),
+                brute_force_cell_value_linking(tokens, header_tokens, self.rows),
+            )
+
+    def test_small_tables_are_untouched(self):
+        table = {"header": self.header, "rows": self.rows[:20]}
+        self.assertIs(sample_table(table, max_rows=50), table)
+
+    def test_sample_is_bounded_and_prefers_question_rows(self):
+        table = {"header": self.header, "rows": self.rows}
+        self.rows[250][4] = "zeppelin"
+        row_ids = sample_row_ids(table, max_rows=20, mode="question", question="Which row mentions zeppelin?")
+        self.assertLessEqual(len(row_ids), 20)
+        self.assertIn(250, row_ids)
+        self.assertEqual(row_ids, sorted(set(row_ids)))
+
+        head_tail = sample_row_ids(table, max_rows=10, mode="head_tail")
+        self.assertEqual(head_tail, [0, 1, 2, 3, 4, 295, 296, 297, 298, 299])
+
+        sampled = sample_table(table, max_rows=10, mode="stratified")
+        self.assertEqual(len(sampled["rows"]), 11)
+        self.assertIn("showing 10 of 300 rows", sampled["rows"][-1][0])
+
+    def test_sampling_is_off_by_default_and_announced_when_on(self):
+        table = {"header": self.header, "rows": self.rows}
+        self.assertEqual(len(TableUtils.table2format(table).split("\n")), 2 + len(self.rows))
+
+        with patch("utils.utils.sample_table", side_effect=lambda t, question=None: sample_table(t, max_rows=10)):
+            formatted = TableUtils.table2format(table)
+        self.assertTrue(formatted.startswith("Note: this table has 300 rows; only a sample of 10 rows"))
+
+    def test_column_types(self):
+        index = ColumnValueIndex(2, [["1", "a"], ["", "2"], ["3.5"]])
+        self.assertEqual(index.column_types, {0: "number", 1: "text"})
+
+
+if __name__ == '__main__':
+    unittest.main()
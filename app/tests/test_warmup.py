@@ -0,0 +1,42 @@
+import asyncio
+import time
+import unittest
+
+from utils.warmup import WarmupState, run_warmup
+
+
+class TestWarmup(unittest.TestCase):
+    def test_chains_run_in_parallel_and_report_timings(self):
+        order = []
+
+        def slow(name):
+            def load():
+                time.sleep(0.2)
+                order.append(name)
+            return load
+
+        def broken():
+            raise RuntimeError("no database")
+
+        state = WarmupState()
+        chains = [[("a", slow("a"))], [("b", slow("b"))], [("db", broken), ("index", slow("index"))]]
+        start = time.perf_counter()
+        asyncio.run(run_warmup(chains, state))
+        elapsed = time.perf_counter() - start
+
+        # Three 0.2s chains in parallel, not 0.6s in sequence
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(state.status, "degraded")
+        self.assertTrue(state.ready)
+        self.assertEqual(state.resources["a"]["status"], "ok")
+        self.assertGreaterEqual(state.resources["a"]["seconds"], 0.2)
+        self.assertEqual(state.resources["db"]["error"], "no database")
+        # A failed step does not stop the rest of its chain
+        self.assertEqual(state.resources["index"]["status"], "ok")
+
+    def test_not_ready_before_run(self):
+        self.assertFalse(WarmupState().ready)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+"""
+Cooperative cancellation of request work
+
+A CancelToken is created per streaming request and cancelled when the client
+goes away. Like the request deadline (utils.deadline) it is held in a
+ContextVar while work runs, so code several calls down can stop early:
+
+  - LLMGateway refuses new completions once the token is cancelled
+  - the agent loop checks it between steps, tool groups and streamed chunks
+  - pool threads see it when started with utils.deadline.submit_with_context()
+  - the async agent loop cancels it itself when its consumer goes away, so
+    tools still running on its thread pool stop too
+  - iterate_in_thread() streams a blocking generator (TableSageProcessor.process_stream)
+    under the token and cancels it when the client goes away
+  - a child token (CancelToken(parent=...)) stops one piece of speculative work
+    without cancelling the request, and still stops when the request does
+
+Cancellation is cooperative: a blocking call already in progress finishes,
+but nothing new is started after it.
+"""
+import asyncio
+import contextvars
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+_token: contextvars.ContextVar[Optional["CancelToken"]] = contextvars.ContextVar("cancel_token", default=None)
+
+
+class RunCancelled(Exception):
+    """Raised at a cancellation check once the request has been abandoned."""
+
+
+class CancelToken:
+    """Thread-safe, one-way cancellation flag; a child token is also cancelled with its parent."""
+
+    def __init__(self, parent: Optional["CancelToken"] = None):
+        self._event = threading.Event()
+        self.reason = ""
+        self.parent = parent
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set() or (self.parent is not None and self.parent.cancelled)
+
+    def cancel(self, reason: str = "cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+            logger.info(f"Request cancelled: {reason}")
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise RunCancelled(self.reason)
+        if self.parent is not None:
+            self.parent.raise_if_cancelled()
+
+
+def current_token() -> Optional[CancelToken]:
+    return _token.get()
+
+
+def check_cancelled():
+    """Raise RunCancelled if the current context's token is cancelled."""
+    token = _token.get()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+@contextmanager
+def cancel_scope(token: Optional[CancelToken]):
+    """Make `token` the current token for the block; None keeps the current one."""
+    if token is None:
+        yield
+        return
+    reset = _token.set(token)
+    try:
+        yield
+    finally:
+        _token.reset(reset)
+
+
+async def iterate_in_thread(gen: Iterator[Any], token: CancelToken) -> AsyncIterator[Any]:
+    """
+    Drive a blocking generator from async code, one next() per executor call.
+
+    Each next() runs under `token`, so the LLM calls and DB queries it makes
+    see the cancellation. When the consumer stops early (client disconnect
+    cancels the response task, or the async generator is closed), the token is
+    cancelled so the blocking generator stops at its next check instead of
+    running to completion.
+    """
+    loop = asyncio.get_running_loop()
+    done = object()
+
+    def get_next():
+        try:
+            with cancel_scope(token):
+                return next(gen)
+        except StopIteration:
+            return done
+
+    finished = False
+    try:
+        while True:
+            item = await loop.run_in_executor(None, get_next)
+            if item is done:
+                finished = True
+                return
+            yield item
+    finally:
+        if not finished:
+            token.cancel("client disconnected")
@@ -0,0 +1,91 @@
+"""
+Per-request deadlines
+
+A deadline is an absolute time.monotonic() value held in a ContextVar, so it
+follows the code that runs inside deadline_scope() without being threaded
+through every signature:
+
+  - LLMGateway clamps the timeout of each chat completion to the time left
+  - DB queries inherit it through pymongo.timeout()
+  - work submitted with submit_with_context() carries it into pool threads
+
+Nested scopes can only shorten the deadline. Generators should not hold a
+scope across yields (their consumer may resume them from another context);
+enter the scope around each blocking unit of work instead.
+"""
+import contextvars
+import time
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from typing import Any, Callable, Optional
+
+import pymongo
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when work is started after the request deadline has passed."""
+
+
+def deadline_after(seconds: Optional[float]) -> Optional[float]:
+    """Absolute deadline `seconds` from now; None (or <= 0) means no deadline."""
+    if not seconds or seconds <= 0:
+        return None
+    return time.monotonic() + seconds
+
+
+def current_deadline() -> Optional[float]:
+    return _deadline.get()
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, or None without a deadline."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def clamp_timeout(timeout: Optional[float]) -> Optional[float]:
+    """
+    Shorten `timeout` to the time left before the current deadline.
+
+    Raises:
+        DeadlineExceeded: the deadline has already passed.
+    """
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return left if timeout is None else min(timeout, left)
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[float]):
+    """
+    Run the block under an absolute deadline (time.monotonic()); None keeps the current one.
+
+    Raises:
+        DeadlineExceeded: the deadline has already passed.
+    """
+    outer = _deadline.get()
+    if deadline is None or (outer is not None and outer <= deadline):
+        yield
+        return
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    token = _deadline.set(deadline)
+    try:
+        with pymongo.timeout(left):
+            yield
+    finally:
+        _deadline.reset(token)
+
+
+def submit_with_context(executor: Executor, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+    """executor.submit() that runs `fn` in a copy of the caller's context (deadline included)."""
+    ctx = contextvars.copy_context()
+    return executor.submit(ctx.run, fn, *args, **kwargs)
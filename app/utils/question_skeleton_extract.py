@@ -1,11 +1,13 @@
 import re
 import collections
 import string
-import tiktoken
+import functools
 from openai import OpenAI
 from typing import List, Dict, Any, Tuple, Union
 import os
-import jieba.posseg as pseg
+
+from utils.resilient_client import get_dependency
+from utils.table_sampling import get_column_index
 
 PUNKS = set(string.punctuation) - {"_"}
 STOPWORDS = {"i", "me", "my", "myself", "we", "our", "ours", "ourselves", "you", "your", "yours", "yourself", "yourselves", "he", "him", "his", "himself", "she", "her", "hers", "herself", "it", "its", "itself", "they", "them", "their", "theirs", "themselves", "this", "that", "these", "those", "am", "is", "are", "was", "were", "be", "been", "being", "have", "has", "had", "having", "do", "does", "did", "doing", "a", "an", "the", "and", "but", "if", "or", "because", "as", "until", "while", "of", "at", "by", "for", "with", "about", "against", "between", "into", "through", "during", "before", "after", "above", "below", "to", "from", "up", "down", "in", "out", "on", "off", "over", "under", "again", "further", "then", "once", "here", "there", "all", "any", "both", "each", "few", "more", "most", "other", "some", "such", "no", "nor", "not", "only", "own", "same", "so", "than", "too", "very", "s", "t", "can", "will", "just", "don", "should", "now"}
@@ -22,6 +24,8 @@ def extract_question_skeleton(question: str) -> str:
     Extract the structural skeleton of a question using POS tagging (jieba).
     Replaces LLM for speed and zero-shot entity removal.
     """
+    # Deferred: importing jieba.posseg loads its HMM tables
+    import jieba.posseg as pseg
     words = pseg.cut(question)
     
     skeleton = []
@@ -54,9 +58,33 @@ def extract_question_skeleton(question: str) -> str:
         
     return result
 
-def embedding_text(text, model=None, max_tokens=8096):
-    if model is None:
-        model = os.environ.get("EMBEDDING_MODEL", "text-embedding-ada-002")
+@functools.lru_cache(maxsize=None)
+def get_encoding(model):
+    """tiktoken encoding for a model, loaded once per process."""
+    import tiktoken
+    return tiktoken.encoding_for_model(model)
+
+def get_embedding_model():
+    return os.environ.get("EMBEDDING_MODEL", "text-embedding-ada-002")
+
+_embedding_clients: Dict[Tuple[str, str], OpenAI] = {}
+
+def _get_embedding_client(api_key, api_base):
+    """One OpenAI client per credentials, sharing the keep-alive pool of the embedding dependency."""
+    key = (api_key, api_base)
+    if key not in _embedding_clients:
+        dependency = get_dependency("embedding")
+        # Retries and deadlines are owned by the dependency, not the SDK
+        _embedding_clients[key] = OpenAI(
+            api_key=api_key,
+            base_url=api_base,
+            http_client=dependency.client,
+            timeout=dependency.timeout,
+            max_retries=0,
+        )
+    return _embedding_clients[key]
+
+def get_embedding_client():
     api_key = os.environ.get("EMBEDDING_API_KEY")
     api_base = os.environ.get("EMBEDDING_BASE_URL")
     
@@ -64,18 +92,20 @@ def embedding_text(text, model=None, max_tokens=8096):
         api_key = os.environ.get("OPENAI_API_KEY")
         api_base = os.environ.get("OPENAI_API_BASE")
 
-    client = OpenAI(
-        api_key=api_key,
-        base_url=api_base,
-    )
+    return _get_embedding_client(api_key, api_base)
+
+def embedding_text(text, model=None, max_tokens=8096):
+    if model is None:
+        model = get_embedding_model()
+    client = get_embedding_client()
 
-    tokenizer = tiktoken.encoding_for_model(model)
+    tokenizer = get_encoding(model)
     tokens = tokenizer.encode(text)
 
     if len(tokens) > max_tokens:
         text = tokenizer.decode(tokens[:max_tokens])
 
-    res = client.embeddings.create(input=text, model=model)
+    res = get_dependency("embedding").call(client.embeddings.create, input=text, model=model)
     return res.data[0].embedding
 
 def compute_schema_linking(question_tokens, header_tokens):
@@ -114,8 +144,13 @@ def compute_schema_linking(question_tokens, header_tokens):
         n -= 1
     return {"q_col_match": q_col_match}
 
-def compute_cell_value_linking(tokens, header_tokens, rows):
-    headers = [" ".join(col_tokens) for col_tokens in header_tokens]
+def compute_cell_value_linking(tokens, header_tokens, rows, index=None):
+    """
+    Link question tokens to cell values. Lookups go through a ColumnValueIndex
+    built once per table, so the cost per token does not grow with the row count.
+    """
+    if index is None:
+        index = get_column_index(len(header_tokens), rows)
 
     def isnumber(word):
         try:
@@ -124,40 +159,11 @@ def compute_cell_value_linking(tokens, header_tokens, rows):
         except:
             return False
 
-    def cell_value_partial_match(word, value):
-        if not isinstance(value, str):
-            value = str(value)
-        word = str(word).lower()
-        value = value.lower()
-        return (f" {word} " in f" {value} " or 
-                value.startswith(f"{word} ") or 
-                value.endswith(f" {word}") or 
-                value == word)
-
-    def cell_value_exact_match(phrase, value):
-        if not isinstance(value, str):
-            value = str(value)
-        phrase = str(phrase).lower()
-        value = value.lower()
-        return phrase == value
-
     num_date_match = {}
     cell_match = {}
-    column_values = {}
-    
-    for col_id in range(len(headers)):
-        column_values[col_id] = []
-        for row in rows:
-            if col_id < len(row):
-                val = row[col_id]
-                column_values[col_id].append(str(val).lower() if val is not None else "")
-
-    column_types = {}
-    for col_id in column_values:
-        is_num = all(v == "" or isnumber(v) for v in column_values[col_id])
-        column_types[col_id] = "number" if is_num else "text"
+    column_types = index.column_types
 
-    for col_id in range(len(headers)):
+    for col_id in range(len(header_tokens)):
         match_q_ids = []
         for q_id, word in enumerate(tokens):
             if not word.strip() or word.lower() in STOPWORDS or word in PUNKS:
@@ -165,17 +171,15 @@ def compute_cell_value_linking(tokens, header_tokens, rows):
             if isnumber(word) and column_types[col_id] == "number":
                 num_date_match[f"{q_id},{col_id}"] = "NUMBER"
                 continue
-            for value in column_values[col_id]:
-                if value and cell_value_partial_match(word, value):
-                    match_q_ids.append(q_id)
-                    break
+            if index.partial_match(word, col_id):
+                match_q_ids.append(q_id)
         f = 0
         while f < len(match_q_ids):
             t = f + 1
             while t < len(match_q_ids) and match_q_ids[t] == match_q_ids[t-1] + 1:
                 t += 1
             phrase = ' '.join(tokens[match_q_ids[f]:match_q_ids[t-1]+1])
-            exact_match_found = any(v and cell_value_exact_match(phrase, v) for v in column_values[col_id])
+            exact_match_found = index.exact_match(phrase, col_id)
             for q_id in range(match_q_ids[f], match_q_ids[t-1]+1):
                 cell_match[f"{q_id},{col_id}"] = CELL_EXACT_MATCH_FLAG if exact_match_found else CELL_PARTIAL_MATCH_FLAG
             f = t
@@ -282,5 +286,10 @@ def deal_question_skeleton(question: str, table: dict) -> Tuple[List[float], str
     masked_question = mask_question_with_schema_linking(question, header, rows)
     finally_skeleton = extract_question_skeleton(masked_question)
     print("finally_skeleton:", finally_skeleton)
-    embedding = embedding_text(finally_skeleton)
+    try:
+        embedding = embedding_text(finally_skeleton)
+    except Exception as e:
+        # Embedding service down or circuit open: match_byTableStructure ranks by the BM25 order instead
+        print(f"Skeleton embedding unavailable, falling back to lexical matching: {e}")
+        embedding = []
     return embedding, finally_skeleton
\ No newline at end of file
@@ -0,0 +1,321 @@
+"""
+Resilient client layer for auxiliary services
+
+Every outbound dependency (column type structure service, embedding API,
+MCP servers) is wrapped in a Dependency that owns:
+  - a keep-alive httpx connection pool (sync and async faces)
+  - a per-dependency timeout and retry policy, capped by a retry budget
+  - a circuit breaker; while it is open calls fail fast with CircuitOpenError
+    so callers can switch to their local fallback path. HTTP 4xx responses
+    (other than 408 / 429) are the caller's fault and do not count as failures;
+    a cancelled call counts as nothing but frees the half-open trial
+  - a latency histogram exposed through get_dependency_stats()
+
+Policies are configured through environment variables prefixed with the
+upper-cased dependency name, e.g. STRUCTURE_SERVICE_TIMEOUT=3.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLICIES: Dict[str, Dict[str, float]] = {
+    "structure_service": {"timeout": 5.0, "retries": 1, "failure_threshold": 5, "reset_timeout": 30.0},
+    "embedding": {"timeout": 15.0, "retries": 2, "failure_threshold": 5, "reset_timeout": 30.0},
+    # Chart / document tools can take minutes; 300 s matches the MCP SSE read timeout
+    "mcp": {"timeout": 300.0, "retries": 0, "failure_threshold": 3, "reset_timeout": 60.0},
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float("inf"))
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a dependency whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Closed -> open after N consecutive failures -> half-open trial after reset_timeout."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                # Let exactly one trial request probe the dependency
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """The trial ended without an answer (e.g. it was cancelled); let the next call probe again."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+def _is_caller_error(error: BaseException) -> bool:
+    """HTTP 4xx other than 408 / 429: the dependency answered, the request itself was bad."""
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return isinstance(status, int) and 400 <= status < 500 and status not in (408, 429)
+
+
+class RetryBudget:
+    """Allow retries only while they stay below `ratio` of recent requests (plus a small floor)."""
+
+    def __init__(self, ratio: float = 0.2, min_retries: int = 3, window: float = 10.0):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self._requests = deque()
+        self._retries = deque()
+        self._lock = threading.Lock()
+
+    def _trim(self, now: float):
+        for q in (self._requests, self._retries):
+            while q and now - q[0] > self.window:
+                q.popleft()
+
+    def record_request(self):
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            self._requests.append(now)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            if len(self._retries) < self.min_retries + self.ratio * len(self._requests):
+                self._retries.append(now)
+                return True
+            return False
+
+
+class LatencyHistogram:
+    """Cumulative latency histogram with fixed buckets (seconds)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.errors = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, ok: bool = True):
+        with self._lock:
+            for i, upper in enumerate(self.buckets):
+                if seconds <= upper:
+                    self.counts[i] += 1
+                    break
+            self.total += 1
+            self.sum += seconds
+            if not ok:
+                self.errors += 1
+
+    def _quantile(self, q: float) -> Optional[float]:
+        if not self.total:
+            return None
+        target = q * self.total
+        seen = 0
+        for upper, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return upper
+        return self.buckets[-1]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "count": self.total,
+                "errors": self.errors,
+                "avg_ms": round(self.sum / self.total * 1000, 2) if self.total else None,
+                "p50_le_s": self._quantile(0.5),
+                "p95_le_s": self._quantile(0.95),
+                "p99_le_s": self._quantile(0.99),
+                "buckets": {("inf" if b == float("inf") else str(b)): c for b, c in zip(self.buckets, self.counts)},
+            }
+
+
+class Dependency:
+    """A named outbound dependency with its own pool, deadline, retries and breaker."""
+
+    def __init__(self, name: str, timeout: float, retries: int, failure_threshold: int,
+                 reset_timeout: float, max_connections: int = 20):
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.max_connections = max_connections
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.retry_budget = RetryBudget()
+        self.histogram = LatencyHistogram()
+        self._client: Optional[httpx.Client] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._lock = threading.Lock()
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+
+    @property
+    def client(self) -> httpx.Client:
+        """Shared keep-alive pool for synchronous callers."""
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(timeout=self.timeout, limits=self._limits())
+            return self._client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        """Shared keep-alive pool for async callers."""
+        with self._lock:
+            if self._async_client is None:
+                self._async_client = httpx.AsyncClient(timeout=self.timeout, limits=self._limits())
+            return self._async_client
+
+    def _check_breaker(self):
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(f"{self.name} circuit is open, using fallback")
+
+    def _backoff(self, attempt: int) -> float:
+        return min(0.1 * (2 ** attempt), 2.0)
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a blocking call through the breaker, retry budget and histogram."""
+        self._check_breaker()
+        self.retry_budget.record_request()
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                self.histogram.observe(time.perf_counter() - start, ok=False)
+                if _is_caller_error(e):
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt >= self.retries or not self.retry_budget.try_spend() or not self.breaker.allow_request():
+                    raise
+                logger.warning(f"[{self.name}] attempt {attempt + 1} failed: {e}; retrying")
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                self.breaker.release_trial()
+                raise
+            self.histogram.observe(time.perf_counter() - start)
+            self.breaker.record_success()
+            return result
+
+    async def acall(self, fn: Callable[..., Any], *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        Async counterpart of call(); the deadline is enforced with asyncio.wait_for.
+
+        Args:
+            timeout: Per-call deadline in seconds instead of the dependency's own timeout.
+        """
+        timeout = timeout or self.timeout
+        self._check_breaker()
+        self.retry_budget.record_request()
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(fn(*args, **kwargs), timeout)
+            except Exception as e:
+                self.histogram.observe(time.perf_counter() - start, ok=False)
+                if _is_caller_error(e):
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt >= self.retries or not self.retry_budget.try_spend() or not self.breaker.allow_request():
+                    raise
+                logger.warning(f"[{self.name}] attempt {attempt + 1} failed: {e}; retrying")
+                await asyncio.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                # Cancelled (client disconnect, outer wait_for): not the dependency's fault
+                self.breaker.release_trial()
+                raise
+            self.histogram.observe(time.perf_counter() - start)
+            self.breaker.record_success()
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "timeout": self.timeout,
+            "retries": self.retries,
+            "latency": self.histogram.snapshot(),
+        }
+
+
+_dependencies: Dict[str, Dependency] = {}
+_registry_lock = threading.Lock()
+
+
+def _policy_value(name: str, key: str, default: float) -> float:
+    env_key = f"{name.split(':')[0].upper()}_{key.upper()}"
+    return float(os.getenv(env_key, default))
+
+
+def get_dependency(name: str) -> Dependency:
+    """
+    Return the process-wide Dependency for `name`.
+    Names such as 'mcp:product-mcp' share the policy of their prefix but get their own breaker.
+    """
+    with _registry_lock:
+        dependency = _dependencies.get(name)
+        if dependency is None:
+            policy = DEFAULT_POLICIES.get(name.split(":")[0], DEFAULT_POLICIES["structure_service"])
+            dependency = Dependency(
+                name,
+                timeout=_policy_value(name, "timeout", policy["timeout"]),
+                retries=int(_policy_value(name, "retries", policy["retries"])),
+                failure_threshold=int(_policy_value(name, "failure_threshold", policy["failure_threshold"])),
+                reset_timeout=_policy_value(name, "reset_timeout", policy["reset_timeout"]),
+            )
+            _dependencies[name] = dependency
+        return dependency
+
+
+def get_dependency_stats() -> Dict[str, Any]:
+    with _registry_lock:
+        items = list(_dependencies.items())
+    return {name: dependency.stats() for name, dependency in items}
@@ -0,0 +1,206 @@
+"""
+Table profiling and row sampling for very large user tables
+
+A ColumnValueIndex is built in a single pass over every cell and answers the
+value lookups of schema linking (partial/exact cell matches, numeric column
+types) without rescanning the rows for each question token. Prompts and
+structure inference use a bounded sample of the rows instead of the whole
+table, so their cost stays roughly flat as the row count grows.
+
+Sampling is off by default: aggregate questions (counts, sums, extremes) need
+every row. When it is enabled, table2format states the total row count above
+the sampled table so the model knows it cannot aggregate exactly.
+
+Configuration:
+  TABLE_SAMPLE_MAX_ROWS  rows kept in prompts (default 0: sampling disabled)
+  TABLE_SAMPLE_MODE      question | stratified | head_tail
+"""
+import os
+import string
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+TABLE_SAMPLE_MAX_ROWS = int(os.getenv("TABLE_SAMPLE_MAX_ROWS", "0"))
+TABLE_SAMPLE_MODE = os.getenv("TABLE_SAMPLE_MODE", "question")
+SAMPLE_MODES = ("question", "stratified", "head_tail")
+
+# Number of recently indexed tables kept in memory
+INDEX_CACHE_SIZE = 8
+
+_PUNKS = set(string.punctuation) - {"_"}
+
+
+def _isnumber(word) -> bool:
+    try:
+        float(word)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+class ColumnValueIndex:
+    """
+    Inverted index over the lower-cased cell values of a table.
+
+    partial_match(word, col) is equivalent to the word appearing as a
+    space-delimited token of some non-empty value in the column, which is
+    what compute_cell_value_linking checks with its substring tests.
+    """
+
+    def __init__(self, column_count: int, rows: List[List[Any]]):
+        self.column_count = column_count
+        self.row_count = len(rows)
+        # Lower-cased cell text per column; rows too short for a column get None
+        self._columns = []
+        self._values = []
+        self._tokens = []
+        self._token_values: Dict[tuple, set] = {}
+        self.column_types = {}
+
+        for col_id in range(column_count):
+            column = [
+                (str(row[col_id]).lower() if row[col_id] is not None else "") if col_id < len(row) else None
+                for row in rows
+            ]
+            values = set(column)
+            values.discard(None)
+            values.discard("")
+            tokens = set()
+            for value in values:
+                tokens.update(value.split(" "))
+            self._columns.append(column)
+            self._values.append(values)
+            self._tokens.append(tokens)
+            # Distinct values decide the type, so the check does not scale with row count
+            self.column_types[col_id] = "number" if all(_isnumber(v) for v in values) else "text"
+
+    def partial_match(self, word, col_id: int) -> bool:
+        word = str(word).lower()
+        if " " in word:
+            # Multi-word tokens only arrive from pre-tokenized questions; check them directly
+            return any(f" {word} " in f" {value} " for value in self._values[col_id])
+        return word in self._tokens[col_id]
+
+    def exact_match(self, phrase, col_id: int) -> bool:
+        return str(phrase).lower() in self._values[col_id]
+
+    def _values_with_token(self, col_id: int, word: str) -> set:
+        """Distinct values of a column containing `word` as a token (memoized)."""
+        key = (col_id, word)
+        if key not in self._token_values:
+            # Substring test first: it runs in C and rejects most values before splitting
+            self._token_values[key] = {
+                v for v in self._values[col_id] if word in v and word in v.split(" ")
+            }
+        return self._token_values[key]
+
+    def rows_matching(self, tokens: List[str], limit: int) -> List[int]:
+        """Row ids whose cells contain the question tokens, rarest tokens first."""
+        words = set(t.lower() for t in tokens if t and t.strip()) - _PUNKS
+        candidates = []
+        for col_id in range(self.column_count):
+            for word in words & self._tokens[col_id]:
+                candidates.append((len(self._values_with_token(col_id, word)), col_id, word))
+
+        selected: List[int] = []
+        seen = set()
+        for _, col_id, word in sorted(candidates):
+            matched = self._values_with_token(col_id, word)
+            for row_id, value in enumerate(self._columns[col_id]):
+                if value in matched and row_id not in seen:
+                    seen.add(row_id)
+                    selected.append(row_id)
+                    if len(selected) >= limit:
+                        return selected
+        return selected
+
+
+_index_cache: "OrderedDict[int, tuple]" = OrderedDict()
+_index_lock = threading.Lock()
+
+
+def get_column_index(column_count: int, rows: List[List[Any]]) -> ColumnValueIndex:
+    """
+    Return the index for `rows`, reusing it while the same rows object is alive.
+    The cache holds a reference to the rows so their id cannot be recycled.
+    """
+    key = id(rows)
+    with _index_lock:
+        entry = _index_cache.get(key)
+        if entry is not None and entry[0] is rows and entry[1].row_count == len(rows) \
+                and entry[1].column_count == column_count:
+            _index_cache.move_to_end(key)
+            return entry[1]
+    index = ColumnValueIndex(column_count, rows)
+    with _index_lock:
+        _index_cache[key] = (rows, index)
+        _index_cache.move_to_end(key)
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
+
+
+def _stratified(row_count: int, k: int, exclude=()) -> List[int]:
+    """First row of each of k equal-width positional strata."""
+    if k <= 0:
+        return []
+    exclude = set(exclude)
+    step = row_count / k
+    picked = []
+    for i in range(k):
+        row_id = int(i * step)
+        # Slide forward within the stratum if the row is already selected
+        end = min(int((i + 1) * step), row_count)
+        while row_id < end - 1 and row_id in exclude:
+            row_id += 1
+        if row_id not in exclude:
+            picked.append(row_id)
+            exclude.add(row_id)
+    return picked
+
+
+def _head_tail(row_count: int, k: int) -> List[int]:
+    head = (k + 1) // 2
+    return list(range(head)) + list(range(row_count - (k - head), row_count))
+
+
+def sample_row_ids(table: Dict[str, Any], max_rows: int = TABLE_SAMPLE_MAX_ROWS,
+                   mode: str = TABLE_SAMPLE_MODE, question: Optional[str] = None) -> List[int]:
+    """Pick at most max_rows row ids (in table order); every row when the table is small enough."""
+    rows = table.get("rows", [])
+    if max_rows <= 0 or len(rows) <= max_rows:
+        return list(range(len(rows)))
+    if mode not in SAMPLE_MODES:
+        mode = "question"
+
+    if mode == "head_tail":
+        return _head_tail(len(rows), max_rows)
+
+    picked = []
+    if mode == "question" and question:
+        from utils.question_skeleton_extract import STOPWORDS, preprocess_question_tokens
+        tokens = [t for t in preprocess_question_tokens(question) if t.lower() not in STOPWORDS]
+        index = get_column_index(len(table.get("header", [])), rows)
+        # Keep room for context rows around the matches
+        picked = index.rows_matching(tokens, limit=max_rows // 2)
+    picked += _stratified(len(rows), max_rows - len(picked), exclude=picked)
+    return sorted(picked)
+
+
+def sample_table(table: Dict[str, Any], max_rows: int = TABLE_SAMPLE_MAX_ROWS,
+                 mode: str = TABLE_SAMPLE_MODE, question: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Bounded copy of the table for prompts. When rows are dropped a placeholder
+    row tells the model how much of the table it is looking at, and the copy
+    carries the original row count as "total_rows".
+    """
+    if not isinstance(table, dict):
+        return table
+    rows = table.get("rows", [])
+    row_ids = sample_row_ids(table, max_rows, mode, question)
+    if len(row_ids) == len(rows):
+        return table
+    header = table.get("header", [])
+    placeholder = [f"... (showing {len(row_ids)} of {len(rows)} rows, sampled by {mode})"] + ["..."] * (len(header) - 1)
+    return {"header": header, "rows": [rows[i] for i in row_ids] + [placeholder], "total_rows": len(rows)}
@@ -1,4 +1,117 @@
-import requests
+import os
+import re
+import logging
+import threading
+from collections import OrderedDict
+
+from utils.resilient_client import get_dependency
+
+logger = logging.getLogger(__name__)
+
+# In-memory LRU capacity of the header -> column type cache
+COLUMN_TYPE_CACHE_SIZE = int(os.getenv("COLUMN_TYPE_CACHE_SIZE", "50000"))
+# Set to "0" to disable the MongoDB-backed persistent layer
+COLUMN_TYPE_CACHE_PERSIST = os.getenv("COLUMN_TYPE_CACHE_PERSIST", "1") != "0"
+# Same variable as the inference service; when unset the version is asked from the service
+COLUMN_TYPE_MODEL_VERSION = os.getenv("COLUMN_TYPE_MODEL_VERSION") or None
+
+
+class ColumnTypeCache:
+    """
+    Two-level cache of column type predictions keyed by the exact
+    'header("first value")' string sent to the inference service.
+
+    Level 1 is an in-process LRU, level 2 is a MongoDB collection that
+    survives restarts. Entries are scoped to the model version reported by
+    the inference service, so swapping the model invalidates both levels.
+    Rows of other versions are left to the collection's TTL index: workers
+    on different weights share the collection without deleting each other's rows.
+    """
+
+    def __init__(self, max_size=COLUMN_TYPE_CACHE_SIZE, persistent=COLUMN_TYPE_CACHE_PERSIST, model_version=None):
+        self.max_size = max_size
+        self.persistent = persistent
+        self.model_version = model_version
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "persistent_hits": 0, "misses": 0}
+
+    def _db(self):
+        from db.db_manager import DatabaseManager
+        return DatabaseManager()
+
+    def set_model_version(self, model_version):
+        """Switch to a new model version, dropping the in-memory entries of the old one."""
+        if not model_version or model_version == self.model_version:
+            return
+        with self._lock:
+            previous = self.model_version
+            self.model_version = model_version
+            self._memory.clear()
+        if previous is not None:
+            logger.info(f"Column type model changed {previous} -> {model_version}, cache invalidated")
+
+    def get_many(self, keys):
+        """Return {key: column_type} for every key found in the cache."""
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+            self._stats["memory_hits"] += len(found)
+
+        missing = [k for k in keys if k not in found]
+        if missing and self.persistent and self.model_version:
+            try:
+                stored = self._db().batch_get_column_types(missing, self.model_version)
+            except Exception as e:
+                logger.warning(f"Column type cache lookup failed: {e}")
+                stored = {}
+            if stored:
+                self._remember(stored)
+                found.update(stored)
+                with self._lock:
+                    self._stats["persistent_hits"] += len(stored)
+
+        with self._lock:
+            self._stats["misses"] += len(keys) - len(found)
+        return found
+
+    def put_many(self, column_types):
+        if not column_types:
+            return
+        self._remember(column_types)
+        if self.persistent and self.model_version:
+            try:
+                self._db().save_column_types(column_types, self.model_version)
+            except Exception as e:
+                logger.warning(f"Column type cache write failed: {e}")
+
+    def _remember(self, column_types):
+        with self._lock:
+            for key, column_type in column_types.items():
+                self._memory[key] = column_type
+                self._memory.move_to_end(key)
+            while len(self._memory) > self.max_size:
+                self._memory.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["persistent_hits"] + stats["misses"]
+        stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 4) if lookups else 0.0
+        stats["model_version"] = self.model_version
+        return stats
+
+
+column_type_cache = ColumnTypeCache(model_version=COLUMN_TYPE_MODEL_VERSION)
+
+
+def get_column_type_cache_stats():
+    return column_type_cache.stats()
+
 
 def format_table_for_api(table):
     header = table.get("header", [])
@@ -9,8 +122,79 @@ def format_table_for_api(table):
     result = [f'{h}("{str(d)}")' for h, d in zip(header, first_row)]
     return result
 
+_BOOLEAN_VALUES = {"true", "false", "yes", "no", "y", "n"}
+_DATE_PATTERN = re.compile(
+    r"^(\d{4}([-/.]\d{1,2}([-/.]\d{1,2})?)?|\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4}|\d{1,2}(:\d{2}){1,2}(\.\d+)?"
+    r"|(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.? \d{1,2},? \d{4}|\d{1,2} (jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]* \d{4})$"
+)
+
+
+def infer_column_type_locally(value):
+    """
+    Heuristic fallback used while the inference service is unavailable.
+    Returns one of the labels the service predicts: string/int/float/date/boolean.
+    """
+    text = str(value).strip().lower()
+    if text in _BOOLEAN_VALUES:
+        return "boolean"
+    if _DATE_PATTERN.match(text):
+        return "date"
+    number = text.replace(",", "")
+    if re.fullmatch(r"[-+]?\d+", number):
+        return "int"
+    if re.fullmatch(r"[-+]?(\d+\.\d*|\.\d+)(e[-+]?\d+)?%?", number):
+        return "float"
+    return "string"
+
+
+def _local_table_structure(table):
+    rows = table.get("rows", [])
+    first_row = rows[0] if rows else []
+    return [infer_column_type_locally(v) for _, v in zip(table.get("header", []), first_row)]
+
+
+def _resolve_model_version(api_url):
+    """Ask the inference service for its model version once per process."""
+    if column_type_cache.model_version:
+        return
+    dependency = get_dependency("structure_service")
+    try:
+        version_url = api_url.rsplit("/", 1)[0] + "/model_version"
+        response = dependency.call(dependency.client.get, version_url)
+        response.raise_for_status()
+        column_type_cache.set_model_version(response.json().get("model_version"))
+    except Exception as e:
+        logger.warning(f"Could not resolve column type model version: {e}")
+
+def _post_headers(api_url, headers):
+    dependency = get_dependency("structure_service")
+
+    def post():
+        response = dependency.client.post(api_url, json={"table_header": headers})
+        response.raise_for_status()
+        return response.json()
+
+    return dependency.call(post)
+
 def get_table_structure_from_api(table, api_url="http://127.0.0.1:8080/infer_table_structure"):
-    payload = {"table_header": format_table_for_api(table)}
-    response = requests.post(api_url, json=payload)
-    response.raise_for_status()
-    return response.json().get("table_structure", [])
\ No newline at end of file
+    table_header = format_table_for_api(table)
+    if not table_header:
+        return []
+
+    _resolve_model_version(api_url)
+    known = column_type_cache.get_many(table_header)
+    # Only headers never seen before under this model version reach the service
+    missing = [h for h in dict.fromkeys(table_header) if h not in known]
+    if missing:
+        try:
+            data = _post_headers(api_url, missing)
+        except Exception as e:
+            # Service down or circuit open: answer from the local heuristic, and do not cache it
+            logger.warning(f"Column type service unavailable, using local inference: {e}")
+            return _local_table_structure(table)
+        column_type_cache.set_model_version(data.get("model_version"))
+        predicted = dict(zip(missing, data.get("table_structure", [])))
+        column_type_cache.put_many(predicted)
+        known.update(predicted)
+
+    return [known[h] for h in table_header if h in known]
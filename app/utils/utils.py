@@ -16,6 +16,8 @@ from openai_api.openai_client import OpenAIClient
 
 from utils.table_structure_extract import get_table_structure_from_api
 from utils.question_skeleton_extract import deal_question_skeleton
+from utils.table_sampling import sample_table
+from utils.deadline import submit_with_context
 
 def normalize_answer(answer: Any) -> str:
     """
@@ -174,9 +176,12 @@ class TableUtils:
         return correct_count / total if total > 0 else 0.0
 
     @staticmethod
-    def table2format(table):
+    def table2format(table, question=None):
         """
-        Convert table data to Markdown format
+        Convert table data to Markdown format.
+        When TABLE_SAMPLE_MAX_ROWS is set, longer tables are reduced to a bounded row sample
+        (rows matching the question tokens are preferred when a question is given) and a
+        note above the table gives the total row count.
         
         Returns:
             str: Formatted Markdown table
@@ -188,12 +193,20 @@ class TableUtils:
         if not isinstance(table, dict) or 'header' not in table or 'rows' not in table:
             return f"Error: Invalid table format (expected dict with header/rows, got {type(table).__name__})"
 
+        table = sample_table(table, question=question)
         header = ' | '.join(str(h) for h in table['header'])
         separator = ' | '.join(['---'] * len(table['header']))
 
         rows = [' | '.join(str(cell) for cell in row) for row in table['rows']]
 
-        formatted_table = '\n'.join([header, separator] + rows)
+        lines = [header, separator] + rows
+        if 'total_rows' in table:
+            shown = len(table['rows']) - 1  # minus the placeholder row
+            lines.insert(0, (
+                f"Note: this table has {table['total_rows']} rows; only a sample of {shown} rows is shown below. "
+                f"Counts, sums, averages and extremes over the whole table cannot be computed exactly from it."
+            ))
+        formatted_table = '\n'.join(lines)
         return formatted_table
 
     @staticmethod
@@ -297,8 +310,9 @@ class TableUtils:
             return deal_question_skeleton(user_question, user_table)
 
         with concurrent.futures.ThreadPoolExecutor() as executor:
-            future_table_structure = executor.submit(run_get_table_structure_from_api)
-            future_question_skeleton = executor.submit(run_deal_question_skeleton)
+            # submit_with_context keeps the caller's request deadline in the worker threads
+            future_table_structure = submit_with_context(executor, run_get_table_structure_from_api)
+            future_question_skeleton = submit_with_context(executor, run_deal_question_skeleton)
 
             table_structure_result = future_table_structure.result()
             print("Table Structure generation completed")
@@ -0,0 +1,121 @@
+"""
+Startup warm-up
+
+Heavy resources (jieba dictionaries, tiktoken encodings, OpenAI clients,
+MongoDB connection, BM25 index) are loaded lazily on first use. The warm-up
+stage loads them in parallel worker threads right after the server starts, so
+the first user request does not pay for them. /ready reports 503 until the
+warm-up has finished; per-resource timings are kept for observability.
+
+Set WARMUP_ENABLED=0 to skip the stage (the service is then ready at once and
+resources load on demand as before).
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") != "0"
+
+
+def _warm_jieba():
+    from core_progress.bm25_searcher import get_jieba
+    get_jieba().initialize()
+    import jieba.posseg as pseg
+    list(pseg.cut("预热 warm up"))
+
+
+def _warm_tiktoken():
+    from utils.question_skeleton_extract import get_encoding, get_embedding_model
+    get_encoding(get_embedding_model())
+
+
+def _warm_openai_clients():
+    from openai_api.openai_client import OpenAIClient
+    from utils.question_skeleton_extract import get_embedding_client
+    OpenAIClient()
+    get_embedding_client()
+
+
+def _warm_database():
+    from db.db_manager import DatabaseManager
+    DatabaseManager().client.admin.command("ping")
+
+
+def _warm_bm25():
+    from core_progress.bm25_searcher import BM25Searcher
+    BM25Searcher()
+
+
+# Each chain runs in its own thread; steps inside a chain run in order
+# (the BM25 index needs the database connection first).
+WARMUP_CHAINS: List[List[Tuple[str, Callable[[], Any]]]] = [
+    [("jieba", _warm_jieba)],
+    [("tiktoken", _warm_tiktoken)],
+    [("openai_clients", _warm_openai_clients)],
+    [("database", _warm_database), ("bm25_index", _warm_bm25)],
+]
+
+
+class WarmupState:
+    def __init__(self):
+        self.status = "pending"
+        self.started_at = None
+        self.seconds = None
+        self.resources: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def ready(self) -> bool:
+        return self.status in ("ready", "degraded")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "status": self.status,
+            "seconds": self.seconds,
+            "resources": self.resources,
+        }
+
+
+warmup_state = WarmupState()
+
+
+def _run_chain(chain: List[Tuple[str, Callable[[], Any]]], state: WarmupState):
+    for name, loader in chain:
+        state.resources[name] = {"status": "loading"}
+        start = time.perf_counter()
+        try:
+            loader()
+            state.resources[name] = {"status": "ok", "seconds": round(time.perf_counter() - start, 3)}
+        except Exception as e:
+            # A failed resource falls back to lazy loading on first use
+            state.resources[name] = {
+                "status": "failed",
+                "seconds": round(time.perf_counter() - start, 3),
+                "error": str(e),
+            }
+            logger.warning(f"Warm-up of {name} failed: {e}")
+
+
+async def run_warmup(chains=None, state: WarmupState = warmup_state) -> WarmupState:
+    """Load all resources in parallel threads and record per-resource timings."""
+    chains = WARMUP_CHAINS if chains is None else chains
+    state.status = "running"
+    state.started_at = time.time()
+    start = time.perf_counter()
+    await asyncio.gather(*(asyncio.to_thread(_run_chain, chain, state) for chain in chains))
+    state.seconds = round(time.perf_counter() - start, 3)
+    failed = [name for name, info in state.resources.items() if info["status"] != "ok"]
+    state.status = "degraded" if failed else "ready"
+    logger.info(f"Warm-up finished in {state.seconds}s: {state.resources}")
+    return state
+
+
+def start_warmup() -> Optional[asyncio.Task]:
+    """Schedule the warm-up in the background; returns the task (None when disabled)."""
+    if not WARMUP_ENABLED:
+        warmup_state.status = "ready"
+        return None
+    return asyncio.create_task(run_warmup())
@@ -0,0 +1,79 @@
+"""
+列类型分类模型吞吐量基准测试
+
+对比逐列推理（旧实现）与批量推理在不同线程数下的吞吐量，
+并按 CPU 核数（torch 线程数）折算为每核吞吐量。
+
+运行方式（需在模型目录下执行，与 inference.py 相同）:
+  python benchmark.py --tables 200 --threads 1 2 4
+  COLUMN_TYPE_MODEL_VARIANT=int8 python benchmark.py --threads 1
+"""
+import argparse
+import random
+import time
+
+import torch
+
+from inference import MODEL_VARIANT, infer_table_structures, predict_column_types, predict_column_type, table_header
+
+SAMPLE_HEADERS = [
+    'Year("2001")', 'Name("James")', 'Country("UK")', 'Date("October 22, 1994")',
+    'Rank("3")', 'Avg. Score("98.3245")', 'Promotion("False")', 'Team("Brazil")',
+    'Points("7,169")', 'Time("5:02:84")', 'League("USL A-League")', 'Notes("Did not qualify")',
+]
+
+
+def build_tables(table_count: int, seed: int = 42) -> list[list[str]]:
+    rng = random.Random(seed)
+    pool = SAMPLE_HEADERS + table_header
+    return [rng.sample(pool, rng.randint(3, 10)) for _ in range(table_count)]
+
+
+def run_once(fn, tables) -> float:
+    start = time.perf_counter()
+    fn(tables)
+    return time.perf_counter() - start
+
+
+def per_header(tables):
+    for header in tables:
+        for h in header:
+            predict_column_type(h)
+
+
+def per_table(tables):
+    for header in tables:
+        predict_column_types(header)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Column type classifier throughput benchmark")
+    parser.add_argument("--tables", type=int, default=200, help="number of synthetic tables")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, torch.get_num_threads()],
+                        help="torch intra-op thread counts to test")
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions per mode (best is reported)")
+    args = parser.parse_args()
+
+    tables = build_tables(args.tables)
+    header_count = sum(len(t) for t in tables)
+    modes = [
+        ("per_header", per_header),
+        ("per_table_batch", per_table),
+        ("multi_table_batch", infer_table_structures),
+    ]
+
+    # 预热，避免首次调用的初始化开销影响结果
+    infer_table_structures(tables[:4])
+
+    print(f"variant={MODEL_VARIANT} tables={len(tables)} headers={header_count}")
+    print(f"{'mode':<20}{'threads':>8}{'seconds':>10}{'headers/s':>12}{'headers/s/core':>16}")
+    for threads in args.threads:
+        torch.set_num_threads(threads)
+        for name, fn in modes:
+            elapsed = min(run_once(fn, tables) for _ in range(args.repeat))
+            throughput = header_count / elapsed
+            print(f"{name:<20}{threads:>8}{elapsed:>10.3f}{throughput:>12.1f}{throughput / threads:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
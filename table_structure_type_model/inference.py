@@ -1,3 +1,8 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
 import torch
 from transformers import BertTokenizer, BertForSequenceClassification
 import pickle
@@ -6,31 +11,130 @@ from fastapi import FastAPI
 from pydantic import BaseModel
 import uvicorn
 
+from quantize import MODEL_DIR, load_quantized_model, model_fingerprint
+
 # 设置设备为 CPU
 device = torch.device("cpu")
 
+# 模型版本: fp32（默认）或 int8 动态量化
+MODEL_VARIANT = os.getenv("COLUMN_TYPE_MODEL_VARIANT", "fp32")
+# torch 算子内线程数，0 表示使用 torch 默认值
+NUM_THREADS = int(os.getenv("COLUMN_TYPE_NUM_THREADS", "0"))
+if NUM_THREADS > 0:
+    torch.set_num_threads(NUM_THREADS)
+# 模型版本标识，客户端据此使列类型缓存失效；默认由权重文件内容的哈希生成，重新训练后自动变化
+MODEL_VERSION = os.getenv("COLUMN_TYPE_MODEL_VERSION") or model_fingerprint(MODEL_DIR, MODEL_VARIANT)
+
+# 表头字符串很短，统一截断到 16 个 token
+MAX_LENGTH = 16
+# 单次前向传播最多处理的列名数量
+BATCH_MAX_SIZE = int(os.getenv("COLUMN_TYPE_BATCH_MAX_SIZE", "64"))
+# 服务端合并并发请求时的最长等待时间（毫秒）
+BATCH_MAX_WAIT_MS = float(os.getenv("COLUMN_TYPE_BATCH_MAX_WAIT_MS", "5"))
+
 # 加载 BERT 模型和 Tokenizer
-model = BertForSequenceClassification.from_pretrained("bert-column-type-classifier-augment")
-tokenizer = BertTokenizer.from_pretrained("bert-column-type-classifier-augment")
+if MODEL_VARIANT == "int8":
+    model = load_quantized_model(MODEL_DIR)
+else:
+    model = BertForSequenceClassification.from_pretrained(MODEL_DIR)
+tokenizer = BertTokenizer.from_pretrained(MODEL_DIR)
 model.eval()
 
 # 加载标签编码器
-with open("./bert-column-type-classifier-augment/label_encoder.pkl", "rb") as f:
+with open(os.path.join(MODEL_DIR, "label_encoder.pkl"), "rb") as f:
     label_encoder = pickle.load(f)
 
+# 批量推理函数（多个列名一次前向传播）
+def predict_column_types(headers: list[str]) -> list[str]:
+    results = []
+    for start in range(0, len(headers), BATCH_MAX_SIZE):
+        chunk = headers[start:start + BATCH_MAX_SIZE]
+        inputs = tokenizer(chunk, return_tensors="pt", truncation=True, padding=True, max_length=MAX_LENGTH)
+        inputs = {k: v.to(device) for k, v in inputs.items()}
+        with torch.inference_mode():
+            outputs = model(**inputs)
+        pred_ids = torch.argmax(outputs.logits, dim=1).tolist()
+        results.extend(str(r) for r in label_encoder.inverse_transform(pred_ids))  # 确保返回Python字符串
+    return results
+
 # 推理函数（单列名）
 def predict_column_type(header: str) -> str:
-    inputs = tokenizer(header, return_tensors="pt", truncation=True, padding=True, max_length=16)
-    inputs = {k: v.to(device) for k, v in inputs.items()}
-    with torch.no_grad():
-        outputs = model(**inputs)
-        pred_id = torch.argmax(outputs.logits, dim=1).item()
-        result = label_encoder.inverse_transform([pred_id])[0]
-        return str(result)  # 确保返回Python字符串
+    return predict_column_types([header])[0]
 
 # 表结构推理函数（多列名）
 def infer_table_structure(table_header: list[str]) -> list[str]:
-    return [predict_column_type(h) for h in table_header]
+    return predict_column_types(table_header)
+
+# 多表推理：所有表的列名拼成一个批次，再按表拆分结果
+def infer_table_structures(table_headers: list[list[str]]) -> list[list[str]]:
+    flat_headers = [h for header in table_headers for h in header]
+    flat_results = predict_column_types(flat_headers) if flat_headers else []
+    results, offset = [], 0
+    for header in table_headers:
+        results.append(flat_results[offset:offset + len(header)])
+        offset += len(header)
+    return results
+
+
+class MicroBatcher:
+    """
+    动态批处理：把短时间窗口内的并发请求合并成一个批次，
+    在独立的推理线程中执行，避免阻塞事件循环
+    """
+    def __init__(self, max_batch_size: int = BATCH_MAX_SIZE, max_wait_ms: float = BATCH_MAX_WAIT_MS):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = None
+        self._task = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="column-type-infer")
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=False)
+
+    async def submit(self, table_header: list[str]) -> list[str]:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((table_header, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            header_count = len(batch[0][0])
+            deadline = loop.time() + self.max_wait
+            # 在等待窗口内继续收集请求，直到凑满一个批次
+            while header_count < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                header_count += len(item[0])
+
+            try:
+                results = await loop.run_in_executor(
+                    self._executor, infer_table_structures, [header for header, _ in batch]
+                )
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
 
 # 示例输入
 table_header = [
@@ -42,15 +146,36 @@ table_header = [
       ]
 
 # FastAPI 部分
-app = FastAPI()
+batcher = MicroBatcher()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await batcher.start()
+    yield
+    await batcher.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 class TableHeaderRequest(BaseModel):
     table_header: list[str]
 
+class TableHeaderBatchRequest(BaseModel):
+    tables: list[list[str]]
+
 @app.post("/infer_table_structure")
 async def infer_table_structure_api(request: TableHeaderRequest):
-    result = infer_table_structure(request.table_header)
-    return {"table_structure": result}
+    result = await batcher.submit(request.table_header)
+    return {"table_structure": result, "model_version": MODEL_VERSION}
+
+@app.post("/infer_table_structure_batch")
+async def infer_table_structure_batch_api(request: TableHeaderBatchRequest):
+    # 数据导入场景：一次提交多张表，由批处理器合并推理
+    results = await asyncio.gather(*(batcher.submit(header) for header in request.tables))
+    return {"table_structures": list(results), "model_version": MODEL_VERSION}
+
+@app.get("/model_version")
+async def model_version_api():
+    return {"model_version": MODEL_VERSION}
 
 def main():
     # 启动 FastAPI 服务，指定端口
@@ -58,4 +183,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,148 @@
+"""
+列类型分类模型 int8 动态量化
+
+把 fp32 BERT 中的 Linear 层转换为 torch CPU 动态量化 (qint8)，
+保存量化后的模型，并在留出的表头数据集上对比 fp32 与 int8 的准确率和延迟。
+
+留出集为 CSV 文件，包含两列: header,label
+  header 使用与服务端相同的格式，例如 Year("2001")
+  label  为列类型标签，例如 date
+
+运行方式（需在模型目录下执行）:
+  python quantize.py --eval-file heldout_headers.csv --threads 1
+"""
+import argparse
+import csv
+import hashlib
+import io
+import os
+import pickle
+import time
+
+import torch
+from transformers import BertTokenizer, BertForSequenceClassification
+
+MODEL_DIR = "bert-column-type-classifier-augment"
+QUANTIZED_MODEL_FILE = "model_int8.pt"
+MAX_LENGTH = 16
+
+
+def quantize_model(model):
+    """对 Linear 层做 int8 动态量化（仅 CPU）"""
+    model.eval()
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_quantized_model(model_dir: str = MODEL_DIR):
+    """加载已转换的 int8 模型；未转换时在线量化 fp32 模型"""
+    path = os.path.join(model_dir, QUANTIZED_MODEL_FILE)
+    if os.path.exists(path):
+        model = torch.load(path, map_location="cpu", weights_only=False)
+        model.eval()
+        return model
+    return quantize_model(BertForSequenceClassification.from_pretrained(model_dir))
+
+
+# fp32 权重文件，按 from_pretrained 的优先顺序
+FP32_WEIGHT_FILES = ("model.safetensors", "pytorch_model.bin")
+
+
+def _loaded_files(model_dir: str, variant: str) -> list[str]:
+    """该版本实际加载、决定预测结果的文件：权重、标签编码器、模型配置"""
+    weights = [name for name in FP32_WEIGHT_FILES if os.path.exists(os.path.join(model_dir, name))][:1]
+    if variant == "int8" and os.path.exists(os.path.join(model_dir, QUANTIZED_MODEL_FILE)):
+        weights = [QUANTIZED_MODEL_FILE]
+    return weights + ["label_encoder.pkl", "config.json"]
+
+
+def model_fingerprint(model_dir: str = MODEL_DIR, variant: str = "fp32") -> str:
+    """根据实际加载的权重等文件内容生成模型版本标识；重新训练写回同一目录后标识随之变化"""
+    digest = hashlib.sha1(variant.encode())
+    for name in _loaded_files(model_dir, variant):
+        path = os.path.join(model_dir, name)
+        if not os.path.exists(path):
+            continue
+        digest.update(name.encode())
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return f"{os.path.basename(os.path.normpath(model_dir))}:{variant}:{digest.hexdigest()[:12]}"
+
+
+def model_size_mb(model) -> float:
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.getbuffer().nbytes / (1024 * 1024)
+
+
+def predict(model, tokenizer, label_encoder, headers: list[str], batch_size: int = 64) -> list[str]:
+    results = []
+    for start in range(0, len(headers), batch_size):
+        chunk = headers[start:start + batch_size]
+        inputs = tokenizer(chunk, return_tensors="pt", truncation=True, padding=True, max_length=MAX_LENGTH)
+        with torch.inference_mode():
+            logits = model(**inputs).logits
+        results.extend(str(r) for r in label_encoder.inverse_transform(torch.argmax(logits, dim=1).tolist()))
+    return results
+
+
+def load_eval_set(path: str) -> tuple[list[str], list[str]]:
+    headers, labels = [], []
+    with open(path, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            headers.append(row["header"])
+            labels.append(row["label"])
+    return headers, labels
+
+
+def evaluate(name, model, tokenizer, label_encoder, headers, labels, table_size: int = 8):
+    # 按每表 table_size 列模拟单表请求，统计单表延迟
+    tables = [headers[i:i + table_size] for i in range(0, len(headers), table_size)]
+    predictions = []
+    start = time.perf_counter()
+    for table in tables:
+        predictions.extend(predict(model, tokenizer, label_encoder, table))
+    elapsed = time.perf_counter() - start
+
+    correct = sum(p == l for p, l in zip(predictions, labels))
+    print(f"[{name}] accuracy={correct / len(labels):.4f} "
+          f"latency/table={elapsed / len(tables) * 1000:.2f}ms "
+          f"size={model_size_mb(model):.1f}MB")
+    return predictions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the column type classifier to int8 and compare accuracy")
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--eval-file", help="held-out CSV with header,label columns")
+    parser.add_argument("--threads", type=int, default=0, help="torch intra-op threads (0 = torch default)")
+    args = parser.parse_args()
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+
+    tokenizer = BertTokenizer.from_pretrained(args.model_dir)
+    with open(os.path.join(args.model_dir, "label_encoder.pkl"), "rb") as f:
+        label_encoder = pickle.load(f)
+
+    fp32_model = BertForSequenceClassification.from_pretrained(args.model_dir)
+    fp32_model.eval()
+    int8_model = quantize_model(BertForSequenceClassification.from_pretrained(args.model_dir))
+
+    output_path = os.path.join(args.model_dir, QUANTIZED_MODEL_FILE)
+    torch.save(int8_model, output_path)
+    print(f"Quantized model saved to {output_path}")
+
+    if not args.eval_file:
+        return
+
+    headers, labels = load_eval_set(args.eval_file)
+    print(f"Held-out headers: {len(headers)}, threads: {torch.get_num_threads()}")
+    fp32_pred = evaluate("fp32", fp32_model, tokenizer, label_encoder, headers, labels)
+    int8_pred = evaluate("int8", int8_model, tokenizer, label_encoder, headers, labels)
+    agreement = sum(a == b for a, b in zip(fp32_pred, int8_pred)) / len(headers)
+    print(f"fp32/int8 prediction agreement={agreement:.4f}")
+
+
+if __name__ == "__main__":
+    main()